@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+# activity_bitmap.py - Per-minute activity bitmaps and the queries over them
+# Author: Sanja
+#
+# Usage:
+#   python activity_bitmap.py rollup --start 2025-04-01 --end 2025-04-30       (build/refresh bitmaps)
+#   python activity_bitmap.py rollup --start 2025-04-01 --user sanja
+#   python activity_bitmap.py report --start 2025-04-01 --end 2025-04-30 --users sanja alex
+#
+# Heart Beat Application - Activity Bitmaps
+# Pulses record transitions, so "was X active at 14:32?" or "active minutes this
+# week" otherwise means replaying every pulse. Here each user's day is one
+# 1440-bit bitmap, bit i set when the user was active during minute i (local time):
+#   - built from pulses by `rollup_bitmaps` (the day-end job and this script);
+#     every pulse's active_time is the active period ending at its timestamp,
+#     the same seconds the daily rollups sum, on any of the user's hosts
+#   - stored as 180 bytes per user and day ('activity_bitmaps'), little-endian,
+#     so minute 0 is the lowest bit of the first byte
+#   - queried with integer AND/OR and popcount: totals, "active at", overlap and
+#     coverage across users, pairwise overlaps for team reports
+# Periods still open when the rollup runs are picked up by the next rollup.
+# =============================================================================
+# Imports
+# =============================================================================
+import os
+import sys
+import math
+import argparse
+import logging
+from datetime import datetime, date, time, timedelta
+from itertools import combinations
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, script_dir)
+
+MINUTES_PER_DAY = 1440
+BITMAP_BYTES    = MINUTES_PER_DAY // 8
+
+
+def day_key(day):
+    """'YYYY-MM-DD' for a date, datetime or an already formatted key."""
+    return day if isinstance(day, str) else day.strftime("%Y-%m-%d")
+
+
+def to_bytes(bits):
+    return bits.to_bytes(BITMAP_BYTES, "little")
+
+
+def from_bytes(data):
+    return int.from_bytes(data, "little")
+
+
+def popcount(bits):
+    return bits.bit_count()
+
+
+def minute_of(moment):
+    return moment.hour * 60 + moment.minute
+
+
+def add_interval(days, start, end):
+    """
+    Sets the bits of every minute that overlaps [start, end) in `days`
+    ({'YYYY-MM-DD': int}), splitting the interval at midnight.
+    """
+    while start < end:
+        midnight = datetime.combine(start.date(), time.min)
+        stop = min(end, midnight + timedelta(days=1))
+        first = int((start - midnight).total_seconds() // 60)
+        last = min(math.ceil((stop - midnight).total_seconds() / 60), MINUTES_PER_DAY)
+        key = day_key(midnight)
+        days[key] = days.get(key, 0) | (((1 << (last - first)) - 1) << first)
+        start = stop
+
+
+# =============================================================================
+# ActivityBitmaps Class
+# =============================================================================
+class ActivityBitmaps:
+    """
+    Bitmaps for a set of users and days, {username: {'YYYY-MM-DD': int}}.
+    Date arguments accept dates, datetimes or 'YYYY-MM-DD'; both ends are inclusive.
+    """
+
+    def __init__(self, bitmaps=None):
+        self.bitmaps = bitmaps or {}
+
+    # -------------------------------------------------------------------------
+    # Building
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_pulses(cls, pulses):
+        """Replays pulses (username, timestamp, active_time) into bitmaps."""
+        bitmaps = {}
+        for pulse in pulses:
+            active = pulse.get("active_time") or 0
+            if active <= 0:
+                continue
+            end = pulse["timestamp"]
+            add_interval(bitmaps.setdefault(pulse["username"], {}), end - timedelta(seconds=active), end)
+        return cls(bitmaps)
+
+    @classmethod
+    def load(cls, db, usernames=None, start_date=None, end_date=None):
+        """Reads stored bitmaps through a storage backend's `load_bitmaps`."""
+        bitmaps = {}
+        for row in db.load_bitmaps(usernames, start_date, end_date):
+            bitmaps.setdefault(row["username"], {})[row["date"]] = from_bytes(row["bits"])
+        return cls(bitmaps)
+
+    def rows(self, start_date=None, end_date=None):
+        """The bitmaps as storage rows: username, date, bits (bytes), active_minutes."""
+        return [
+            {"username": username, "date": day, "bits": to_bytes(bits), "active_minutes": popcount(bits)}
+            for username, days in self.bitmaps.items()
+            for day, bits in days.items()
+            if self._in_range(day, start_date, end_date)
+        ]
+
+    # -------------------------------------------------------------------------
+    # Queries
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _in_range(day, start_date, end_date):
+        return (start_date is None or day >= day_key(start_date)) and (end_date is None or day <= day_key(end_date))
+
+    def users(self):
+        return sorted(self.bitmaps)
+
+    def days(self, username, start_date=None, end_date=None):
+        """{'YYYY-MM-DD': bits} of one user inside the range."""
+        return {
+            day: bits for day, bits in self.bitmaps.get(username, {}).items()
+            if self._in_range(day, start_date, end_date)
+        }
+
+    def is_active(self, username, moment):
+        """True if the user was active during the minute of `moment`."""
+        return bool(self.bitmaps.get(username, {}).get(day_key(moment), 0) >> minute_of(moment) & 1)
+
+    def active_minutes(self, username, start_date=None, end_date=None):
+        return sum(popcount(bits) for bits in self.days(username, start_date, end_date).values())
+
+    def _combine(self, usernames, start_date, end_date, operator):
+        per_user = [self.days(username, start_date, end_date) for username in usernames]
+        if not per_user:
+            return {}
+        keys = set().union(*per_user)
+        combined = {}
+        for day in keys:
+            values = [days.get(day, 0) for days in per_user]
+            result = values[0]
+            for value in values[1:]:
+                result = operator(result, value)
+            combined[day] = result
+        return combined
+
+    def overlap(self, usernames, start_date=None, end_date=None):
+        """Minutes in which every one of `usernames` was active."""
+        combined = self._combine(usernames, start_date, end_date, int.__and__)
+        return sum(popcount(bits) for bits in combined.values())
+
+    def coverage(self, usernames, start_date=None, end_date=None):
+        """Minutes in which at least one of `usernames` was active."""
+        combined = self._combine(usernames, start_date, end_date, int.__or__)
+        return sum(popcount(bits) for bits in combined.values())
+
+    def pairwise_overlap(self, usernames, start_date=None, end_date=None):
+        """{(user_a, user_b): minutes both were active} for every pair."""
+        return {
+            (first, second): self.overlap((first, second), start_date, end_date)
+            for first, second in combinations(usernames, 2)
+        }
+
+    def report(self, usernames=None, start_date=None, end_date=None):
+        """
+        Team report over a date range.
+        Returns:
+            dict: per-user active minutes and active days, team overlap and coverage,
+                  and the pairwise overlaps.
+        """
+        usernames = sorted(usernames or self.users())
+        return {
+            "users": {
+                username: {
+                    "active_minutes": self.active_minutes(username, start_date, end_date),
+                    "active_days": sum(1 for bits in self.days(username, start_date, end_date).values() if bits),
+                }
+                for username in usernames
+            },
+            "overlap_minutes": self.overlap(usernames, start_date, end_date),
+            "coverage_minutes": self.coverage(usernames, start_date, end_date),
+            "pairwise_overlap": self.pairwise_overlap(usernames, start_date, end_date),
+        }
+
+
+# =============================================================================
+# rollup_bitmaps
+# =============================================================================
+def rollup_bitmaps(db, start_day, end_day=None, username=None):
+    """
+    Rebuilds the stored bitmaps of whole days [start_day, end_day] from raw pulses.
+    Pulses up to a day after the range are read too, since an active period that
+    ends after midnight is recorded on the following day's pulse.
+    Returns:
+        int: Bitmaps written.
+    """
+    end_day = end_day or start_day
+    start = datetime.combine(start_day, time.min)
+    end = datetime.combine(end_day + timedelta(days=1), time.max)
+
+    pulses = db.iter_logs(username=username, start=start, end=end,
+                          projection=["username", "timestamp", "active_time"])
+    rows = ActivityBitmaps.from_pulses(pulses).rows(start_day, end_day)
+    db.save_bitmaps(rows)
+    logging.info(f"Activity bitmaps rebuilt for {start_day}..{end_day}: {len(rows)} user-days.")
+    return len(rows)
+
+
+def parse_day(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def main():
+    from storage import open_database, BACKENDS
+
+    parser = argparse.ArgumentParser(description="Build and query per-minute activity bitmaps.")
+    parser.add_argument("command", choices=("rollup", "report"))
+    parser.add_argument("--start", type=parse_day, default=date.today() - timedelta(days=1), help="First day (YYYY-MM-DD).")
+    parser.add_argument("--end", type=parse_day, help="Last day (YYYY-MM-DD); defaults to --start.")
+    parser.add_argument("--user", help="rollup: only this user's bitmaps.")
+    parser.add_argument("--users", nargs="+", help="report: users to include; defaults to everyone with bitmaps.")
+    parser.add_argument("--backend", choices=BACKENDS, help="Storage backend; defaults to storage.backend.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    end = args.end or args.start
+    with open_database(args.backend, buffered=False) as db:
+        if args.command == "rollup":
+            rollup_bitmaps(db, args.start, end, username=args.user)
+            return
+
+        report = ActivityBitmaps.load(db, args.users, args.start, end).report(args.users, args.start, end)
+        for username, row in report["users"].items():
+            print(f"{username:<20} {row['active_minutes'] / 60:>8.1f} h active on {row['active_days']} days")
+        print(f"{'all at once':<20} {report['overlap_minutes'] / 60:>8.1f} h")
+        print(f"{'anyone':<20} {report['coverage_minutes'] / 60:>8.1f} h")
+        for (first, second), minutes in sorted(report["pairwise_overlap"].items(), key=lambda item: -item[1]):
+            print(f"  {first} + {second}: {minutes / 60:.1f} h")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# archive_pulses.py - Move raw pulses older than the hot window into the file archive
+# Author: Sanja
+#
+# Usage:
+#   python archive_pulses.py                      (uses archive.hot_days from config.yml)
+#   python archive_pulses.py --hot-days 30 --dry-run
+#
+# Works one day at a time, oldest first: the day's pulses are written to their
+# partitions, the day's daily_user_stats rollups are recomputed from them, and
+# only then are the pulses deleted from MongoDB. Partitions merge by `_id`, so an
+# interrupted run can simply be started again. Finding the next day and reading
+# it use the 'timestamp' index from MANAGED_INDEXES (created by ensure_indexes).
+
+import os
+import sys
+import argparse
+import logging
+from datetime import datetime, date, timedelta
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, script_dir)
+
+from connect_to_db import MongoDatabase
+
+DELETE_CHUNK = 1000
+
+
+def archive_old_pulses(db, hot_days=None, dry_run=False):
+    """
+    Archives every day older than `hot_days`.
+    Args:
+        db (MongoDatabase): Connected database with `archive.enabled` set.
+        hot_days (int, optional): Days kept in MongoDB. Defaults to `archive.hot_days`.
+        dry_run (bool): Only report what would be archived.
+    Returns:
+        int: Number of pulses archived (or that would be archived).
+    """
+    if not db.archive:
+        raise RuntimeError("The pulse archive is disabled; set archive.enabled and archive.path in config.yml.")
+
+    hot_days = db.archive_hot_days if hot_days is None else hot_days
+    cutoff = datetime.combine(date.today() - timedelta(days=hot_days), datetime.min.time())
+    archived = 0
+    next_day = None
+
+    while True:
+        oldest = next(db.iter_logs(
+            start=next_day, end=cutoff - timedelta(microseconds=1), projection=["timestamp"],
+            sort=[("timestamp", 1)], limit=1, include_archive=False,
+        ), None)
+        if oldest is None:
+            break
+
+        day = oldest["timestamp"].date()
+        start = datetime.combine(day, datetime.min.time())
+        end = datetime.combine(day, datetime.max.time())
+        next_day = start + timedelta(days=1)
+        docs = list(db.iter_logs(start=start, end=end, include_archive=False))
+
+        by_user = {}
+        for doc in docs:
+            by_user.setdefault(doc.get("username"), []).append(doc)
+
+        if dry_run:
+            logging.info(f"{day}: would archive {len(docs)} pulses for {len(by_user)} users.")
+            archived += len(docs)
+            continue
+
+        for username, user_docs in by_user.items():
+            db.archive.write_partition(day, username, user_docs)
+
+        # The rollups are all that stays in MongoDB; make sure they match the archived pulses
+        db.rebuild_daily_stats(start=start, end=end)
+
+        ids = [doc["_id"] for doc in docs]
+        for index in range(0, len(ids), DELETE_CHUNK):
+            db.activity_collection.delete_many(db.codec.query({
+                "_id": {"$in": ids[index:index + DELETE_CHUNK]},
+                "timestamp": {"$gte": start, "$lte": end},
+            }))
+
+        archived += len(docs)
+        logging.info(f"{day}: archived {len(docs)} pulses for {len(by_user)} users.")
+
+    logging.info(f"Archived {archived} pulses older than {cutoff:%Y-%m-%d}.")
+    return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old activity pulses into the compressed file archive.")
+    parser.add_argument("--hot-days", type=int, help="Days of raw pulses kept in MongoDB.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be archived.")
+    args = parser.parse_args()
+
+    with MongoDatabase(buffered=False) as db:
+        archive_old_pulses(db, hot_days=args.hot_days, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,553 @@
+# -*- coding: utf-8 -*-
+# async_db.py - asyncio variant of the MongoDB data-access layer
+# Author: Sanja
+
+# Heart Beat Application - Async MongoDB Module
+# Same insert and query surface as connect_to_db.MongoDatabase, but every call is a
+# coroutine so the service can run its loops on a single event loop with many
+# writes in flight. Uses pymongo's native AsyncMongoClient (pymongo >= 4.10) and
+# falls back to motor when only that is installed. A pre-built client can be
+# injected, which is how the layer is exercised against an in-process fake server.
+# Reads go through the same PulseCodec and archive chain as the threaded layer, so
+# every pulse layout decodes and archived days are merged into `iter_logs`.
+# Writes follow the same resilience rules as the threaded layer: a lazy connect
+# that never blocks startup, a circuit breaker, and a fallback sink (the service's
+# PulseSpool) for pulses the server cannot take right now.
+# =============================================================================
+# Imports
+# =============================================================================
+import os
+import sys
+import asyncio
+import inspect
+import logging
+import itertools
+import pymongo
+from bson import ObjectId
+from pymongo import ASCENDING, errors
+
+script_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, script_path)
+
+from pulse_codec import PulseCodec
+from pulse_archive import PulseArchive
+from config_service import get_config
+from connect_to_db import (
+    MongoDatabase, DAILY_STATS_SORT, DEFAULT_POOL_SETTINGS, MANAGED_INDEXES, _get_config,
+    get_shared_client, release_shared_client,
+)
+from db_metrics import command_listeners, get_metrics
+from resilience import RESILIENCE_DEFAULTS, RetryPolicy, CircuitBreaker, is_transient, retry_call_async
+
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient as AsyncMongoClient
+    except ImportError:
+        AsyncMongoClient = None
+
+
+async def _resolve(value):
+    """Awaits `value` if needed; motor and pymongo differ on which calls are coroutines."""
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+async def _iter_blocking(iterable, chunk_size=500):
+    """Streams a blocking iterator (e.g. archive files) in chunks read by a worker thread."""
+    iterator = iter(iterable)
+    while True:
+        chunk = await asyncio.to_thread(list, itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        for item in chunk:
+            yield item
+
+
+# =============================================================================
+# AsyncMongoDatabase Class
+# =============================================================================
+class AsyncMongoDatabase:
+
+    # -------------------------------------------------------------------------
+    # _init_
+    # -------------------------------------------------------------------------
+    def __init__(self, client=None, max_in_flight=50):
+        """
+        Prepares the async data-access layer. Call `await connect()` before use.
+        Args:
+            client (optional): Pre-built async client (e.g. a fake server for tests).
+            max_in_flight (int): Upper bound for concurrent background writes.
+        """
+        self.config_file            = _get_config
+        self.cursor_batch_size      = 1000
+        self.pool_settings          = dict(DEFAULT_POOL_SETTINGS)
+        self.codec                  = PulseCodec()
+        self.pulse_layout           = "standard"
+        self.pulse_collection_name  = "activity_pulse"
+        self.timeseries_collection  = "activity_pulse_ts"
+        self.compact_collection     = "activity_pulse_compact"
+        self.timeseries_granularity = "seconds"
+        self.archive                = None
+        self.client                 = client
+        self._names_uri             = None
+        self.db                     = None
+        self.activity_collection    = None
+        self.summary_collection     = None
+        self.daily_stats_collection = None
+        self.ready                  = asyncio.Event()    # set once the server answered a ping
+        self.connection_error       = None
+        self.metrics                = get_metrics()
+        self.retry_policy           = RetryPolicy()
+        self.breaker                = CircuitBreaker(name="MongoDB")
+        self.write_timeout          = RESILIENCE_DEFAULTS["write_timeout"]
+        self.fallback               = None
+        self._probe_task            = None
+        self._write_slots           = asyncio.Semaphore(max_in_flight)
+        self._pending_writes        = set()
+
+        self.load_config()
+
+    # -------------------------------------------------------------------------
+    # load_config
+    # -------------------------------------------------------------------------
+    def load_config(self):
+        """Loads MongoDB credentials from the YAML file."""
+        try:
+            config = get_config(self.config_file).get()
+
+            self.host       = config["mongodb"]["host"]
+            self.port       = config["mongodb"]["port"]
+            self.username   = config["mongodb"].get("username")
+            self.password   = config["mongodb"].get("password")
+            self.auth_db    = config["mongodb"]["auth_db"]
+            self.db_name    = config["mongodb"]["db_name"]
+
+            self.cursor_batch_size = int(config["mongodb"].get("cursor_batch_size", self.cursor_batch_size))
+            self.pool_settings = {**DEFAULT_POOL_SETTINGS, **(config["mongodb"].get("pool") or {})}
+
+            self.pulse_layout           = config["mongodb"].get("pulse_layout", self.pulse_layout)
+            self.timeseries_collection  = config["mongodb"].get("timeseries_collection", self.timeseries_collection)
+            self.timeseries_granularity = config["mongodb"].get("timeseries_granularity", self.timeseries_granularity)
+            self.compact_collection     = config["mongodb"].get("compact_collection", self.compact_collection)
+            self.pulse_collection_name  = {
+                "timeseries": self.timeseries_collection,
+                "compact": self.compact_collection,
+            }.get(self.pulse_layout, "activity_pulse")
+
+            archive = config.get("archive") or {}
+            if archive.get("enabled"):
+                self.archive = PulseArchive(archive["path"], archive.get("compression", "auto"))
+
+            resilience = {**RESILIENCE_DEFAULTS, **(config["mongodb"].get("resilience") or {})}
+            self.retry_policy = RetryPolicy(resilience["attempts"], resilience["base_delay"], resilience["max_delay"])
+            self.breaker = CircuitBreaker(resilience["failure_threshold"], resilience["reset_timeout"], name="MongoDB")
+            self.write_timeout = float(resilience["write_timeout"])
+
+        except FileNotFoundError:
+            raise RuntimeError("Configuration file not found. Ensure 'config.yml' exists.")
+        except KeyError as e:
+            raise RuntimeError(f"Missing key in config file: {e}")
+        except Exception as e:
+            raise RuntimeError(f"Error loading YAML configuration: {e}")
+
+    # -------------------------------------------------------------------------
+    # connect
+    # -------------------------------------------------------------------------
+    async def connect(self, lazy=False):
+        """
+        Connects to MongoDB (unless a client was injected) and pings the server.
+        Args:
+            lazy (bool): Skip the ping; `_probe_connection` retries it in the background
+                and sets `ready`. Until then writes go to the fallback.
+        """
+        try:
+            if self.username and self.password:
+                uri = f"mongodb://{self.username}:{self.password}@{self.host}:{self.port}/{self.auth_db}"
+            else:
+                uri = f"mongodb://{self.host}:{self.port}/{self.auth_db}"
+
+            if self.pulse_layout == "compact":
+                # The name dictionary does blocking lookups on the shared synchronous
+                # client; codec calls then run in a worker thread (see `_run_codec`)
+                names_client = get_shared_client(uri, ping=False, serverSelectionTimeoutMS=5000)
+                self._names_uri = uri
+                self.codec = MongoDatabase.build_codec(names_client[self.db_name], self.pulse_layout)
+            else:
+                self.codec = PulseCodec(self.pulse_layout)
+
+            if self.client is None:
+                if AsyncMongoClient is None:
+                    raise RuntimeError("No asyncio MongoDB driver found. Install pymongo>=4.10 or motor.")
+                self.client = AsyncMongoClient(
+                    uri,
+                    serverSelectionTimeoutMS=5000,
+                    maxPoolSize=self.pool_settings["max_pool_size"],
+                    minPoolSize=self.pool_settings["min_pool_size"],
+                    maxIdleTimeMS=self.pool_settings["max_idle_time_ms"],
+                    event_listeners=command_listeners(),
+                )
+
+            self.db = self.client[self.db_name]
+            self.activity_collection = self.db[self.pulse_collection_name]
+            self.summary_collection = self.db["session_summaries"]
+            self.daily_stats_collection = self.db["daily_user_stats"]
+
+            if lazy:
+                self._probe_task = asyncio.get_running_loop().create_task(self._probe_connection())
+                logging.info(f"MongoDB client created (asyncio, lazy). Database: {self.db_name}")
+                return
+
+            await self.client.admin.command("ping")  # Test connection
+            self.ready.set()
+            logging.info(f"Connected to MongoDB (asyncio). Database: {self.db_name}")
+
+        except errors.ServerSelectionTimeoutError:
+            raise RuntimeError("MongoDB connection timeout! Please check your connection.")
+        except RuntimeError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Error connecting to MongoDB: {e}")
+
+    # -------------------------------------------------------------------------
+    # _probe_connection
+    # -------------------------------------------------------------------------
+    async def _probe_connection(self, retry_interval=15):
+        """Pings the server in the background until it answers, then sets `ready`."""
+        while self.client:
+            try:
+                await self.client.admin.command("ping")
+                self.connection_error = None
+                self.ready.set()
+                logging.info(f"Connected to MongoDB (asyncio). Database: {self.db_name}")
+                return
+            except Exception as e:
+                self.connection_error = e
+                logging.warning(f"MongoDB not reachable yet, retrying in {retry_interval}s: {e}")
+                await asyncio.sleep(retry_interval)
+
+    # -------------------------------------------------------------------------
+    # wait_until_ready
+    # -------------------------------------------------------------------------
+    async def wait_until_ready(self, timeout=None):
+        """
+        Waits until the server answered a ping.
+        Returns:
+            bool: True when connected, False if `timeout` expired first.
+        """
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    # -------------------------------------------------------------------------
+    # _run_codec
+    # -------------------------------------------------------------------------
+    async def _run_codec(self, func, *args, **kwargs):
+        """Calls a codec function; with the compact layout its name lookups block, so it runs in a thread."""
+        if self.codec.compact:
+            return await asyncio.to_thread(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    # -------------------------------------------------------------------------
+    # set_fallback / hand_off
+    # -------------------------------------------------------------------------
+    def set_fallback(self, sink):
+        """Registers where pulses go while the server is unreachable, usually the service's PulseSpool."""
+        self.fallback = sink
+
+    def hand_off(self, docs):
+        """Passes pulses that cannot be written now to the fallback sink, or drops them with an error."""
+        MongoDatabase.hand_off(self, docs)
+
+    # ------------------------------------------------------------------------
+    # ensure_indexes
+    # ------------------------------------------------------------------------
+    async def ensure_indexes(self):
+        """Creates the same collections and indexes as `MongoDatabase.ensure_indexes`."""
+        if self.codec.timeseries:
+            names = await self.db.list_collection_names(filter={"name": self.pulse_collection_name})
+            if not names:
+                await self.db.create_collection(
+                    self.pulse_collection_name,
+                    timeseries=PulseCodec.timeseries_options(self.timeseries_granularity),
+                )
+        if self.codec.compact:
+            await asyncio.to_thread(self.codec.names.ensure_index)
+
+        for collection_name, keys, options in MANAGED_INDEXES:
+            if collection_name == "activity_pulse":
+                await self.activity_collection.create_index(self.codec.sort(keys), **options)
+            else:
+                await self.db[collection_name].create_index(keys, **options)
+        logging.info("MongoDB indexes ensured.")
+
+    # -------------------------------------------------------------------------
+    # insert_pulse
+    # -------------------------------------------------------------------------
+    async def insert_pulse(self, data):
+        """
+        Inserts a log entry and folds it into the daily rollups.
+        Like `MongoDatabase.insert_pulse`, the write is a single attempt bounded by
+        `write_timeout`; before the first successful ping, while the circuit breaker
+        is open, or when the attempt fails, the pulse goes to the fallback.
+        """
+        # The spool replays the pulse under the same _id, so a write that did land is not doubled
+        data.setdefault("_id", ObjectId())
+        if not self.ready.is_set() or not self.breaker.allow():
+            self.hand_off([data])
+            return
+
+        with self.metrics.track("insert_pulse") as operation:
+            try:
+                encoded = await self._run_codec(self.codec.encode, data)
+                operation.add(encoded)
+                with pymongo.timeout(self.write_timeout):
+                    await self.activity_collection.insert_one(encoded)
+                self.breaker.record_success()
+                logging.info("Log inserted successfully.")
+            except Exception as e:
+                operation.fail(e)
+                logging.error(f"Database Error (insert_pulse): {e}")
+                if is_transient(e):
+                    self.breaker.record_failure()
+                    self.hand_off([data])
+                else:
+                    self.breaker.record_success()
+                return
+
+        await self.update_daily_stats([data])
+
+    # -------------------------------------------------------------------------
+    # insert_pulses
+    # -------------------------------------------------------------------------
+    async def insert_pulses(self, docs, retry=True):
+        """
+        Inserts several log entries with a single unordered bulk write.
+        Duplicate `_id` errors are ignored so that a batch can be safely replayed.
+        Transient failures are retried under the circuit breaker, as in
+        `MongoDatabase.insert_pulses`.
+        Returns:
+            int: Number of documents actually inserted.
+        Raises:
+            CircuitOpenError: The server is known to be down; nothing was attempted.
+        """
+        if not docs:
+            return 0
+        for doc in docs:
+            # Every attempt must write the same _ids (encoding copies the timeseries/compact documents)
+            doc.setdefault("_id", ObjectId())
+
+        attempts = {"inserted": {}, "unknown": set()}
+        try:
+            return await retry_call_async(self._insert_pulses, docs, attempts,
+                                          policy=self.retry_policy if retry else None, breaker=self.breaker)
+        except Exception:
+            # Pulses a failed attempt did store are counted now; a later replay sees them as duplicates
+            await self.update_daily_stats(list(attempts["inserted"].values()))
+            raise
+
+    async def _insert_pulses(self, docs, attempts):
+        """One bulk write; see `MongoDatabase._insert_pulses` for the `attempts` bookkeeping."""
+        with self.metrics.track("insert_pulses") as operation:
+            pending = [doc for doc in docs if doc["_id"] not in attempts["inserted"]]
+            duplicates = []
+            if self.codec.timeseries:
+                query = MongoDatabase.existing_pulses_query(pending)
+                if query is not None:
+                    existing = {row["_id"] async for row in self.activity_collection.find(query, {"_id": 1})}
+                    duplicates = [doc for doc in pending if doc["_id"] in existing]
+                    pending = [doc for doc in pending if doc["_id"] not in existing]
+
+            written = []
+            if pending:
+                encoded = await self._run_codec(list, map(self.codec.encode, pending))
+                operation.add(encoded)
+                try:
+                    await self.activity_collection.insert_many(encoded, ordered=False)
+                    written = pending
+                except errors.BulkWriteError as e:
+                    write_errors = e.details.get("writeErrors", [])
+                    failed = {err["index"] for err in write_errors}
+                    written = [doc for index, doc in enumerate(pending) if index not in failed]
+                    if any(err.get("code") != 11000 for err in write_errors):
+                        attempts["inserted"].update((doc["_id"], doc) for doc in written)
+                        raise
+                    duplicates += [doc for index, doc in enumerate(pending) if index in failed]
+                except Exception:
+                    attempts["unknown"].update(doc["_id"] for doc in pending)
+                    raise
+
+            # Replayed duplicates were already counted in the daily stats
+            recovered = [doc for doc in duplicates if doc["_id"] in attempts["unknown"]]
+            inserted = list(attempts["inserted"].values()) + recovered + written
+            operation.documents = len(inserted)
+
+        await self.update_daily_stats(inserted)
+        return len(inserted)
+
+    # -------------------------------------------------------------------------
+    # schedule_pulse
+    # -------------------------------------------------------------------------
+    def schedule_pulse(self, data):
+        """
+        Starts `insert_pulse` in the background without waiting for it.
+        At most `max_in_flight` writes run concurrently; `close()` waits for the rest.
+        Returns:
+            asyncio.Task: The write task.
+        """
+        async def write():
+            async with self._write_slots:
+                await self.insert_pulse(data)
+
+        task = asyncio.get_running_loop().create_task(write())
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+        return task
+
+    # -------------------------------------------------------------------------
+    # update_daily_stats
+    # -------------------------------------------------------------------------
+    async def update_daily_stats(self, docs):
+        """Folds newly inserted pulses into 'daily_user_stats' with atomic `$inc` upserts."""
+        operations = MongoDatabase.daily_stats_operations(docs)
+        if not operations:
+            return
+
+        try:
+            await self.daily_stats_collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logging.error(f"Database Error (update_daily_stats): {e}")
+
+    # -------------------------------------------------------------------------
+    # insert_summary
+    # -------------------------------------------------------------------------
+    async def insert_summary(self, data):
+        """Inserts a session summary into the MongoDB collection."""
+        with self.metrics.track("insert_summary") as operation:
+            try:
+                operation.add(data)
+                await self.summary_collection.insert_one(data)
+                logging.info("Summary inserted successfully.")
+            except Exception as e:
+                operation.fail(e)
+                logging.error(f"Database Error (summary_collections): {e}")
+
+    # ------------------------------------------------------------------------
+    # iter_logs
+    # ------------------------------------------------------------------------
+    async def iter_logs(self, username=None, hostname=None, start=None, end=None, query=None,
+                        projection=None, sort=None, limit=0, batch_size=None, include_archive=True):
+        """
+        Streams logs from 'activity_pulse' as an async generator, decoded and with
+        archived days merged in the same order as `MongoDatabase.iter_logs`.
+        Args:
+            See `MongoDatabase.iter_logs`.
+        """
+        stored_query = await self._run_codec(
+            self.codec.query, MongoDatabase.build_query(username, hostname, start, end, query)
+        )
+        hot = self._iter_cursor(stored_query, projection, sort, limit, batch_size)
+        if not include_archive or not self.archive or not await asyncio.to_thread(self.archive.days, start, end):
+            async for doc in hot:
+                yield doc
+            return
+
+        descending = bool(sort) and sort[0][0] == "timestamp" and sort[0][1] < 0
+        archived = _iter_blocking(
+            self.archive.iter_pulses(username, hostname, start, end, query, projection, descending)
+        )
+        parts = (hot, archived) if descending else (archived, hot)
+        count = 0
+        try:
+            for part in parts:
+                async for doc in part:
+                    yield doc
+                    count += 1
+                    if limit and count >= limit:
+                        return
+        finally:
+            for part in parts:
+                await part.aclose()
+
+    async def _iter_cursor(self, query, projection, sort, limit, batch_size):
+        """Streams and decodes the pulses still in MongoDB."""
+        cursor = self.activity_collection.find(
+            query, self.codec.projection(projection), limit=limit, batch_size=batch_size or self.cursor_batch_size
+        )
+        if sort:
+            cursor = cursor.sort(self.codec.sort(sort))
+        try:
+            async for doc in cursor:
+                yield await self._run_codec(self.codec.decode, doc)
+        finally:
+            await _resolve(cursor.close())
+
+    # ------------------------------------------------------------------------
+    # find_logs
+    # ------------------------------------------------------------------------
+    async def find_logs(self, username=None, hostname=None, start=None, end=None,
+                        projection=None, sort=None, limit=0):
+        """Fetch logs from 'activity_pulse' with all filtering done by MongoDB."""
+        return [
+            doc async for doc in self.iter_logs(
+                username, hostname, start, end,
+                projection=projection, sort=sort or [("timestamp", ASCENDING)], limit=limit,
+            )
+        ]
+
+    # ------------------------------------------------------------------------
+    # get_daily_stats
+    # ------------------------------------------------------------------------
+    async def get_daily_stats(self, username=None, hostname=None, start_date=None, end_date=None):
+        """Fetch per-day rollups from 'daily_user_stats' sorted by date."""
+        query = MongoDatabase.build_daily_stats_query(username, hostname, start_date, end_date)
+        cursor = self.daily_stats_collection.find(query, {"_id": 0}).sort(DAILY_STATS_SORT)
+        return [doc async for doc in cursor]
+
+    # ------------------------------------------------------------------------
+    # rollup_activity
+    # ------------------------------------------------------------------------
+    async def rollup_activity(self, start=None, end=None, username=None, hostname=None, granularity="day"):
+        """Async counterpart of `MongoDatabase.rollup_activity`."""
+        pipeline = await self._run_codec(
+            MongoDatabase.rollup_pipeline, start, end, username, hostname, granularity, codec=self.codec
+        )
+        cursor = await _resolve(self.activity_collection.aggregate(pipeline))
+        return [MongoDatabase.rollup_row(row) async for row in cursor]
+
+    # ------------------------------------------------------------------------
+    # close
+    # ------------------------------------------------------------------------
+    async def close(self):
+        """Waits for in-flight writes, then closes the MongoDB connection."""
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+
+        if self._probe_task:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
+
+        if self.client:
+            await _resolve(self.client.close())
+            self.client = None
+            logging.info("MongoDB connection closed successfully.")
+        if self._names_uri:
+            release_shared_client(self._names_uri)
+            self._names_uri = None
+
+    # ------------------------------------------------------------------------
+    # __aenter__ and __aexit__ methods for async context manager support
+    # ------------------------------------------------------------------------
+    async def __aenter__(self):
+        """Allows usage with `async with` statements."""
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        """Closes the connection when exiting `async with` statement."""
+        await self.close()
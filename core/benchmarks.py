@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+# benchmarks.py - Storage and query benchmarks against a scratch database
+# Author: Sanja
+#
+# Usage:
+#   python benchmarks.py layouts                              (standard vs time-series vs compact pulses)
+#   python benchmarks.py layouts --users 10 --days 365 --pulses-per-day 200
+#   python benchmarks.py backends                             (MongoDB vs embedded SQLite storage)
+#   python benchmarks.py backends --backends sqlite           (no MongoDB server needed)
+#   python benchmarks.py day_summary --user-counts 10 100 1000 (day-end cost must not grow with users)
+#   python benchmarks.py bitmaps --users 20 --days 60           (month team report: bitmaps vs pulse replay)
+#
+# MongoDB benchmarks write into their own scratch database (default 'heartbeat_bench')
+# on the server configured in config.yml and drop it afterwards unless --keep is given.
+# SQLite benchmarks use a temporary file.
+
+import os
+import sys
+import time
+import random
+import argparse
+import logging
+import tempfile
+import statistics
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, script_dir)
+
+from connect_to_db import MongoDatabase, MANAGED_INDEXES
+from pulse_codec import PulseCodec, PulseNames, LAYOUTS
+from sqlite_backend import SQLiteDatabase, DAY_SUMMARY_SQL, _to_text
+from storage import BACKENDS
+from log_importer import pulse_id
+from activity_bitmap import ActivityBitmaps, rollup_bitmaps
+
+
+# =============================================================================
+# Helpers
+# =============================================================================
+def synthetic_pulses(users, days, pulses_per_day, start=None, seed=42):
+    """Yields a reproducible stream of pulses shaped like the monitor's output, oldest first."""
+    rng = random.Random(seed)
+    start = start or datetime(datetime.now().year - 1, 1, 1)
+    step = 86400 / pulses_per_day
+
+    for day in range(days):
+        for slot in range(pulses_per_day):
+            for user in range(users):
+                timestamp = start + timedelta(days=day, seconds=slot * step + rng.random() * step)
+                status = "Active" if rng.random() < 0.7 else "Inactive"
+                duration = round(rng.uniform(1, step), 2)
+                username, hostname = f"user{user:03d}", f"HOST-{user:03d}"
+                yield {
+                    # Deterministic and unique per pulse; ObjectId.from_datetime repeats within a second
+                    "_id": pulse_id(timestamp, username, hostname, status),
+                    "username": username,
+                    "hostname": hostname,
+                    "timestamp": timestamp,
+                    "status": status,
+                    # As the monitor writes them: an Inactive pulse carries the active time it ended
+                    "active_time": duration if status == "Inactive" else 0,
+                    "inactive_time": duration if status == "Active" else 0,
+                }
+
+
+def collection_size(db, name):
+    """Returns the `$collStats` storage statistics (size, avgObjSize, storageSize, totalIndexSize, ...)."""
+    return next(db[name].aggregate([{"$collStats": {"storageStats": {}}}]))["storageStats"]
+
+
+def time_queries(collection, codec, users, start, days, runs):
+    """Runs `runs` one-week range queries for random users and returns the latencies in ms."""
+    rng = random.Random(7)
+    latencies = []
+    for _ in range(runs):
+        since = start + timedelta(days=rng.randrange(max(days - 7, 1)))
+        query = codec.query({
+            "username": f"user{rng.randrange(users):03d}",
+            "timestamp": {"$gte": since, "$lt": since + timedelta(days=7)},
+        })
+        started = time.perf_counter()
+        list(collection.find(query, codec.projection(["timestamp", "status", "active_time"])))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+@contextmanager
+def scratch_database(args):
+    """Yields (MongoDatabase, scratch database) and drops the scratch database afterwards unless --keep."""
+    with MongoDatabase(buffered=False) as mongo:
+        try:
+            yield mongo, mongo.client[args.db]
+        finally:
+            if not args.keep:
+                mongo.client.drop_database(args.db)
+                logging.info(f"Dropped scratch database '{args.db}'.")
+
+
+def use_database(mongo, db):
+    """Points an open MongoDatabase at another database on the same server."""
+    mongo.db = db
+    mongo.activity_collection = db[mongo.pulse_collection_name]
+    mongo.codec = MongoDatabase.build_codec(db, mongo.pulse_layout)
+    mongo.summary_collection = db["session_summaries"]
+    mongo.daily_stats_collection = db["daily_user_stats"]
+    mongo.bitmap_collection = db["activity_bitmaps"]
+    mongo.archive = None
+    mongo.ensure_indexes()
+    return mongo
+
+
+def timed(func, runs):
+    """Calls `func(run)` `runs` times and returns the latencies in ms."""
+    latencies = []
+    for run in range(runs):
+        started = time.perf_counter()
+        func(run)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def find_key(tree, key):
+    """Returns the first value stored under `key` anywhere in a nested explain() result."""
+    if isinstance(tree, dict):
+        if key in tree:
+            return tree[key]
+        tree = list(tree.values())
+    if isinstance(tree, list):
+        for item in tree:
+            found = find_key(item, key)
+            if found is not None:
+                return found
+    return None
+
+
+def report(label, rows):
+    """Prints a small aligned table."""
+    print(f"\n{label}")
+    width = max(len(name) for name, _ in rows)
+    for name, value in rows:
+        print(f"  {name:<{width}}  {value}")
+
+
+# =============================================================================
+# layouts
+# =============================================================================
+def bench_layouts(args):
+    """Loads the same synthetic history into each pulse layout and compares size and query latency."""
+    with scratch_database(args) as (_, db):
+        _bench_layouts(db, args)
+
+
+def _bench_layouts(db, args):
+    start = datetime(datetime.now().year - 1, 1, 1)
+    pulse_index = next(keys for name, keys, _ in MANAGED_INDEXES if name == "activity_pulse")
+
+    for layout in args.layouts:
+        names = PulseNames(db["bench_pulse_names"]) if layout == "compact" else None
+        codec = PulseCodec(layout, names=names)
+        name = f"bench_pulses_{layout}"
+        db[name].drop()
+        if codec.timeseries:
+            db.create_collection(name, timeseries=PulseCodec.timeseries_options())
+        db[name].create_index(codec.sort(pulse_index))
+
+        loaded = 0
+        started = time.perf_counter()
+        batch = []
+        for doc in synthetic_pulses(args.users, args.days, args.pulses_per_day, start):
+            batch.append(codec.encode(doc))
+            if len(batch) >= 5000:
+                db[name].insert_many(batch, ordered=False)
+                loaded += len(batch)
+                batch = []
+        if batch:
+            db[name].insert_many(batch, ordered=False)
+            loaded += len(batch)
+        load_seconds = time.perf_counter() - started
+
+        stats = collection_size(db, name)
+        latencies = time_queries(db[name], codec, args.users, start, args.days, args.runs)
+        report(f"{layout} ({name})", [
+            ("pulses", loaded),
+            ("load rate", f"{loaded / max(load_seconds, 1e-6):.0f} pulses/s"),
+            ("bson bytes/doc", f"{stats.get('size', 0) / max(loaded, 1):.1f}"),
+            ("disk bytes/doc", f"{stats.get('storageSize', 0) / max(loaded, 1):.1f}"),
+            ("storage", f"{stats.get('storageSize', 0) / 1024 / 1024:.1f} MiB"),
+            ("indexes", f"{stats.get('totalIndexSize', 0) / 1024 / 1024:.1f} MiB"),
+            ("week query p50", f"{statistics.median(latencies):.1f} ms"),
+            ("week query max", f"{max(latencies):.1f} ms"),
+        ])
+
+
+# =============================================================================
+# backends
+# =============================================================================
+def bench_backends(args):
+    """Runs the same load, range query and rollup workload through each storage backend."""
+    for backend in args.backends:
+        if backend == "sqlite":
+            with tempfile.TemporaryDirectory() as folder:
+                with SQLiteDatabase(os.path.join(folder, "bench.db"), buffered=False) as db:
+                    _bench_backend(db, args)
+                    size = os.path.getsize(db.path)
+            print(f"  {'file size':<16}  {size / 1024 / 1024:.1f} MiB")
+        else:
+            with scratch_database(args) as (mongo, db):
+                _bench_backend(use_database(mongo, db), args)
+
+
+def _bench_backend(db, args):
+    start = datetime(datetime.now().year - 1, 1, 1)
+    rng = random.Random(7)
+
+    loaded = 0
+    started = time.perf_counter()
+    batch = []
+    for doc in synthetic_pulses(args.users, args.days, args.pulses_per_day, start):
+        batch.append(doc)
+        if len(batch) >= args.batch_size:
+            loaded += db.insert_pulses(batch)
+            batch = []
+    loaded += db.insert_pulses(batch)
+    load_seconds = time.perf_counter() - started
+
+    def week_query(_):
+        since = start + timedelta(days=rng.randrange(max(args.days - 7, 1)))
+        list(db.iter_logs(
+            username=f"user{rng.randrange(args.users):03d}", start=since, end=since + timedelta(days=7),
+            projection=["timestamp", "status", "active_time"], sort=[("timestamp", 1)],
+        ))
+
+    def month_rollup(_):
+        since = start + timedelta(days=rng.randrange(max(args.days - 30, 1)))
+        db.rollup_activity(since, since + timedelta(days=30), granularity="day")
+
+    def daily_stats(_):
+        db.get_daily_stats(username=f"user{rng.randrange(args.users):03d}", start_date=start)
+
+    query_ms = timed(week_query, args.runs)
+    rollup_ms = timed(month_rollup, args.runs)
+    stats_ms = timed(daily_stats, args.runs)
+    report(type(db).__name__, [
+        ("pulses", loaded),
+        ("insert rate", f"{loaded / max(load_seconds, 1e-6):.0f} pulses/s (batches of {args.batch_size})"),
+        ("week query p50", f"{statistics.median(query_ms):.1f} ms"),
+        ("week query max", f"{max(query_ms):.1f} ms"),
+        ("month rollup p50", f"{statistics.median(rollup_ms):.1f} ms"),
+        ("daily stats p50", f"{statistics.median(stats_ms):.1f} ms"),
+    ])
+
+
+# =============================================================================
+# day_summary
+# =============================================================================
+def bench_day_summary(args):
+    """
+    Regression check for the day-end summary: loads one day for a growing number of
+    users and measures the work of one agent's summary. MongoDB reports index keys
+    and documents examined (documents must stay 0: the index covers the pipeline);
+    SQLite reports virtual-machine steps and the query plan. Exits non-zero when the
+    cost for the most users exceeds the cost for the fewest by more than 50%.
+    """
+    day = datetime(datetime.now().year - 1, 3, 1)
+    flat = True
+
+    for backend in args.backends:
+        rows = []
+        if backend == "sqlite":
+            for users in args.user_counts:
+                with tempfile.TemporaryDirectory() as folder:
+                    with SQLiteDatabase(os.path.join(folder, "bench.db"), buffered=False) as db:
+                        rows.append(_day_summary_sqlite(db, users, day, args))
+        else:
+            with scratch_database(args) as (mongo, scratch):
+                for users in args.user_counts:
+                    scratch.drop_collection(mongo.pulse_collection_name)
+                    rows.append(_day_summary_mongo(use_database(mongo, scratch), users, day, args))
+
+        costs = [row[1] for row in rows]
+        backend_flat = costs[-1] <= costs[0] * 1.5 + 10 and all(row[2] == 0 for row in rows)
+        flat = flat and backend_flat
+        report(f"{backend} day_summary ({args.pulses_per_day} pulses per user)", [
+            (f"{users:>6} users", f"cost {cost:>8}  fetched {fetched:>6}  p50 {latency:.2f} ms  {plan}")
+            for users, cost, fetched, latency, plan in rows
+        ] + [("result", "flat" if backend_flat else "GROWS WITH USER COUNT")])
+
+    if not flat:
+        sys.exit(1)
+
+
+def _load_day(db, users, day, args):
+    expected = users * args.pulses_per_day
+    loaded = 0
+    batch = []
+    for doc in synthetic_pulses(users, 1, args.pulses_per_day, day):
+        batch.append(doc)
+        if len(batch) >= 5000:
+            loaded += db.insert_pulses(batch)
+            batch = []
+    loaded += db.insert_pulses(batch)
+    # insert_pulses skips duplicate ids silently; a short load would make the check meaningless
+    if loaded != expected:
+        raise RuntimeError(f"Loaded {loaded} of {expected} pulses for {users} users.")
+
+
+def _day_summary_mongo(db, users, day, args):
+    _load_day(db, users, day, args)
+    pipeline = MongoDatabase.day_summary_pipeline("user000", "HOST-000", day.date(), codec=db.codec)
+    plan = db.db.command(
+        "explain", {"aggregate": db.activity_collection.name, "pipeline": pipeline, "cursor": {}},
+        verbosity="executionStats",
+    )
+    stats = find_key(plan, "executionStats") or {}
+    latencies = timed(lambda _: db.day_summary("user000", "HOST-000", day.date()), args.runs)
+    index = find_key(plan, "indexName") or "no index"
+    return users, stats.get("totalKeysExamined", -1), stats.get("totalDocsExamined", -1), statistics.median(latencies), index
+
+
+def _day_summary_sqlite(db, users, day, args):
+    _load_day(db, users, day, args)
+    params = ("user000", "HOST-000", _to_text(day), _to_text(day + timedelta(days=1)))
+    plan = "; ".join(row[-1] for row in db.conn.execute("EXPLAIN QUERY PLAN " + DAY_SUMMARY_SQL, params))
+
+    steps = [0]
+    def count_steps():
+        steps[0] += 1
+        return 0
+    db.conn.set_progress_handler(count_steps, 100)
+    try:
+        db.day_summary("user000", "HOST-000", day.date())
+    finally:
+        db.conn.set_progress_handler(None, 0)
+
+    latencies = timed(lambda _: db.day_summary("user000", "HOST-000", day.date()), args.runs)
+    return users, steps[0] * 100, 0, statistics.median(latencies), plan
+
+
+# =============================================================================
+# bitmaps
+# =============================================================================
+def bench_bitmaps(args):
+    """
+    Month-long team report (active minutes per user, everyone/anyone active, pairwise
+    overlaps) answered by replaying the month's pulses versus from stored per-minute
+    bitmaps. Both must give the same report; exits non-zero if they differ.
+    """
+    same = True
+    for backend in args.backends:
+        if backend == "sqlite":
+            with tempfile.TemporaryDirectory() as folder:
+                with SQLiteDatabase(os.path.join(folder, "bench.db"), buffered=False) as db:
+                    same = _bench_bitmaps(db, backend, args) and same
+        else:
+            with scratch_database(args) as (mongo, db):
+                same = _bench_bitmaps(use_database(mongo, db), backend, args) and same
+    if not same:
+        sys.exit(1)
+
+
+def _bench_bitmaps(db, backend, args):
+    start = datetime(datetime.now().year - 1, 1, 1)
+    batch = []
+    for doc in synthetic_pulses(args.users, args.days, args.pulses_per_day, start):
+        batch.append(doc)
+        if len(batch) >= 5000:
+            db.insert_pulses(batch)
+            batch = []
+    db.insert_pulses(batch)
+
+    started = time.perf_counter()
+    built = rollup_bitmaps(db, start.date(), (start + timedelta(days=args.days - 1)).date())
+    rollup_seconds = time.perf_counter() - started
+
+    month_start = start + timedelta(days=max(args.days - 30, 0))
+    first_day, last_day = month_start.date(), (month_start + timedelta(days=29)).date()
+    users = [f"user{user:03d}" for user in range(args.users)]
+
+    def replay(_):
+        pulses = db.iter_logs(start=month_start, end=month_start + timedelta(days=31),
+                              projection=["username", "timestamp", "active_time"])
+        return ActivityBitmaps.from_pulses(pulses).report(users, first_day, last_day)
+
+    def from_bitmaps(_):
+        return ActivityBitmaps.load(db, users, first_day, last_day).report(users, first_day, last_day)
+
+    replay_ms = timed(replay, args.runs)
+    bitmap_ms = timed(from_bitmaps, args.runs)
+    same = replay(0) == from_bitmaps(0)
+    report(f"{backend} month team report ({args.users} users, {args.pulses_per_day} pulses per user and day)", [
+        ("bitmaps built", f"{built} user-days in {rollup_seconds:.2f} s"),
+        ("pulse replay p50", f"{statistics.median(replay_ms):.1f} ms"),
+        ("bitmaps p50", f"{statistics.median(bitmap_ms):.1f} ms"),
+        ("speedup", f"{statistics.median(replay_ms) / max(statistics.median(bitmap_ms), 1e-6):.0f}x"),
+        ("results", "identical" if same else "DIFFER"),
+    ])
+    return same
+
+
+BENCHMARKS = {
+    "layouts": bench_layouts,
+    "backends": bench_backends,
+    "day_summary": bench_day_summary,
+    "bitmaps": bench_bitmaps,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Heart Beat storage benchmarks.")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--db", default="heartbeat_bench", help="Scratch database, dropped afterwards.")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--pulses-per-day", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=50, help="Query repetitions.")
+    parser.add_argument("--layouts", nargs="+", choices=LAYOUTS, default=list(LAYOUTS), help="Pulse layouts to compare.")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS), help="Storage backends to compare.")
+    parser.add_argument("--batch-size", type=int, default=200, help="Pulses per insert batch.")
+    parser.add_argument("--user-counts", type=int, nargs="+", default=[10, 100, 1000],
+                        help="User counts the day_summary check loads, fewest first.")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database.")
+    args = parser.parse_args()
+
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
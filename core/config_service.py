@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# config_service.py - Cached access to the YAML configuration files
+# Author: Sanja
+
+# Heart Beat Application - Config Service
+# Every YAML file is parsed once per process and kept in memory. Each access only
+# stats the file; it is re-read when its mtime or size changes, and re-parsed only
+# when the content hash changes as well. Subscribers are told which dotted keys
+# changed (e.g. "settings.timeout"), so long-running agents pick up new settings
+# without a restart.
+# =============================================================================
+# Imports
+# =============================================================================
+import os
+import hashlib
+import logging
+import threading
+import yaml
+
+script_path     = os.path.dirname(os.path.abspath(__file__))
+_root           = os.path.abspath(os.path.join(script_path, ".."))
+CONFIG_FILE     = os.path.join(_root, "config/config.yml").replace("\\", "/")
+HOLIDAYS_FILE   = os.path.join(_root, "config/holidaysList.yml").replace("\\", "/")
+
+_files          = {}
+_files_lock     = threading.Lock()
+
+
+def get_config(path=CONFIG_FILE):
+    """
+    Returns the process-wide ConfigFile for `path`.
+    Args:
+        path (str, optional): YAML file. Defaults to config/config.yml.
+    Returns:
+        ConfigFile: The shared, cached file.
+    """
+    path = os.path.abspath(path)
+    with _files_lock:
+        if path not in _files:
+            _files[path] = ConfigFile(path)
+        return _files[path]
+
+
+def flatten(data, prefix=""):
+    """Flattens nested dicts into {"section.key": value}."""
+    flat = {}
+    for key, value in (data or {}).items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and value:
+            flat.update(flatten(value, name + "."))
+        else:
+            flat[name] = value
+    return flat
+
+
+def changed_keys(old, new):
+    """Returns the sorted dotted keys whose values differ between two parsed files."""
+    old_flat, new_flat = flatten(old), flatten(new)
+    return sorted(key for key in old_flat.keys() | new_flat.keys() if old_flat.get(key) != new_flat.get(key))
+
+
+def _coerce(value, default):
+    """Converts `value` to the type of `default` (bool, int, float); other types pass through."""
+    if value is None or default is None:
+        return value
+    try:
+        if isinstance(default, bool):
+            return value if isinstance(value, bool) else str(value).lower() in ("1", "true", "yes", "on")
+        if isinstance(default, int):
+            return int(value)
+        if isinstance(default, float):
+            return float(value)
+    except (TypeError, ValueError):
+        logging.warning(f"Invalid config value {value!r}; using default {default!r}.")
+        return default
+    return value
+
+
+# =============================================================================
+# ConfigFile Class
+# =============================================================================
+class ConfigFile:
+
+    # -------------------------------------------------------------------------
+    # _init_
+    # -------------------------------------------------------------------------
+    def __init__(self, path):
+        self.path           = path
+        self.version        = 0         # bumped on every successful re-parse
+        self._data          = None
+        self._signature     = None      # (mtime_ns, size) of the last read
+        self._digest        = None      # sha1 of the last parsed content
+        self._sections      = {}
+        self._subscribers   = []
+        self._lock          = threading.RLock()
+
+    # -------------------------------------------------------------------------
+    # get
+    # -------------------------------------------------------------------------
+    def get(self):
+        """
+        Returns the parsed file, re-parsing it only if it changed on disk.
+        The returned dict is shared; treat it as read-only.
+        Raises:
+            FileNotFoundError: The file does not exist and was never loaded.
+        """
+        changed = None
+        with self._lock:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if signature == self._signature:
+                return self._data
+
+            with open(self.path, "rb") as file:
+                raw = file.read()
+            self._signature = signature
+            digest = hashlib.sha1(raw).hexdigest()
+            if digest == self._digest:
+                return self._data
+
+            try:
+                data = yaml.safe_load(raw) or {}
+            except yaml.YAMLError as e:
+                if self._data is None:
+                    raise
+                # A half-saved file must not take running agents down; keep the last good copy
+                logging.error(f"Failed to parse {self.path}, keeping previous settings: {e}")
+                return self._data
+
+            previous = self._data
+            self._data = data
+            self._digest = digest
+            self._sections.clear()
+            self.version += 1
+            if previous is not None:
+                changed = changed_keys(previous, data)
+                logging.info(f"Configuration {os.path.basename(self.path)} changed: {', '.join(changed) or 'formatting only'}")
+
+        if changed:
+            self._notify(changed, data)
+        return data
+
+    # refresh() reads better at the top of a polling loop
+    refresh = get
+
+    # -------------------------------------------------------------------------
+    # section
+    # -------------------------------------------------------------------------
+    def section(self, name, defaults=None):
+        """
+        Returns one top-level section merged over `defaults`, with every value
+        converted to the type of its default. The result is cached until the
+        file changes; callers get their own copy.
+        Args:
+            name (str): Section name, e.g. "settings".
+            defaults (dict, optional): Fallback values, which also define the types.
+        """
+        data = self.get()
+        defaults = defaults or {}
+        key = (name, repr(sorted(defaults.items())))
+
+        with self._lock:
+            if key not in self._sections:
+                values = {**defaults, **((data or {}).get(name) or {})}
+                self._sections[key] = {
+                    field: _coerce(value, defaults.get(field)) for field, value in values.items()
+                }
+            return dict(self._sections[key])
+
+    # -------------------------------------------------------------------------
+    # subscribe / unsubscribe
+    # -------------------------------------------------------------------------
+    def subscribe(self, callback, prefix=None):
+        """
+        Calls `callback(changed_keys, config)` whenever a re-parse changes a key under `prefix`.
+        Notifications happen on the thread whose `get()` noticed the change.
+        Args:
+            callback (callable): Receives the list of changed dotted keys and the new config.
+            prefix (str, optional): Only keys equal to or below this one, e.g. "settings".
+        """
+        with self._lock:
+            self._subscribers.append((callback, prefix))
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [(cb, prefix) for cb, prefix in self._subscribers if cb != callback]
+
+    def _notify(self, changed, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for callback, prefix in subscribers:
+            keys = [key for key in changed if prefix is None or key == prefix or key.startswith(prefix + ".")]
+            if not keys:
+                continue
+            try:
+                callback(keys, data)
+            except Exception as e:
+                logging.error(f"Config subscriber {callback} failed: {e}")
@@ -14,39 +14,183 @@ import sys
 import time
 import json
 import os
-import yaml
 import logging
-from pymongo import MongoClient, errors
+import threading
+import itertools
+import pymongo
+from pymongo import MongoClient, ASCENDING, UpdateOne, errors
+from bson import ObjectId
 import getpass
-from datetime import datetime
+from datetime import datetime, timedelta
 
 script_path = os.path.dirname(os.path.abspath(__file__))
 _root = os.path.abspath(os.path.join(script_path, ".."))
 _get_config = os.path.join(_root, "config/config.yml").replace("\\", "/")
+sys.path.insert(0, script_path)
+
+from pulse_codec import PulseCodec, PulseNames, NAMES_COLLECTION
+from pulse_archive import PulseArchive
+from config_service import get_config
+from storage import StorageBackend
+from db_metrics import get_metrics, command_listeners
+from resilience import RESILIENCE_DEFAULTS, RetryPolicy, CircuitBreaker, CircuitOpenError, is_transient, retry_call
+
+# Connection pool defaults for the shared client
+DEFAULT_POOL_SETTINGS = {"max_pool_size": 20, "min_pool_size": 0, "max_idle_time_ms": 60000}
+
+# Explicit sessions used by no-timeout cursors expire after 30 minutes of inactivity
+SESSION_REFRESH_SECONDS = 5 * 60
+
+# Pulse statuses that count towards the daily_user_stats rollups
+PULSE_STATUSES = ("Active", "Inactive")
+
+# Indexes created by ensure_indexes: (collection, keys, create_index options)
+MANAGED_INDEXES = [
+    ("activity_pulse", [("username", ASCENDING), ("timestamp", ASCENDING)], {"name": "username_timestamp"}),
+    # Holds every field day_summary reads, so the day-end summary never fetches a document
+    ("activity_pulse", [("username", ASCENDING), ("hostname", ASCENDING), ("timestamp", ASCENDING),
+                        ("active_time", ASCENDING), ("inactive_time", ASCENDING)], {"name": "day_summary"}),
+    # The archive job walks days across all users; without it each step is a collection scan
+    ("activity_pulse", [("timestamp", ASCENDING)], {"name": "timestamp"}),
+    ("session_summaries", [("username", ASCENDING), ("timestamp", ASCENDING)], {"name": "username_timestamp"}),
+    ("daily_user_stats", [("username", ASCENDING), ("date", ASCENDING), ("hostname", ASCENDING)],
+     {"name": "username_date_hostname", "unique": True}),
+    ("activity_bitmaps", [("username", ASCENDING), ("date", ASCENDING)], {"name": "username_date", "unique": True}),
+]
+
+# Order of documents returned by get_daily_stats
+DAILY_STATS_SORT = [("date", ASCENDING), ("hostname", ASCENDING)]
+
+# $dateToString formats for rollup periods (None = one total per user)
+ROLLUP_FORMATS = {"day": "%Y-%m-%d", "month": "%Y-%m", "total": None}
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# =============================================================================
+# Shared MongoClient registry
+# =============================================================================
+# MongoClient is thread-safe and keeps its own connection pool, so every
+# MongoDatabase in a process shares one client per URI and the connection
+# setup (and ping) is paid once.
+_clients        = {}
+_clients_lock   = threading.Lock()
+
+
+def get_shared_client(uri, ping=True, **options):
+    """
+    Returns the process-wide MongoClient for `uri`, creating it on first use.
+    Args:
+        uri (str): MongoDB connection string; the registry key.
+        ping (bool): Test the connection when the client is created. Lazy callers skip it.
+        **options: MongoClient keyword options, only used when the client is created.
+    Returns:
+        MongoClient: The shared client.
+    """
+    with _clients_lock:
+        entry = _clients.get(uri)
+        if entry is None:
+            client = MongoClient(uri, **options)
+            if ping:
+                try:
+                    client.admin.command("ping")  # Test connection
+                except Exception:
+                    # Not registered yet; close it so its monitor threads and sockets do not leak
+                    client.close()
+                    raise
+            entry = _clients[uri] = {"client": client, "refs": 0}
+        entry["refs"] += 1
+        return entry["client"]
+
+
+def release_shared_client(uri):
+    """Drops one reference to the shared client and closes it when nobody uses it anymore."""
+    with _clients_lock:
+        entry = _clients.get(uri)
+        if entry is None:
+            return
+        entry["refs"] -= 1
+        if entry["refs"] <= 0:
+            entry["client"].close()
+            del _clients[uri]
+
 # =============================================================================
 # MongoDB Connection Class
 # =============================================================================
-class MongoDatabase:
+class MongoDatabase(StorageBackend):
     
     # -------------------------------------------------------------------------
     # _init_
     # -------------------------------------------------------------------------
-    def __init__(self):
-        """Initializes MongoDB connection using a YAML configuration file."""
+    def __init__(self, buffered=None, lazy=None):
+        """
+        Initializes MongoDB connection using a YAML configuration file.
+        Args:
+            buffered (bool, optional): Overrides `mongodb.write_buffer.enabled` from config.yml.
+                When enabled, pulses are queued in memory and written with `insert_many`.
+            lazy (bool, optional): Overrides `mongodb.lazy_connect` from config.yml.
+                When enabled, the constructor never blocks on the server; the first
+                operation connects and a background probe reports readiness.
+        """
         self.config_file            = _get_config
         self.client                 = None
         self.db_name                = None
         self.db                     = None
         self.activity_collection    = None
         self.summary_collection     = None
+        self.daily_stats_collection = None
+        self.bitmap_collection      = None
+        self.cursor_batch_size      = 1000
+        self.pool_settings          = dict(DEFAULT_POOL_SETTINGS)
+        self.uri                    = None
+        self.codec                  = PulseCodec()
+        self.pulse_layout           = "standard"
+        self.pulse_collection_name  = "activity_pulse"
+        self.timeseries_collection  = "activity_pulse_ts"
+        self.compact_collection     = "activity_pulse_compact"
+        self.archive                = None
+        self.archive_hot_days       = 90
+        self.timeseries_granularity = "seconds"
+        self.lazy                   = False
+        self.ready                  = threading.Event()  # set once the server answered a ping
+        self.connection_error       = None
         self.username               = getpass.getuser()  # Get current logged-in user
+        self.metrics                = get_metrics()      # process-wide latency/volume/error registry
+
+        # Write-path resilience; see resilience.py
+        self.retry_policy           = RetryPolicy()
+        self.breaker                = CircuitBreaker(name="MongoDB")
+        self.write_timeout          = RESILIENCE_DEFAULTS["write_timeout"]
+
+        # Buffered writer state
+        self.buffered               = False
+        self.buffer_max_size        = 100
+        self.buffer_flush_interval  = 30.0
+        self.buffer_max_pending     = 10000
+        self._buffer                = []
+        self._buffer_lock           = threading.Lock()
+        self._flush_wakeup          = threading.Event()
+        self._flush_thread          = None
+        self._closing               = False
+        self.flush_stats            = {
+            "batches": 0,
+            "documents": 0,
+            "errors": 0,
+            "last_latency": 0.0,
+            "max_latency": 0.0,
+            "total_latency": 0.0,
+        }
 
         self.load_config()
+        if buffered is not None:
+            self.buffered = buffered
+        if lazy is not None:
+            self.lazy = lazy
         self.connect()
+        get_config(self.config_file).subscribe(self._on_config_change, prefix="mongodb")
+
+        if self.buffered:
+            self._start_flush_thread()
 
     # -------------------------------------------------------------------------
     # load_config
@@ -54,11 +198,7 @@ class MongoDatabase:
     def load_config(self):
         """Loads MongoDB credentials from the YAML file."""
         try:
-            script_path = os.path.dirname(os.path.abspath(__file__))
-            config_path = os.path.join(script_path, self.config_file)
-
-            with open(config_path, "r") as file:
-                config = yaml.safe_load(file)
+            config = get_config(self.config_file).get()
 
             self.host       = config["mongodb"]["host"]
             self.port       = config["mongodb"]["port"]
@@ -67,6 +207,35 @@ class MongoDatabase:
             self.auth_db    = config["mongodb"]["auth_db"]
             self.db_name    = config["mongodb"]["db_name"]
 
+            self.lazy = bool(config["mongodb"].get("lazy_connect", False))
+            self.cursor_batch_size = int(config["mongodb"].get("cursor_batch_size", self.cursor_batch_size))
+            self.pool_settings = {**DEFAULT_POOL_SETTINGS, **(config["mongodb"].get("pool") or {})}
+
+            # Pulse storage layout; read APIs are the same for all of them
+            self.pulse_layout           = config["mongodb"].get("pulse_layout", self.pulse_layout)
+            self.timeseries_collection  = config["mongodb"].get("timeseries_collection", self.timeseries_collection)
+            self.timeseries_granularity = config["mongodb"].get("timeseries_granularity", self.timeseries_granularity)
+            self.compact_collection     = config["mongodb"].get("compact_collection", self.compact_collection)
+            self.pulse_collection_name  = {
+                "timeseries": self.timeseries_collection,
+                "compact": self.compact_collection,
+            }.get(self.pulse_layout, "activity_pulse")
+
+            # Raw pulses older than `hot_days` live in the file archive
+            archive = config.get("archive") or {}
+            if archive.get("enabled"):
+                self.archive = PulseArchive(archive["path"], archive.get("compression", "auto"))
+                self.archive_hot_days = int(archive.get("hot_days", self.archive_hot_days))
+
+            write_buffer = config["mongodb"].get("write_buffer") or {}
+            self.buffered = bool(write_buffer.get("enabled", False))
+            self.apply_buffer_settings(write_buffer)
+
+            resilience = {**RESILIENCE_DEFAULTS, **(config["mongodb"].get("resilience") or {})}
+            self.retry_policy = RetryPolicy(resilience["attempts"], resilience["base_delay"], resilience["max_delay"])
+            self.breaker = CircuitBreaker(resilience["failure_threshold"], resilience["reset_timeout"], name="MongoDB")
+            self.write_timeout = float(resilience["write_timeout"])
+
             logging.info("Configuration loaded successfully.")
 
         except FileNotFoundError:
@@ -76,110 +245,989 @@ class MongoDatabase:
         except Exception as e:
             raise RuntimeError(f"Error loading YAML configuration: {e}")
 
+    # -------------------------------------------------------------------------
+    # apply_buffer_settings
+    # -------------------------------------------------------------------------
+    def apply_buffer_settings(self, write_buffer):
+        """Applies `mongodb.write_buffer` sizes; safe to call while the flusher runs."""
+        self.buffer_max_size        = int(write_buffer.get("max_size", self.buffer_max_size))
+        self.buffer_flush_interval  = float(write_buffer.get("flush_interval", self.buffer_flush_interval))
+        self.buffer_max_pending     = int(write_buffer.get("max_pending", self.buffer_max_pending))
+
+    def _on_config_change(self, changed, config):
+        """Picks up write-buffer tuning live; connection settings need a restart."""
+        if any(key.startswith("mongodb.write_buffer.") for key in changed):
+            self.apply_buffer_settings(config["mongodb"].get("write_buffer") or {})
+            self._flush_wakeup.set()
+            logging.info("Write buffer settings reloaded.")
+        if any(not key.startswith("mongodb.write_buffer.") for key in changed):
+            logging.warning(f"MongoDB settings changed ({', '.join(changed)}); restart to apply them.")
+
     # -------------------------------------------------------------------------
     # connect
     # -------------------------------------------------------------------------
     def connect(self):
-        """Connects to MongoDB using the loaded configuration."""
+        """
+        Connects to MongoDB using the loaded configuration.
+        In lazy mode the client is created without a ping and `_probe_connection`
+        checks the server in the background.
+        """
         try:
             if self.username and self.password:
                 uri = f"mongodb://{self.username}:{self.password}@{self.host}:{self.port}/{self.auth_db}"
             else:
                 uri = f"mongodb://{self.host}:{self.port}/{self.auth_db}"
 
-            self.client = MongoClient(uri, serverSelectionTimeoutMS=5000)
-            self.client.admin.command("ping")  # Test connection
+            self.client = get_shared_client(
+                uri,
+                ping=not self.lazy,
+                serverSelectionTimeoutMS=5000,
+                maxPoolSize=self.pool_settings["max_pool_size"],
+                minPoolSize=self.pool_settings["min_pool_size"],
+                maxIdleTimeMS=self.pool_settings["max_idle_time_ms"],
+                event_listeners=command_listeners(),
+            )
+            self.uri = uri
 
             self.db = self.client[self.db_name]
-            self.activity_collection = self.db["activity_pulse"]
+            self.activity_collection = self.db[self.pulse_collection_name]
+            self.codec = self.build_codec(self.db, self.pulse_layout)
             self.summary_collection = self.db["session_summaries"]
-
-            logging.info(f"Connected to MongoDB successfully. Database: {self.db_name}")
+            self.daily_stats_collection = self.db["daily_user_stats"]
+            self.bitmap_collection = self.db["activity_bitmaps"]
 
         except errors.ServerSelectionTimeoutError:
             raise RuntimeError("MongoDB connection timeout! Please check your connection.")
         except Exception as e:
             raise RuntimeError(f"Error connecting to MongoDB: {e}")
 
+        if self.lazy:
+            threading.Thread(target=self._probe_connection, name="mongo-probe", daemon=True).start()
+            logging.info(f"MongoDB client created (lazy). Database: {self.db_name}")
+        else:
+            self.ready.set()
+            logging.info(f"Connected to MongoDB successfully. Database: {self.db_name}")
+
+    # -------------------------------------------------------------------------
+    # _probe_connection
+    # -------------------------------------------------------------------------
+    def _probe_connection(self, retry_interval=15):
+        """Pings the server in the background until it answers, then sets `ready`."""
+        while not self._closing and self.client:
+            try:
+                self.client.admin.command("ping")
+                self.connection_error = None
+                self.ready.set()
+                logging.info(f"Connected to MongoDB successfully. Database: {self.db_name}")
+                return
+            except Exception as e:
+                self.connection_error = e
+                logging.warning(f"MongoDB not reachable yet, retrying in {retry_interval}s: {e}")
+                time.sleep(retry_interval)
+
+    # -------------------------------------------------------------------------
+    # wait_until_ready
+    # -------------------------------------------------------------------------
+    def wait_until_ready(self, timeout=None):
+        """
+        Blocks until the server answered a ping.
+        Returns:
+            bool: True when connected, False if `timeout` expired first.
+        """
+        return self.ready.wait(timeout)
+
     # -------------------------------------------------------------------------
     # insert_pulse
     # -------------------------------------------------------------------------
     def insert_pulse(self, data):
-        """Inserts a log entry into the MongoDB collection."""
+        """
+        Inserts a log entry into the MongoDB collection.
+        In buffered mode the entry is queued and written by the next flush; the queue
+        holds at most `max_pending` pulses and hands the oldest to the fallback beyond that.
+        Otherwise the write is a single attempt bounded by `write_timeout`; while the
+        circuit breaker is open, or when the attempt fails, the pulse goes to the fallback.
+        """
+        if self.buffered:
+            with self._buffer_lock:
+                self._buffer.append(data)
+                overflow = self._buffer[:-self.buffer_max_pending]
+                if overflow:
+                    del self._buffer[:len(overflow)]
+                pending = len(self._buffer)
+            if overflow:
+                # A flusher that cannot keep up must not grow the queue without bound
+                self.hand_off(overflow)
+            if pending >= self.buffer_max_size:
+                self._flush_wakeup.set()
+            return
+
+        # Set before encoding: a write that landed and the spooled copy share the _id,
+        # so the replay is a harmless duplicate
+        data.setdefault("_id", ObjectId())
+        if not self.breaker.allow():
+            self.hand_off([data])
+            return
+
+        with self.metrics.track("insert_pulse") as operation:
+            try:
+                encoded = self.codec.encode(data)
+                operation.add(encoded)
+                with pymongo.timeout(self.write_timeout):
+                    self.activity_collection.insert_one(encoded)
+                self.breaker.record_success()
+                logging.info("Log inserted successfully.")
+            except Exception as e:
+                operation.fail(e)
+                logging.error(f"Database Error (insert_pulse): {e}")
+                if is_transient(e):
+                    self.breaker.record_failure()
+                    self.hand_off([data])
+                else:
+                    self.breaker.record_success()
+                return
+
+        self.update_daily_stats([data])
+
+    # -------------------------------------------------------------------------
+    # insert_pulses
+    # -------------------------------------------------------------------------
+    def insert_pulses(self, docs, retry=True):
+        """
+        Inserts several log entries with a single unordered bulk write.
+        Duplicate `_id` errors are ignored so that a batch can be safely replayed.
+        Transient failures are retried with jittered backoff, so call this from
+        background threads (flusher, spool drainer, CLI tools), not from agent loops.
+        Args:
+            docs (list): Pulse documents to insert.
+            retry (bool): Retry transient failures per `mongodb.resilience`.
+        Returns:
+            int: Number of documents actually inserted.
+        Raises:
+            CircuitOpenError: The server is known to be down; nothing was attempted.
+            pymongo.errors.PyMongoError: If the write fails for any other reason.
+        """
+        if not docs:
+            return 0
+        for doc in docs:
+            # Every attempt must write the same _ids (encoding copies the timeseries/compact documents)
+            doc.setdefault("_id", ObjectId())
+
+        attempts = {"inserted": {}, "unknown": set()}
         try:
-            self.activity_collection.insert_one(data)
-            logging.info("Log inserted successfully.")
+            return retry_call(self._insert_pulses, docs, attempts,
+                              policy=self.retry_policy if retry else None, breaker=self.breaker)
+        except Exception:
+            # Pulses a failed attempt did store are counted now; a later replay sees them as duplicates
+            self.update_daily_stats(list(attempts["inserted"].values()))
+            raise
+
+    def _insert_pulses(self, docs, attempts):
+        """
+        One bulk write of `docs`. `attempts` carries what earlier tries of the same
+        batch did: 'inserted' holds the pulses a partial BulkWriteError confirmed,
+        'unknown' the _ids of a try that failed without a result (e.g. a dropped
+        connection). Duplicates of those are this batch's own writes, not replays,
+        so the daily stats count every pulse the batch stored exactly once.
+        """
+        with self.metrics.track("insert_pulses") as operation:
+            pending = [doc for doc in docs if doc["_id"] not in attempts["inserted"]]
+            duplicates = []
+            if self.codec.timeseries:
+                # Time-series collections have no unique _id index; filter replays explicitly
+                new = self._drop_existing_pulses(pending)
+                new_ids = {doc["_id"] for doc in new}
+                duplicates = [doc for doc in pending if doc["_id"] not in new_ids]
+                pending = new
+
+            written = []
+            if pending:
+                encoded = [self.codec.encode(doc) for doc in pending]
+                operation.add(encoded)
+                try:
+                    self.activity_collection.insert_many(encoded, ordered=False)
+                    written = pending
+                except errors.BulkWriteError as e:
+                    write_errors = e.details.get("writeErrors", [])
+                    failed = {err["index"] for err in write_errors}
+                    written = [doc for index, doc in enumerate(pending) if index not in failed]
+                    if any(err.get("code") != 11000 for err in write_errors):
+                        attempts["inserted"].update((doc["_id"], doc) for doc in written)
+                        raise
+                    duplicates += [doc for index, doc in enumerate(pending) if index in failed]
+                except Exception:
+                    attempts["unknown"].update(doc["_id"] for doc in pending)
+                    raise
+
+            # Replayed duplicates were already counted in the daily stats
+            recovered = [doc for doc in duplicates if doc["_id"] in attempts["unknown"]]
+            inserted = list(attempts["inserted"].values()) + recovered + written
+            operation.documents = len(inserted)
+
+        self.update_daily_stats(inserted)
+        return len(inserted)
+
+    # -------------------------------------------------------------------------
+    # _drop_existing_pulses
+    # -------------------------------------------------------------------------
+    def _drop_existing_pulses(self, docs):
+        """Removes pulses whose `_id` is already stored (see `existing_pulses_query`)."""
+        query = self.existing_pulses_query(docs)
+        if query is None:
+            return docs
+
+        existing = {row["_id"] for row in self.activity_collection.find(query, {"_id": 1})}
+        return [doc for doc in docs if doc.get("_id") not in existing]
+
+    @staticmethod
+    def existing_pulses_query(docs):
+        """
+        Builds the lookup for already stored pulses of a batch. It is bounded by the
+        batch's time range so a time-series collection only opens matching buckets.
+        Returns:
+            dict | None: The filter, or None when no pulse carries an `_id` yet.
+        """
+        stamped = [doc for doc in docs if "_id" in doc and isinstance(doc.get("timestamp"), datetime)]
+        if not stamped:
+            return None
+
+        return {
+            "_id": {"$in": [doc["_id"] for doc in stamped]},
+            "timestamp": {
+                "$gte": min(doc["timestamp"] for doc in stamped),
+                "$lte": max(doc["timestamp"] for doc in stamped),
+            },
+        }
+
+    # -------------------------------------------------------------------------
+    # update_daily_stats
+    # -------------------------------------------------------------------------
+    def update_daily_stats(self, docs):
+        """
+        Folds newly inserted pulses into 'daily_user_stats' with atomic `$inc` upserts.
+        Failures are only logged; `rebuild_daily_stats` recomputes the rollups from raw pulses.
+        Args:
+            docs (list): Pulse documents that were just inserted.
+        """
+        operations = self.daily_stats_operations(docs)
+        if not operations:
+            return
+
+        with self.metrics.track("update_daily_stats") as operation:
+            operation.documents = len(operations)
+            try:
+                self.daily_stats_collection.bulk_write(operations, ordered=False)
+            except Exception as e:
+                operation.fail(e)
+                logging.error(f"Database Error (update_daily_stats): {e}")
+
+    # -------------------------------------------------------------------------
+    # daily_stats_operations
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def daily_stats_operations(docs):
+        """
+        Builds the upserts that fold pulses into 'daily_user_stats'.
+        Pulses for the same (username, hostname, date) are combined into one update.
+        Returns:
+            list: `UpdateOne` operations for `bulk_write`.
+        """
+        operations = []
+        for (u, h, d), totals in MongoDatabase.daily_stats_totals(docs).items():
+            increments = {"active_seconds": totals["active_seconds"], "inactive_seconds": totals["inactive_seconds"]}
+            for status, count in totals["transitions"].items():
+                increments[f"transitions.{status}"] = count
+            operations.append(UpdateOne({"username": u, "hostname": h, "date": d}, {
+                "$inc": increments,
+                "$min": {"first_seen": totals["first_seen"]},
+                "$max": {"last_seen": totals["last_seen"]},
+            }, upsert=True))
+        return operations
+
+    # -------------------------------------------------------------------------
+    # daily_stats_totals
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def daily_stats_totals(docs):
+        """
+        Sums pulses per (username, hostname, date); shared by every storage backend.
+        Only Active/Inactive pulses with a datetime timestamp count.
+        Returns:
+            dict: key -> {active_seconds, inactive_seconds, transitions, first_seen, last_seen}.
+        """
+        totals = {}
+        for doc in docs:
+            status = doc.get("status")
+            timestamp = doc.get("timestamp")
+            if status not in PULSE_STATUSES or not isinstance(timestamp, datetime):
+                continue
+
+            key = (doc.get("username"), doc.get("hostname"), timestamp.strftime("%Y-%m-%d"))
+            total = totals.setdefault(key, {
+                "active_seconds": 0,
+                "inactive_seconds": 0,
+                "transitions": {},
+                "first_seen": timestamp,
+                "last_seen": timestamp,
+            })
+            total["active_seconds"]         += doc.get("active_time") or 0
+            total["inactive_seconds"]       += doc.get("inactive_time") or 0
+            total["transitions"][status]    = total["transitions"].get(status, 0) + 1
+            total["first_seen"]             = min(total["first_seen"], timestamp)
+            total["last_seen"]              = max(total["last_seen"], timestamp)
+
+        return totals
+
+    # -------------------------------------------------------------------------
+    # flush
+    # -------------------------------------------------------------------------
+    def flush(self):
+        """
+        Writes all queued pulses with one `insert_many(ordered=False)` call.
+        On failure the batch is put back in front of the queue (bounded by `max_pending`).
+        Returns:
+            int: Number of documents inserted.
+        """
+        with self._buffer_lock:
+            batch, self._buffer = self._buffer, []
+
+        if not batch:
+            return 0
+
+        started = time.perf_counter()
+        try:
+            inserted = self.insert_pulses(batch)
+        except Exception as e:
+            self.flush_stats["errors"] += 1
+            if self.fallback is not None and (isinstance(e, CircuitOpenError) or is_transient(e)):
+                # The server is down; the spool keeps the batch on disk instead of in memory
+                self.hand_off(batch)
+                return 0
+            with self._buffer_lock:
+                self._buffer = (batch + self._buffer)[-self.buffer_max_pending:]
+            logging.error(f"Database Error (flush): {e}")
+            return 0
+
+        latency = time.perf_counter() - started
+        self.flush_stats["batches"]         += 1
+        self.flush_stats["documents"]       += inserted
+        self.flush_stats["last_latency"]    = latency
+        self.flush_stats["total_latency"]   += latency
+        self.flush_stats["max_latency"]     = max(self.flush_stats["max_latency"], latency)
+
+        logging.info(f"Flushed {inserted} pulses in {latency * 1000:.1f} ms.")
+        return inserted
+
+    # -------------------------------------------------------------------------
+    # hand_off
+    # -------------------------------------------------------------------------
+    def hand_off(self, docs):
+        """Passes pulses that cannot be written now to the fallback sink, or drops them with an error."""
+        if self.fallback is None:
+            logging.error(f"MongoDB unavailable and no fallback configured; {len(docs)} pulses dropped.")
+            return
+        try:
+            for doc in docs:
+                self.fallback.append(doc)
+            logging.info(f"MongoDB unavailable; {len(docs)} pulses handed to the fallback.")
         except Exception as e:
-            logging.error(f"Database Error (insert_pulse): {e}")
+            logging.error(f"Fallback write failed, {len(docs)} pulses dropped: {e}")
+
+    # -------------------------------------------------------------------------
+    # _start_flush_thread
+    # -------------------------------------------------------------------------
+    def _start_flush_thread(self):
+        """Starts the background thread that flushes the buffer on size or interval."""
+        self._flush_thread = threading.Thread(target=self._flush_loop, name="pulse-flusher", daemon=True)
+        self._flush_thread.start()
+
+    # -------------------------------------------------------------------------
+    # _flush_loop
+    # -------------------------------------------------------------------------
+    def _flush_loop(self):
+        """Flushes every `flush_interval` seconds, or sooner when `max_size` is reached."""
+        while not self._closing:
+            self._flush_wakeup.wait(self.buffer_flush_interval)
+            self._flush_wakeup.clear()
+            if self._closing:
+                break
+            self.flush()
 
     # -------------------------------------------------------------------------
     # insert_summary
     # -------------------------------------------------------------------------
     def insert_summary(self, data):
         """Inserts a session summary into the MongoDB collection."""
+        with self.metrics.track("insert_summary") as operation:
+            try:
+                operation.add(data)
+                self.summary_collection.insert_one(data)
+                logging.info("Summary inserted successfully.")
+            except Exception as e:
+                operation.fail(e)
+                logging.error(f"Database Error (summary_collections): {e}")
+
+    # ------------------------------------------------------------------------
+    # build_codec
+    # ------------------------------------------------------------------------
+    @staticmethod
+    def build_codec(db, layout):
+        """Returns the PulseCodec for `layout`; the compact layout gets the name dictionary of `db`."""
+        if layout == "compact":
+            return PulseCodec(layout, names=PulseNames(db[NAMES_COLLECTION]))
+        return PulseCodec(layout)
+
+    # ------------------------------------------------------------------------
+    # ensure_indexes
+    # ------------------------------------------------------------------------
+    def ensure_indexes(self):
+        """
+        Creates the compound {username, timestamp} indexes used by the filtered queries,
+        and the unique (username, hostname, date) key of 'daily_user_stats'.
+        Safe to call repeatedly; MongoDB ignores indexes that already exist.
+        """
+        if self.codec.timeseries:
+            self.ensure_timeseries_collection()
+        if self.codec.compact:
+            self.codec.names.ensure_index()
+
+        for collection_name, keys, options in MANAGED_INDEXES:
+            if collection_name == "activity_pulse":
+                self.activity_collection.create_index(self.codec.sort(keys), **options)
+            else:
+                self.db[collection_name].create_index(keys, **options)
+        logging.info("MongoDB indexes ensured.")
+
+    # ------------------------------------------------------------------------
+    # ensure_timeseries_collection
+    # ------------------------------------------------------------------------
+    def ensure_timeseries_collection(self, name=None):
+        """
+        Creates the time-series pulse collection (timeField=timestamp, metaField=meta)
+        if it does not exist yet.
+        Args:
+            name (str, optional): Collection name. Defaults to `mongodb.timeseries_collection`.
+        """
+        name = name or self.timeseries_collection
+        if name in self.db.list_collection_names(filter={"name": name}):
+            return
+        self.db.create_collection(name, timeseries=PulseCodec.timeseries_options(self.timeseries_granularity))
+        logging.info(f"Created time-series collection '{name}'.")
+
+    # ------------------------------------------------------------------------
+    # build_query
+    # ------------------------------------------------------------------------
+    @staticmethod
+    def build_query(username=None, hostname=None, start=None, end=None, query=None):
+        """
+        Builds a MongoDB filter from the common pulse/summary criteria.
+        Args:
+            username (str, optional): Only documents for this user.
+            hostname (str, optional): Only documents from this host.
+            start (datetime, optional): Inclusive lower bound on `timestamp`.
+            end (datetime, optional): Inclusive upper bound on `timestamp`.
+            query (dict, optional): Extra filter merged into the result.
+        Returns:
+            dict: The MongoDB query filter.
+        """
+        query = dict(query or {})
+        if username:
+            query["username"] = username
+        if hostname:
+            query["hostname"] = hostname
+        if start or end:
+            time_range = {}
+            if start:
+                time_range["$gte"] = start
+            if end:
+                time_range["$lte"] = end
+            query["timestamp"] = time_range
+        return query
+
+    # ------------------------------------------------------------------------
+    # _iter_cursor
+    # ------------------------------------------------------------------------
+    def _iter_cursor(self, collection, query, projection, sort, limit, batch_size,
+                     no_cursor_timeout, datetime_fields, decode=None, operation="find"):
+        """
+        Yields documents from a `find()` cursor one batch at a time.
+        The cursor (and the explicit session a no-timeout cursor needs) is always
+        closed, even when the caller stops iterating early. The time spent in the
+        cursor is recorded as `operation` once iteration ends.
+        """
+        session = self.client.start_session() if no_cursor_timeout else None
+        cursor = collection.find(
+            query,
+            projection,
+            limit=limit,
+            batch_size=batch_size or self.cursor_batch_size,
+            no_cursor_timeout=no_cursor_timeout,
+            session=session,
+        )
+        if sort:
+            cursor = cursor.sort(sort)
+
+        last_refresh = time.monotonic()
         try:
-            self.summary_collection.insert_one(data)
-            logging.info("Summary inserted successfully.")
-        except Exception as e:
-            logging.error(f"Database Error (summary_collections): {e}")
+            for doc in self.metrics.track_iter(operation, cursor):
+                if decode:
+                    doc = decode(doc)
+                # Convert BSON datetime to Python datetime if necessary
+                for field in datetime_fields:
+                    if field in doc and not isinstance(doc[field], datetime):
+                        doc[field] = doc[field].to_datetime()
+                yield doc
+
+                # Keep the server session alive; otherwise it expires after 30 minutes
+                if session and time.monotonic() - last_refresh > SESSION_REFRESH_SECONDS:
+                    self.client.admin.command("refreshSessions", [session.session_id], session=session)
+                    last_refresh = time.monotonic()
+        finally:
+            cursor.close()
+            if session:
+                session.end_session()
+
+    # ------------------------------------------------------------------------
+    # iter_logs
+    # ------------------------------------------------------------------------
+    def iter_logs(self, username=None, hostname=None, start=None, end=None, query=None,
+                  projection=None, sort=None, limit=0, batch_size=None, no_cursor_timeout=False,
+                  include_archive=True):
+        """
+        Streams logs from 'activity_pulse' without holding the result set in memory.
+        When the archive is enabled, archived days inside the range are merged in:
+        they come before (or, for a descending timestamp sort, after) the pulses
+        still in MongoDB, which only ever hold the newer days.
+        Args:
+            username, hostname, start, end, query: See `build_query`.
+            projection (dict or list, optional): Fields to return.
+            sort (list, optional): Sort specification.
+            limit (int, optional): Maximum number of documents, 0 for no limit.
+            batch_size (int, optional): Documents per server round trip. Defaults to `mongodb.cursor_batch_size`.
+            no_cursor_timeout (bool, optional): Keep the cursor open for slow consumers such as exports.
+            include_archive (bool, optional): Merge in archived days. The archive job itself passes False.
+        Yields:
+            dict: Log documents.
+        """
+        stored_query = self.codec.query(self.build_query(username, hostname, start, end, query))
+        hot = self._iter_cursor(
+            self.activity_collection, stored_query, self.codec.projection(projection), self.codec.sort(sort),
+            limit, batch_size, no_cursor_timeout, ("timestamp",), decode=self.codec.decode,
+            operation="iter_logs",
+        )
+        if not include_archive or not self.archive or not self.archive.days(start, end):
+            return hot
+
+        descending = bool(sort) and sort[0][0] == "timestamp" and sort[0][1] < 0
+        archived = self.archive.iter_pulses(username, hostname, start, end, query, projection, descending)
+        merged = itertools.chain(hot, archived) if descending else itertools.chain(archived, hot)
+        return itertools.islice(merged, limit) if limit else merged
+
+    # ------------------------------------------------------------------------
+    # latest_pulse_marker
+    # ------------------------------------------------------------------------
+    def latest_pulse_marker(self, username=None, hostname=None):
+        """
+        Identifies the newest stored pulse with one find_one on the
+        username/timestamp index. Any insert for the user changes the marker,
+        which makes it a cheap freshness check for cached query results.
+        Returns:
+            tuple | None: (timestamp, _id) of the newest pulse, or None if there is none.
+        """
+        timestamp = self.codec.field("timestamp")
+        with self.metrics.track("latest_pulse_marker"):
+            doc = self.activity_collection.find_one(
+                self.codec.query(self.build_query(username, hostname)),
+                {"_id": 1, timestamp: 1},
+                sort=self.codec.sort([("timestamp", -1)]),
+            )
+        if doc is None:
+            return None
+        return doc.get(timestamp), doc["_id"]
+
+    # ------------------------------------------------------------------------
+    # iter_summaries
+    # ------------------------------------------------------------------------
+    def iter_summaries(self, username=None, hostname=None, start=None, end=None, query=None,
+                       projection=None, sort=None, limit=0, batch_size=None, no_cursor_timeout=False):
+        """
+        Streams session summaries from 'session_summaries'.
+        Args:
+            See `iter_logs`.
+        Yields:
+            dict: Summary documents.
+        """
+        query = self.build_query(username, hostname, start, end, query)
+        return self._iter_cursor(
+            self.summary_collection, query, projection, sort, limit, batch_size,
+            no_cursor_timeout, ("start_time", "end_time"), operation="iter_summaries",
+        )
+
+    # ------------------------------------------------------------------------
+    # find_logs
+    # ------------------------------------------------------------------------
+    def find_logs(self, username=None, hostname=None, start=None, end=None,
+                  projection=None, sort=None, limit=0):
+        """
+        Fetch logs from 'activity_pulse' with all filtering done by MongoDB.
+        Args:
+            username, hostname, start, end: See `build_query`.
+            projection (dict or list, optional): Fields to return.
+            sort (list, optional): Sort specification. Defaults to timestamp ascending.
+            limit (int, optional): Maximum number of documents, 0 for no limit.
+        Returns:
+            list: A list of log documents.
+        """
+        return list(self.iter_logs(
+            username, hostname, start, end,
+            projection=projection, sort=sort or [("timestamp", ASCENDING)], limit=limit,
+        ))
+
+    # ------------------------------------------------------------------------
+    # find_summaries
+    # ------------------------------------------------------------------------
+    def find_summaries(self, username=None, hostname=None, start=None, end=None,
+                       projection=None, sort=None, limit=0):
+        """
+        Fetch session summaries from 'session_summaries' with all filtering done by MongoDB.
+        Args:
+            See `find_logs`.
+        Returns:
+            list: A list of summary documents.
+        """
+        return list(self.iter_summaries(
+            username, hostname, start, end,
+            projection=projection, sort=sort or [("timestamp", ASCENDING)], limit=limit,
+        ))
 
     # ------------------------------------------------------------------------
     # get_logs
     # ------------------------------------------------------------------------
-    def get_logs(self, query=None):
+    def get_logs(self, query=None, projection=None, sort=None, limit=0):
         """
         Fetch logs from 'activity_logs' collection based on an optional query.
         Args:
             query (dict, optional): MongoDB query filter. Defaults to {}.
+            projection (dict or list, optional): Fields to return.
+            sort (list, optional): Sort specification.
+            limit (int, optional): Maximum number of documents, 0 for no limit.
         Returns:
             list: A list of log documents.
         """
-        if query is None:
-            query = {}
-
-        # Fetch data from 'activity_logs' collection
-        logs = list(self.activity_collection.find(query))
-
-        # Convert BSON datetime to Python datetime if necessary
-        for log in logs:
-            if 'timestamp' in log and not isinstance(log['timestamp'], datetime):
-                log['timestamp'] = log['timestamp'].to_datetime()
-
-        return logs
+        return list(self.iter_logs(query=query, projection=projection, sort=sort, limit=limit))
 
     # ------------------------------------------------------------------------
     # get_summaries
     # ------------------------------------------------------------------------
-    def get_summaries(self, query=None):
+    def get_summaries(self, query=None, projection=None, sort=None, limit=0):
         """
         Fetch session summaries from 'session_summaries' collection based on an optional query.
         Args:
             query (dict, optional): MongoDB query filter. Defaults to {}.
+            projection (dict or list, optional): Fields to return.
+            sort (list, optional): Sort specification.
+            limit (int, optional): Maximum number of documents, 0 for no limit.
         Returns:
             list: A list of summary documents.
         """
-        if query is None:
-            query = {}
+        return list(self.iter_summaries(query=query, projection=projection, sort=sort, limit=limit))
+
+    # ------------------------------------------------------------------------
+    # rollup_activity
+    # ------------------------------------------------------------------------
+    def rollup_activity(self, start=None, end=None, username=None, hostname=None, granularity="day"):
+        """
+        Sums active and inactive seconds per user and period inside MongoDB,
+        so only the totals travel over the network.
+        Args:
+            start (datetime, optional): Inclusive lower bound on `timestamp`.
+            end (datetime, optional): Inclusive upper bound on `timestamp`.
+            username (str, optional): Restrict the rollup to one user.
+            hostname (str, optional): Restrict the rollup to one host.
+            granularity (str, optional): "day", "month" or "total".
+        Returns:
+            list: Dicts with username, period, active_seconds and inactive_seconds,
+                  sorted by username and period.
+        Note:
+            Only pulses still in MongoDB are aggregated; use `get_daily_stats` for archived days.
+        """
+        pipeline = self.rollup_pipeline(start, end, username, hostname, granularity, codec=self.codec)
+        with self.metrics.track("rollup_activity") as operation:
+            rows = [self.rollup_row(row) for row in self.activity_collection.aggregate(pipeline)]
+            operation.documents = len(rows)
+        return rows
+
+    # ------------------------------------------------------------------------
+    # rollup_pipeline
+    # ------------------------------------------------------------------------
+    @classmethod
+    def rollup_pipeline(cls, start=None, end=None, username=None, hostname=None, granularity="day", codec=None):
+        """Builds the $match/$group pipeline behind `rollup_activity` for the given pulse layout."""
+        if granularity not in ROLLUP_FORMATS:
+            raise ValueError(f"Unknown rollup granularity: {granularity}")
 
-        # Fetch data from 'session_summaries' collection
-        summaries = list(self.summary_collection.find(query))
+        codec = codec or PulseCodec()
+        group_key = {"username": codec.expr("username")}
+        if ROLLUP_FORMATS[granularity]:
+            group_key["period"] = {
+                "$dateToString": {"format": ROLLUP_FORMATS[granularity], "date": codec.expr("timestamp")}
+            }
 
-        # Convert BSON datetime to Python datetime if necessary
-        for summary in summaries:
-            if 'start_time' in summary and not isinstance(summary['start_time'], datetime):
-                summary['start_time'] = summary['start_time'].to_datetime()
-            if 'end_time' in summary and not isinstance(summary['end_time'], datetime):
-                summary['end_time'] = summary['end_time'].to_datetime()
+        return [
+            {"$match": codec.query(cls.build_query(username, hostname, start, end))},
+            {"$group": {
+                "_id": group_key,
+                "active_seconds": {"$sum": codec.expr("active_time")},
+                "inactive_seconds": {"$sum": codec.expr("inactive_time")},
+            }},
+            *codec.name_stages(["_id.username"]),
+            {"$sort": {"_id.username": 1, "_id.period": 1}},
+        ]
 
-        return summaries
+    # ------------------------------------------------------------------------
+    # rollup_row
+    # ------------------------------------------------------------------------
+    @staticmethod
+    def rollup_row(row):
+        """Flattens one `$group` result of `rollup_pipeline`."""
+        return {
+            "username": row["_id"].get("username"),
+            "period": row["_id"].get("period"),
+            "active_seconds": row["active_seconds"],
+            "inactive_seconds": row["inactive_seconds"],
+        }
+
+    # ------------------------------------------------------------------------
+    # day_summary
+    # ------------------------------------------------------------------------
+    def day_summary(self, username, hostname, day):
+        """
+        Totals of one user's pulses from one host on one day, for the agent's day-end summary.
+        The pipeline only walks that user's entries of the 'day_summary' index, which holds
+        every field it reads, so its cost does not grow with the number of users.
+        Args:
+            username (str): User of the agent.
+            hostname (str): Host of the agent.
+            day (date): Day to summarise.
+        Returns:
+            dict: username, hostname, date, active_seconds, inactive_seconds, pulses, first_seen, last_seen.
+        """
+        pipeline = self.day_summary_pipeline(username, hostname, day, codec=self.codec)
+        with self.metrics.track("day_summary"):
+            row = next(self.activity_collection.aggregate(pipeline), None)
+        return self.day_summary_row(username, hostname, day, row)
+
+    # ------------------------------------------------------------------------
+    # day_summary_pipeline
+    # ------------------------------------------------------------------------
+    @classmethod
+    def day_summary_pipeline(cls, username, hostname, day, codec=None):
+        """Builds the index-covered $match/$group pipeline behind `day_summary`."""
+        codec = codec or PulseCodec()
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=1) - timedelta(microseconds=1)
+        timestamp = codec.expr("timestamp")
+        return [
+            {"$match": codec.query(cls.build_query(username, hostname, start, end))},
+            {"$group": {
+                "_id": None,
+                "active_seconds": {"$sum": codec.expr("active_time")},
+                "inactive_seconds": {"$sum": codec.expr("inactive_time")},
+                "pulses": {"$sum": 1},
+                "first_seen": {"$min": timestamp},
+                "last_seen": {"$max": timestamp},
+            }},
+        ]
+
+    # ------------------------------------------------------------------------
+    # day_summary_row
+    # ------------------------------------------------------------------------
+    @staticmethod
+    def day_summary_row(username, hostname, day, row):
+        """Shapes a `day_summary` result; a day without pulses gives zero totals."""
+        row = row or {}
+        return {
+            "username": username,
+            "hostname": hostname,
+            "date": day.strftime("%Y-%m-%d"),
+            "active_seconds": row.get("active_seconds") or 0,
+            "inactive_seconds": row.get("inactive_seconds") or 0,
+            "pulses": row.get("pulses") or 0,
+            "first_seen": row.get("first_seen"),
+            "last_seen": row.get("last_seen"),
+        }
+
+    # ------------------------------------------------------------------------
+    # get_daily_stats
+    # ------------------------------------------------------------------------
+    def get_daily_stats(self, username=None, hostname=None, start_date=None, end_date=None):
+        """
+        Fetch per-day rollups from 'daily_user_stats'.
+        Args:
+            username (str, optional): Only rollups for this user.
+            hostname (str, optional): Only rollups from this host.
+            start_date (date, optional): First day to include.
+            end_date (date, optional): Last day to include.
+        Returns:
+            list: Rollup documents sorted by date.
+        """
+        query = self.build_daily_stats_query(username, hostname, start_date, end_date)
+        with self.metrics.track("get_daily_stats") as operation:
+            stats = list(self.daily_stats_collection.find(query, {"_id": 0}).sort(DAILY_STATS_SORT))
+            operation.documents = len(stats)
+        return stats
+
+    # ------------------------------------------------------------------------
+    # build_daily_stats_query
+    # ------------------------------------------------------------------------
+    @staticmethod
+    def build_daily_stats_query(username=None, hostname=None, start_date=None, end_date=None):
+        """Builds the 'daily_user_stats' filter used by `get_daily_stats`."""
+        query = {}
+        if username:
+            query["username"] = username
+        if hostname:
+            query["hostname"] = hostname
+        if start_date or end_date:
+            query["date"] = {}
+            if start_date:
+                query["date"]["$gte"] = start_date.strftime("%Y-%m-%d")
+            if end_date:
+                query["date"]["$lte"] = end_date.strftime("%Y-%m-%d")
+        return query
+
+    # ------------------------------------------------------------------------
+    # rebuild_daily_stats
+    # ------------------------------------------------------------------------
+    def rebuild_daily_stats(self, start=None, end=None, username=None):
+        """
+        Recomputes 'daily_user_stats' from raw pulses with one aggregation that
+        `$merge`s the results back, replacing the affected day documents.
+        Args:
+            start (datetime, optional): Inclusive lower bound on `timestamp`; use a day boundary.
+            end (datetime, optional): Inclusive upper bound on `timestamp`; use a day boundary.
+            username (str, optional): Only rebuild this user's rollups.
+        """
+        self.ensure_indexes()
+
+        match = self.build_query(username, None, start, end)
+        match["status"] = {"$in": list(PULSE_STATUSES)}
+        match = self.codec.query(match)
+
+        codec = self.codec
+        timestamp = codec.expr("timestamp")
+        status = codec.expr("status")
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": {
+                    "username": codec.expr("username"),
+                    "hostname": codec.expr("hostname"),
+                    "date": {"$dateToString": {"format": "%Y-%m-%d", "date": timestamp}},
+                },
+                "active_seconds": {"$sum": codec.expr("active_time")},
+                "inactive_seconds": {"$sum": codec.expr("inactive_time")},
+                "first_seen": {"$min": timestamp},
+                "last_seen": {"$max": timestamp},
+                "active_transitions": {
+                    "$sum": {"$cond": [{"$eq": [status, codec.encode_value("status", "Active")]}, 1, 0]}
+                },
+                "inactive_transitions": {
+                    "$sum": {"$cond": [{"$eq": [status, codec.encode_value("status", "Inactive")]}, 1, 0]}
+                },
+            }},
+            *codec.name_stages(["_id.username", "_id.hostname"]),
+            {"$project": {
+                "_id": 0,
+                "username": "$_id.username",
+                "hostname": "$_id.hostname",
+                "date": "$_id.date",
+                "active_seconds": 1,
+                "inactive_seconds": 1,
+                "first_seen": 1,
+                "last_seen": 1,
+                "transitions": {"Active": "$active_transitions", "Inactive": "$inactive_transitions"},
+            }},
+            {"$merge": {
+                "into": self.daily_stats_collection.name,
+                "on": ["username", "date", "hostname"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert",
+            }},
+        ]
+
+        with self.metrics.track("rebuild_daily_stats"):
+            self.activity_collection.aggregate(pipeline, allowDiskUse=True)
+        logging.info("daily_user_stats rebuilt from raw pulses.")
+
+    # ------------------------------------------------------------------------
+    # save_bitmaps / load_bitmaps
+    # ------------------------------------------------------------------------
+    def save_bitmaps(self, rows):
+        """
+        Upserts per-minute activity bitmaps into 'activity_bitmaps', one document per
+        (username, date) holding the 180-byte bitmap as BSON binary.
+        Args:
+            rows (list): Dicts with username, date, bits and active_minutes.
+        """
+        if not rows:
+            return
+        operations = [
+            UpdateOne({"username": row["username"], "date": row["date"]}, {"$set": {
+                "bits": row["bits"],
+                "active_minutes": row["active_minutes"],
+                "updated": datetime.now(),
+            }}, upsert=True)
+            for row in rows
+        ]
+        with self.metrics.track("save_bitmaps") as operation:
+            operation.documents = len(operations)
+            try:
+                self.bitmap_collection.bulk_write(operations, ordered=False)
+            except Exception as e:
+                operation.fail(e)
+                logging.error(f"Database Error (save_bitmaps): {e}")
+                raise
+
+    def load_bitmaps(self, usernames=None, start_date=None, end_date=None):
+        """
+        Fetch activity bitmaps from 'activity_bitmaps'.
+        Args:
+            usernames (list, optional): Only these users.
+            start_date (date, optional): First day to include.
+            end_date (date, optional): Last day to include.
+        Returns:
+            list: Rows with username, date, bits (bytes) and active_minutes, sorted by date.
+        """
+        query = self.build_daily_stats_query(None, None, start_date, end_date)
+        if usernames:
+            query["username"] = {"$in": list(usernames)}
+        with self.metrics.track("load_bitmaps") as operation:
+            rows = list(self.bitmap_collection.find(
+                query, {"_id": 0, "username": 1, "date": 1, "bits": 1, "active_minutes": 1}
+            ).sort([("date", ASCENDING), ("username", ASCENDING)]))
+            operation.documents = len(rows)
+        for row in rows:
+            row["bits"] = bytes(row["bits"])
+        return rows
 
     # ------------------------------------------------------------------------
     # close 
     # ------------------------------------------------------------------------
     def close(self):
-        """Closes the MongoDB connection."""
+        """Flushes any queued pulses and closes the MongoDB connection."""
+        get_config(self.config_file).unsubscribe(self._on_config_change)
+        self._closing = True
+        self._flush_wakeup.set()
+        if self._flush_thread:
+            self._flush_thread.join(timeout=self.buffer_flush_interval)
+            self._flush_thread = None
+
+        if self.client and self._buffer:
+            self.flush()
+
         if self.client:
-            self.client.close()
+            release_shared_client(self.uri)
+            self.client = None
             logging.info("MongoDB connection closed successfully.")
 
     # ------------------------------------------------------------------------
@@ -193,5 +1241,5 @@ class MongoDatabase:
     # __exit__
     # ------------------------------------------------------------------------
     def __exit__(self, exc_type, exc_value, traceback):
-        """Closes the connection when exiting `with` statement."""
+        """Flushes queued pulses and closes the connection when exiting `with` statement."""
         self.close()
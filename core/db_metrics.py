@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+# db_metrics.py - Latency, volume and error metrics for the data layer
+# Author: Sanja
+
+# Heart Beat Application - Database Metrics
+# One process-wide registry collects, per data-layer operation (insert_pulses,
+# iter_logs, rollup_activity, ...): a latency histogram, call, document, byte
+# and error counters. A pymongo CommandListener adds the same per server command
+# and keeps the slowest recent commands together with their filters.
+# The registry can be written to a JSON or Prometheus text file on a timer
+# (`metrics.dump_path` in config.yml), e.g. for node_exporter's textfile collector.
+# =============================================================================
+# Imports
+# =============================================================================
+import os
+import sys
+import json
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+import bson
+from bson import json_util
+from pymongo import monitoring
+
+script_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, script_path)
+
+from config_service import get_config
+
+# Upper bounds of the latency buckets in milliseconds; a last +Inf bucket is implied
+LATENCY_BUCKETS_MS  = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+METRICS_DEFAULTS    = {
+    "enabled": True,
+    "track_bytes": False,
+    "dump_path": "",
+    "dump_format": "auto",
+    "dump_interval": 60,
+    "slow_command_ms": 250,
+    "slow_command_keep": 50,
+}
+FILTER_FIELDS       = {"find": "filter", "count": "query", "distinct": "query", "findAndModify": "query",
+                       "aggregate": "pipeline"}
+MAX_FILTER_CHARS    = 1000
+
+_metrics            = None
+_metrics_lock       = threading.Lock()
+
+
+def get_metrics():
+    """Returns the process-wide Metrics registry, configured from `metrics` in config.yml on first use."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            try:
+                settings = get_config().section("metrics", METRICS_DEFAULTS)
+            except Exception as e:
+                logging.error(f"Failed to load metrics settings: {e}")
+                settings = dict(METRICS_DEFAULTS)
+            _metrics = Metrics(
+                enabled=settings["enabled"],
+                track_bytes=settings["track_bytes"],
+                slow_command_ms=settings["slow_command_ms"],
+                slow_command_keep=settings["slow_command_keep"],
+            )
+            if settings["enabled"] and settings["dump_path"]:
+                _metrics.start_dumper(settings["dump_path"], settings["dump_interval"], settings["dump_format"])
+        return _metrics
+
+
+def command_filter(name, command):
+    """Returns the filter part of a server command as (truncated) extended JSON, or None."""
+    if name in FILTER_FIELDS:
+        value = command.get(FILTER_FIELDS[name])
+    elif name == "update":
+        value = [update.get("q") for update in command.get("updates", [])]
+    elif name == "delete":
+        value = [delete.get("q") for delete in command.get("deletes", [])]
+    else:
+        return None
+    if value is None:
+        return None
+    text = json_util.dumps(value)
+    return text if len(text) <= MAX_FILTER_CHARS else text[:MAX_FILTER_CHARS] + "..."
+
+
+# =============================================================================
+# Histogram Class
+# =============================================================================
+class Histogram:
+    """Fixed-bucket latency histogram in milliseconds."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds     = bounds
+        self.buckets    = [0] * (len(bounds) + 1)
+        self.count      = 0
+        self.total      = 0.0
+        self.max        = 0.0
+
+    def observe(self, ms):
+        index = 0
+        while index < len(self.bounds) and ms > self.bounds[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation (the maximum for the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum_ms": round(self.total, 3),
+            "max_ms": round(self.max, 3),
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": {str(bound): count for bound, count in zip(self.bounds + ("+Inf",), self.buckets)},
+        }
+
+
+# =============================================================================
+# Operation Class
+# =============================================================================
+class Operation:
+    """Handle for one timed operation; the caller adds documents and marks failures."""
+    __slots__ = ("track_bytes", "documents", "bytes", "error")
+
+    def __init__(self, track_bytes=False):
+        self.track_bytes    = track_bytes
+        self.documents      = 0
+        self.bytes          = 0
+        self.error          = None
+
+    def add(self, docs):
+        """Counts documents (a dict or a list of dicts) and, if enabled, their BSON size."""
+        docs = [docs] if isinstance(docs, dict) else docs
+        self.documents += len(docs)
+        if self.track_bytes:
+            self.bytes += sum(len(bson.encode(doc)) for doc in docs)
+
+    def fail(self, error):
+        self.error = error
+
+
+# =============================================================================
+# Metrics Class
+# =============================================================================
+class Metrics:
+
+    # -------------------------------------------------------------------------
+    # _init_
+    # -------------------------------------------------------------------------
+    def __init__(self, enabled=True, track_bytes=False, slow_command_ms=250, slow_command_keep=50):
+        self.enabled            = enabled
+        self.track_bytes        = track_bytes
+        self.slow_command_ms    = slow_command_ms
+        self.started_at         = datetime.now()
+        self.operations         = {}    # name -> {"latency": Histogram, calls, documents, bytes, errors}
+        self.commands           = {}    # server command name -> same shape
+        self.slow_commands      = deque(maxlen=slow_command_keep)
+        self._lock              = threading.Lock()
+        self._dumper            = None
+        self._stop_dumper       = threading.Event()
+
+    @staticmethod
+    def _new_entry():
+        return {"latency": Histogram(), "calls": 0, "documents": 0, "bytes": 0, "errors": 0}
+
+    # -------------------------------------------------------------------------
+    # record
+    # -------------------------------------------------------------------------
+    def record(self, name, seconds, documents=0, nbytes=0, error=False, table=None):
+        """Adds one finished operation to the registry."""
+        if not self.enabled:
+            return
+        with self._lock:
+            entries = self.operations if table is None else table
+            entry = entries.get(name)
+            if entry is None:
+                entry = entries[name] = self._new_entry()
+            entry["latency"].observe(seconds * 1000)
+            entry["calls"] += 1
+            entry["documents"] += documents
+            entry["bytes"] += nbytes
+            entry["errors"] += 1 if error else 0
+
+    # -------------------------------------------------------------------------
+    # track
+    # -------------------------------------------------------------------------
+    @contextmanager
+    def track(self, name):
+        """
+        Times the block as operation `name`. Exceptions are counted as errors and re-raised;
+        errors the block handles itself are reported with `operation.fail(e)`.
+        Yields:
+            Operation: Add documents with `operation.add(docs)` or set `operation.documents`.
+        """
+        operation = Operation(self.enabled and self.track_bytes)
+        started = time.perf_counter()
+        try:
+            yield operation
+        except BaseException as e:
+            operation.fail(e)
+            raise
+        finally:
+            self.record(name, time.perf_counter() - started, operation.documents, operation.bytes,
+                        operation.error is not None)
+
+    # -------------------------------------------------------------------------
+    # track_iter
+    # -------------------------------------------------------------------------
+    def track_iter(self, name, iterable):
+        """
+        Yields from `iterable`, timing only the time spent inside it (not the consumer's),
+        and records one operation with the documents yielded when iteration ends.
+        """
+        if not self.enabled:
+            yield from iterable
+            return
+
+        operation = Operation(self.track_bytes)
+        iterator = iter(iterable)
+        elapsed = 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    doc = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - started
+                    break
+                elapsed += time.perf_counter() - started
+                operation.add(doc)
+                yield doc
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            operation.fail(e)
+            raise
+        finally:
+            self.record(name, elapsed, operation.documents, operation.bytes, operation.error is not None)
+
+    # -------------------------------------------------------------------------
+    # record_command
+    # -------------------------------------------------------------------------
+    def record_command(self, name, database, duration_ms, failed=False, command=None):
+        """Records one server command; slow ones are kept with their filter and logged."""
+        if not self.enabled:
+            return
+        self.record(name, duration_ms / 1000, error=failed, table=self.commands)
+        if duration_ms < self.slow_command_ms:
+            return
+
+        entry = {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "command": name,
+            "database": database,
+            "collection": command.get(name) if command and isinstance(command.get(name), str) else None,
+            "duration_ms": round(duration_ms, 1),
+            "failed": failed,
+            "filter": command_filter(name, command) if command else None,
+        }
+        with self._lock:
+            self.slow_commands.append(entry)
+        logging.warning(f"Slow MongoDB command {name} on {entry['collection']} took {duration_ms:.0f} ms: {entry['filter']}")
+
+    # -------------------------------------------------------------------------
+    # snapshot
+    # -------------------------------------------------------------------------
+    def snapshot(self):
+        """Returns all metrics as a JSON-serialisable dict."""
+        with self._lock:
+            def export(entries):
+                return {
+                    name: {**{key: value for key, value in entry.items() if key != "latency"},
+                           "latency": entry["latency"].to_dict()}
+                    for name, entry in sorted(entries.items())
+                }
+            return {
+                "generated_at": datetime.now().isoformat(timespec="seconds"),
+                "started_at": self.started_at.isoformat(timespec="seconds"),
+                "pid": os.getpid(),
+                "operations": export(self.operations),
+                "commands": export(self.commands),
+                "slow_commands": list(self.slow_commands),
+            }
+
+    # -------------------------------------------------------------------------
+    # to_prometheus
+    # -------------------------------------------------------------------------
+    def to_prometheus(self, prefix="heartbeat_db"):
+        """Renders the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = []
+            for family, label, entries in (("operation", "operation", self.operations),
+                                           ("command", "command", self.commands)):
+                metric = f"{prefix}_{family}_seconds"
+                lines += [f"# HELP {metric} Latency per data-layer {family}.", f"# TYPE {metric} histogram"]
+                for name, entry in sorted(entries.items()):
+                    histogram = entry["latency"]
+                    cumulative = 0
+                    for bound, count in zip(histogram.bounds + (None,), histogram.buckets):
+                        cumulative += count
+                        le = "+Inf" if bound is None else repr(bound / 1000)
+                        lines.append(f'{metric}_bucket{{{label}="{name}",le="{le}"}} {cumulative}')
+                    lines.append(f'{metric}_sum{{{label}="{name}"}} {histogram.total / 1000:.6f}')
+                    lines.append(f'{metric}_count{{{label}="{name}"}} {histogram.count}')
+
+                for counter in ("documents", "bytes", "errors"):
+                    if family == "command" and counter != "errors":
+                        continue
+                    metric = f"{prefix}_{family}_{counter}_total"
+                    lines += [f"# HELP {metric} {counter.capitalize()} per data-layer {family}.",
+                              f"# TYPE {metric} counter"]
+                    lines += [f'{metric}{{{label}="{name}"}} {entry[counter]}' for name, entry in sorted(entries.items())]
+            return "\n".join(lines) + "\n"
+
+    # -------------------------------------------------------------------------
+    # dump
+    # -------------------------------------------------------------------------
+    def dump(self, path, fmt="auto"):
+        """
+        Writes the metrics to `path` atomically. `{pid}` and `{process}` in the path are
+        replaced, so several agents on one host do not overwrite each other.
+        Args:
+            fmt (str): "json", "prometheus" or "auto" (Prometheus for .prom files).
+        """
+        process = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+        path = path.format(pid=os.getpid(), process=process)
+        if fmt == "auto":
+            fmt = "prometheus" if path.endswith(".prom") else "json"
+        text = self.to_prometheus() if fmt == "prometheus" else json.dumps(self.snapshot(), indent=2)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(text)
+        os.replace(temp_path, path)
+        return path
+
+    # -------------------------------------------------------------------------
+    # start_dumper / stop_dumper
+    # -------------------------------------------------------------------------
+    def start_dumper(self, path, interval=60, fmt="auto"):
+        """Dumps the metrics every `interval` seconds from a daemon thread, and once more at exit."""
+        if self._dumper:
+            return
+
+        def dump_safely():
+            try:
+                self.dump(path, fmt)
+            except Exception as e:
+                logging.error(f"Failed to write metrics to {path}: {e}")
+
+        def loop():
+            while not self._stop_dumper.wait(interval):
+                dump_safely()
+
+        self._dumper = threading.Thread(target=loop, name="metrics-dumper", daemon=True)
+        self._dumper.start()
+        atexit.register(dump_safely)
+        logging.info(f"Writing database metrics to {path} every {interval}s.")
+
+    def stop_dumper(self):
+        self._stop_dumper.set()
+        self._dumper = None
+
+
+# =============================================================================
+# CommandMetrics Class
+# =============================================================================
+class CommandMetrics(monitoring.CommandListener):
+    """pymongo command listener feeding `Metrics.record_command`."""
+
+    def __init__(self, metrics):
+        self.metrics    = metrics
+        self._inflight  = {}    # (request_id, connection_id) -> command document
+
+    def started(self, event):
+        if event.command_name in FILTER_FIELDS or event.command_name in ("update", "delete"):
+            self._inflight[(event.request_id, event.connection_id)] = event.command
+
+    def succeeded(self, event):
+        command = self._inflight.pop((event.request_id, event.connection_id), None)
+        self.metrics.record_command(event.command_name, event.database_name, event.duration_micros / 1000,
+                                    command=command)
+
+    def failed(self, event):
+        command = self._inflight.pop((event.request_id, event.connection_id), None)
+        self.metrics.record_command(event.command_name, event.database_name, event.duration_micros / 1000,
+                                    failed=True, command=command)
+
+
+def command_listeners():
+    """Event listeners to pass to a MongoClient; empty when metrics are disabled."""
+    metrics = get_metrics()
+    return [CommandMetrics(metrics)] if metrics.enabled else []
@@ -8,34 +8,30 @@
 import os
 import time
 import ctypes
-import logging
-import yaml
 import sys
 
 script_path     = os.path.dirname(os.path.abspath(__file__))
 _root           = os.path.abspath(os.path.join(script_path, ".."))
 SETTINGS_FILE   = os.path.join(_root, "config/config.yml").replace("\\", "/")
+DEFAULT_SETTINGS = {'timeout': 60, 'log_level': "DEBUG"}
+ADAPTIVE_MARGIN = 0.2       # seconds past the threshold, so the wake-up reading is over it
+BASE_DIR        = os.path.join(os.environ.get("USERPROFILE", os.path.expanduser("~")), "InactivityDetector")
+
+sys.path.insert(0, script_path)
+from config_service import get_config
+from status_channel import StatusPublisher
+from log_setup import get_file_logger
+from idle_samples import IdleSamples
 
 # --- Patched Logging Handler ---
-def log_status_update(status: str):
-    base_dir = os.path.join(os.environ["USERPROFILE"], "InactivityDetector")
+def log_status_update(status: str, base_dir=BASE_DIR):
     service_log = os.path.join(base_dir, "service.log")
     idle_log = os.path.join(base_dir, "idle_reporter.log")
 
-    main_logger = logging.getLogger("main_logger")
-    service_logger = logging.getLogger("service_logger")
-
-    if not main_logger.handlers:
-        main_handler = logging.FileHandler(idle_log)
-        main_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-        main_logger.addHandler(main_handler)
-        main_logger.setLevel(logging.INFO)
-
-    if not service_logger.handlers:
-        service_handler = logging.FileHandler(service_log)
-        service_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-        service_logger.addHandler(service_handler)
-        service_logger.setLevel(logging.INFO)
+    # Queued: the polling loop never waits on the (possibly network) home drive.
+    # One logger per file, so reporters with another base_dir keep their own logs.
+    main_logger = get_file_logger(f"main_logger:{idle_log}", idle_log)
+    service_logger = get_file_logger(f"service_logger:{service_log}", service_log)
 
     if status == "Logoff (session end)":
         service_logger.info(f"Status updated: {status}")
@@ -43,29 +39,67 @@ def log_status_update(status: str):
         main_logger.info(f"Status updated: {status}")
 
 class IdleReporter:
-    """Detects user inactivity and logs it."""
-
-    def __init__(self):
-        self.base_dir = os.path.join(os.environ["USERPROFILE"], "InactivityDetector")
+    """
+    Detects user inactivity and logs it.
+    Args:
+        idle_source (callable): Returns seconds since the last input; defaults to
+                                GetLastInputInfo. Pass a fake to run off Windows.
+        clock (callable): Wall-clock time used to date status changes.
+        sleep (callable): Waits between polls.
+        base_dir (str): Folder for status.txt and the logs; defaults to
+                        %USERPROFILE%\\InactivityDetector (the home directory off Windows).
+    """
+
+    def __init__(self, idle_source=None, clock=time.time, sleep=time.sleep, base_dir=BASE_DIR):
+        self.idle_source = idle_source or self.get_idle_duration
+        self.clock = clock
+        self.sleep = sleep
+        self.idle_time = 0.0
+
+        self.base_dir = base_dir
         self.status_file = os.path.join(self.base_dir, "status.txt")
         self.log_file = os.path.join(self.base_dir, "idle_reporter.log")
 
         os.makedirs(self.base_dir, exist_ok=True)
+        self.publisher = StatusPublisher(self.base_dir)
 
         self.ensure_status_file()
         self.load_settings()
 
+        # Every reading, for the live totals the tray and GUI show
+        self.samples = IdleSamples(
+            capacity=self.settings.get('sample_buffer', 4096),
+            threshold=self.settings.get('timeout', 300),
+            clock=self.clock,
+        )
+
     def load_settings(self):
-        default_settings = {'timeout': 60, 'log_level': "DEBUG"}
+        self.settings = DEFAULT_SETTINGS
         if os.path.exists(SETTINGS_FILE):
             try:
-                with open(SETTINGS_FILE, 'r') as f:
-                    user_settings = yaml.safe_load(f)
-                    self.settings = {**default_settings, **user_settings.get('settings', {})}
-                    log_status_update(f"Settings loaded: {self.settings}")
+                self.settings = get_config(SETTINGS_FILE).section('settings', DEFAULT_SETTINGS)
+                log_status_update(f"Settings loaded: {self.settings}", self.base_dir)
+                get_config(SETTINGS_FILE).subscribe(self.on_settings_changed, prefix='settings')
             except Exception as e:
-                log_status_update(f"Failed to load settings: {e}")
-                self.settings = default_settings
+                log_status_update(f"Failed to load settings: {e}", self.base_dir)
+
+    @property
+    def active_time(self):
+        """Seconds active today, up to now."""
+        return self.samples.totals("day")["active"]
+
+    @property
+    def inactive_time(self):
+        """Seconds inactive today, up to now."""
+        return self.samples.totals("day")["inactive"]
+
+    def activity_stats(self):
+        """Active/inactive seconds for this session, today and this hour."""
+        return self.samples.stats()
+
+    def on_settings_changed(self, changed, config):
+        self.settings = get_config(SETTINGS_FILE).section('settings', DEFAULT_SETTINGS)
+        log_status_update(f"Settings reloaded ({', '.join(changed)}): {self.settings}", self.base_dir)
 
     def get_idle_duration(self):
         class LASTINPUTINFO(ctypes.Structure):
@@ -83,36 +117,75 @@ class IdleReporter:
         if not os.path.exists(self.status_file):
             with open(self.status_file, "w") as f:
                 f.write("Active")
-            log_status_update("Created status.txt and initialized with Active.")
-
-    def write_status(self, status):
+            log_status_update("Created status.txt and initialized with Active.", self.base_dir)
+
+    def write_status(self, status, timestamp=None):
+        """
+        Pushes the change to the monitor and keeps status.txt as the snapshot for
+        monitors without the status channel.
+        Args:
+            timestamp (float): When the change happened (unix time); defaults to now.
+        """
         self.ensure_status_file()
         try:
             with open(self.status_file, "w") as f:
                 f.write(status)
-            log_status_update(status)
+            log_status_update(status, self.base_dir)
         except Exception as e:
-            log_status_update(f"Failed to write status: {e}")
+            log_status_update(f"Failed to write status: {e}", self.base_dir)
+        self.publisher.publish(status, timestamp)
 
     def monitor(self):
         idle_threshold = self.settings.get('timeout', 300)
         check_interval = self.settings.get('check_interval', 10)
 
-        log_status_update(f"Idle threshold set to {idle_threshold} seconds.")
-        log_status_update(f"Check interval set to {check_interval} seconds.")
-        log_status_update("Idle Reporter Started.")
+        log_status_update(f"Idle threshold set to {idle_threshold} seconds.", self.base_dir)
+        log_status_update(f"Check interval set to {check_interval} seconds.", self.base_dir)
+        log_status_update(f"Polling mode: {self.settings.get('polling', 'fixed')}.", self.base_dir)
+        log_status_update("Idle Reporter Started.", self.base_dir)
 
         last_status = "Active"
+        config = get_config(SETTINGS_FILE)
 
         while True:
-            idle_time = self.get_idle_duration()
-            status = "Inactive" if idle_time > idle_threshold else "Active"
-
-            if status != last_status:
-                self.write_status(status)
-                last_status = status
+            last_status = self.poll(last_status, idle_threshold)
+            self.sleep(self.next_poll_delay(last_status, idle_threshold))
 
-            time.sleep(check_interval)
+            # Cheap stat; new timeout/check_interval values apply from the next poll
+            try:
+                config.refresh()
+            except OSError as e:
+                log_status_update(f"Failed to refresh settings: {e}", self.base_dir)
+            idle_threshold = self.settings.get('timeout', 300)
+
+    def next_poll_delay(self, status, idle_threshold):
+        """
+        Seconds until the next reading worth taking.
+        "fixed" polling waits check_interval. "adaptive" polling uses the last reading:
+        while Active the status cannot change before the idle time reaches the
+        threshold, so it sleeps until just past that moment (input in between only
+        pushes it further out); while Inactive any input ends the period, so it
+        polls every inactive_check_interval.
+        """
+        if self.settings.get('polling', 'fixed') != 'adaptive':
+            return self.settings.get('check_interval', 10)
+        if status == "Inactive":
+            return self.settings.get('inactive_check_interval', 1)
+        return max(idle_threshold - self.idle_time, 0) + ADAPTIVE_MARGIN
+
+    def poll(self, last_status, idle_threshold):
+        """Takes one idle reading, writes the status on a change and returns the current status."""
+        idle_time = self.idle_time = self.idle_source()
+        now = self.clock()
+        self.samples.add(now, idle_time, idle_threshold)
+        status = "Inactive" if idle_time > idle_threshold else "Active"
+
+        if status != last_status:
+            # Date the change to when it happened, not to when this poll noticed it:
+            # the last input for Active, the threshold crossing for Inactive
+            changed_at = now - idle_time if status == "Active" else now - (idle_time - idle_threshold)
+            self.write_status(status, changed_at)
+        return status
 
 if __name__ == "__main__":
     reporter = IdleReporter()
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# idle_samples.py - Recent idle readings and live activity counters
+# Author: Sanja
+
+# Heart Beat Application - Idle Samples
+# Keeps the reporter's last `capacity` idle readings in two preallocated arrays
+# (timestamps as doubles, idle seconds as floats) used as a ring buffer, and turns
+# each reading into active/inactive seconds for the current session, day and hour.
+# Adding a reading and reading a total are O(1), so the tray and GUI can show live
+# numbers as often as they like without touching the database.
+#
+# The time between two readings is split at the threshold crossing: with the last
+# input at (timestamp - idle_seconds), the user counts as inactive from
+# last input + threshold on, as active before. Gaps longer than `max_gap` (sleep,
+# hibernation) are not counted.
+# =============================================================================
+# Imports
+# =============================================================================
+import time
+import threading
+from array import array
+from datetime import datetime
+
+PERIODS = ("session", "day", "hour")
+
+
+def _overlap(start, end, lower):
+    """Length of [start, end] from `lower` on."""
+    return max(end - max(start, lower), 0.0)
+
+
+# =============================================================================
+# IdleSamples Class
+# =============================================================================
+class IdleSamples:
+    """
+    Fixed-size ring buffer of (timestamp, idle_seconds) readings with running counters.
+    Args:
+        capacity (int): Readings kept; the oldest is overwritten when full.
+        threshold (float): Idle seconds after which the user counts as inactive.
+        max_gap (float): Seconds between readings beyond which the gap is not counted.
+        clock (callable): Wall-clock time for extrapolating totals between readings.
+    """
+
+    def __init__(self, capacity=4096, threshold=60, max_gap=3600, clock=time.time):
+        self.capacity       = max(1, int(capacity))
+        self.threshold      = threshold
+        self.max_gap        = max_gap
+        self.clock          = clock
+        self.timestamps     = array("d", bytes(8 * self.capacity))
+        self.idle_seconds   = array("f", bytes(4 * self.capacity))
+        self.head           = 0     # next slot to write
+        self.count          = 0
+        self.session_start  = None
+        # period -> [period start, active seconds, inactive seconds]
+        self._totals        = {period: [0.0, 0.0, 0.0] for period in PERIODS}
+        self._lock          = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    # -------------------------------------------------------------------------
+    # add
+    # -------------------------------------------------------------------------
+    def add(self, timestamp, idle_seconds, threshold=None):
+        """
+        Stores one reading and adds the time since the previous one to the counters.
+        A reading not newer than the previous one (clock stepped back, duplicate
+        poll) is dropped, so the buffer stays in time order.
+        """
+        if threshold is not None:
+            self.threshold = threshold
+
+        with self._lock:
+            previous = self._latest()
+            if previous is not None and timestamp <= previous[0]:
+                return
+            self.timestamps[self.head] = timestamp
+            self.idle_seconds[self.head] = idle_seconds
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+            if previous is None:
+                self.session_start = timestamp
+                self._roll_periods(timestamp)
+                return
+
+            self._roll_periods(timestamp)
+            if timestamp - previous[0] <= self.max_gap:
+                self._count_interval(previous, (timestamp, idle_seconds))
+
+    def _latest(self):
+        if not self.count:
+            return None
+        index = (self.head - 1) % self.capacity
+        return self.timestamps[index], self.idle_seconds[index]
+
+    def _period_start(self, period, timestamp):
+        if period == "session":
+            return self.session_start
+        moment = datetime.fromtimestamp(timestamp)
+        if period == "day":
+            return moment.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        return moment.replace(minute=0, second=0, microsecond=0).timestamp()
+
+    def _roll_periods(self, timestamp):
+        """Resets the day/hour counters when `timestamp` falls into a new day or hour."""
+        for period in PERIODS:
+            start = self._period_start(period, timestamp)
+            if self._totals[period][0] != start:
+                self._totals[period] = [start, 0.0, 0.0]
+
+    def _inactive_segments(self, previous, current):
+        """
+        The parts of (previous, current] the user was inactive: up to the input seen
+        by `current` if the idle period of `previous` had crossed the threshold by
+        then, and from the threshold crossing after that input on.
+        """
+        start, end = previous[0], current[0]
+        previous_input = start - previous[1]
+        last_input = end - current[1]
+
+        segments = []
+        if last_input > start:
+            crossing = previous_input + self.threshold
+            if crossing < last_input:
+                segments.append((max(start, crossing), last_input))
+            start = last_input
+        crossing = max(start, last_input + self.threshold)
+        if crossing < end:
+            segments.append((crossing, end))
+        return segments
+
+    def _count_interval(self, previous, current, totals=None):
+        totals = self._totals if totals is None else totals
+        start, end = previous[0], current[0]
+        segments = self._inactive_segments(previous, current)
+        for counters in totals.values():
+            period_start = counters[0]
+            inactive = sum(_overlap(a, b, period_start) for a, b in segments)
+            counters[1] += _overlap(start, end, period_start) - inactive
+            counters[2] += inactive
+
+    # -------------------------------------------------------------------------
+    # Live totals
+    # -------------------------------------------------------------------------
+    def totals(self, period="day", now=None):
+        """
+        Active and inactive seconds for `period` ("session", "day" or "hour"),
+        including the time since the last reading as the next reading would count
+        it if no input arrives in between.
+        Returns:
+            dict: {"active": seconds, "inactive": seconds}
+        """
+        now = self.clock() if now is None else now
+        with self._lock:
+            latest = self._latest()
+            if latest is None:
+                return {"active": 0.0, "inactive": 0.0}
+
+            counters = list(self._totals[period])
+            start = self._period_start(period, now)
+            if counters[0] != start:
+                counters = [start, 0.0, 0.0]    # a new day/hour began after the last reading
+            gap = now - latest[0]
+            if 0 < gap <= self.max_gap:
+                self._count_interval(latest, (now, latest[1] + gap), {period: counters})
+
+        return {"active": counters[1], "inactive": counters[2]}
+
+    def stats(self, now=None):
+        """Totals for every period, e.g. {"day": {"active": ..., "inactive": ...}, ...}."""
+        now = self.clock() if now is None else now
+        return {period: self.totals(period, now) for period in PERIODS}
+
+    # -------------------------------------------------------------------------
+    # Readings
+    # -------------------------------------------------------------------------
+    def samples(self, since=None):
+        """Returns the buffered (timestamp, idle_seconds) readings, oldest first."""
+        with self._lock:
+            start = (self.head - self.count) % self.capacity
+            readings = [
+                (self.timestamps[(start + offset) % self.capacity], self.idle_seconds[(start + offset) % self.capacity])
+                for offset in range(self.count)
+            ]
+        return [reading for reading in readings if since is None or reading[0] >= since]
@@ -8,34 +8,31 @@ import time
 import socket
 import signal
 import logging
-import yaml
 import getpass
+import threading
 from datetime import datetime, timedelta
-import connect_to_db
+from storage import open_database
+from pulse_spool import PulseSpool
+from config_service import get_config
+from resilience import RetryPolicy, retry_call
+from status_channel import open_listener, CHANNEL_DEFAULTS
+from log_setup import setup_logging
+from activity_bitmap import rollup_bitmaps
 
 # === Constants ===
 BASE_DIR = os.path.join(os.environ.get("USERPROFILE", os.getcwd()), "InactivityDetector")
 LOG_FILE = os.path.join(BASE_DIR, "inactivity_monitor.log")
 STATUS_FILE = os.path.join(BASE_DIR, "status.txt")
+SPOOL_FILE = os.path.join(BASE_DIR, "pulse_spool.db")
 DEFAULT_SETTINGS = {'timeout': 300, 'log_level': "DEBUG"}
+DEFAULT_SPOOL_SETTINGS = {'max_bytes': 50 * 1024 * 1024, 'batch_size': 500, 'drain_interval': 30}
 
 # Ensure base directory exists
 os.makedirs(BASE_DIR, exist_ok=True)
 
-# Set up logging
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
-
-# Initialize log file with a message
-try:
-    with open(LOG_FILE, "w") as f:
-        f.write("status")
-    logging.info("Inactivity monitor log initialized.")
-except Exception as e:
-    logging.error(f"Failed to initialize log file: {e}")
+# Set up logging (queued, rotated; see log_setup.py)
+setup_logging(LOG_FILE, level=logging.DEBUG)
+logging.info("Inactivity monitor log initialized.")
 
 # Path to config.yml (relative to project root)
 script_path = os.path.dirname(os.path.abspath(__file__))
@@ -62,54 +59,75 @@ class InactivityMonitor:
         self.status_file = STATUS_FILE
         self.load_settings()
 
+        # All pulses go to the local spool first; the drainer replays them into MongoDB
+        self.spool = PulseSpool(
+            SPOOL_FILE,
+            max_bytes=self.spool_settings['max_bytes'],
+            batch_size=self.spool_settings['batch_size'],
+        )
+        self.spool.start_drainer(self.get_db, interval=self.spool_settings['drain_interval'])
+
     def handle_exit(self, signum, frame):
         logging.info("Shutdown signal received. Exiting monitor...")
+        self.spool.close()
+        if self.db:
+            self.db.close()
         sys.exit(0)
 
     def connect_to_db(self):
         try:
-            db = connect_to_db.MongoDatabase()
-            logging.info("Connected to MongoDB.")
+            db = open_database()
+            logging.info(f"Connected to {type(db).__name__}.")
             return db
         except Exception as e:
             logging.error(f"Database connection failed: {e}")
             return None
 
+    def get_db(self):
+        """Returns the database connection, reconnecting if the initial attempt failed."""
+        if not self.db:
+            self.db = self.connect_to_db()
+        return self.db
+
     def load_settings(self):
+        self.settings = DEFAULT_SETTINGS
+        self.spool_settings = DEFAULT_SPOOL_SETTINGS
+        self.channel_settings = CHANNEL_DEFAULTS
         if os.path.exists(SETTINGS_FILE):
             try:
-                with open(SETTINGS_FILE, 'r') as f:
-                    user_settings = yaml.safe_load(f)
-                    self.settings = {**DEFAULT_SETTINGS, **user_settings.get('settings', {})}
-                    logging.info(f"Settings loaded: {self.settings}")
+                config = get_config(SETTINGS_FILE)
+                self.settings = config.section('settings', DEFAULT_SETTINGS)
+                self.spool_settings = config.section('spool', DEFAULT_SPOOL_SETTINGS)
+                self.channel_settings = config.section('status_channel', CHANNEL_DEFAULTS)
+                logging.info(f"Settings loaded: {self.settings}")
+                # check_interval, timeout, ... apply from the next loop iteration on
+                config.subscribe(self.on_settings_changed, prefix='settings')
             except Exception as e:
                 logging.error(f"Failed to load settings: {e}")
-                self.settings = DEFAULT_SETTINGS
-        else:
-            self.settings = DEFAULT_SETTINGS
 
-    def log_activity(self, status, duration):
+    def on_settings_changed(self, changed, config):
+        self.settings = get_config(SETTINGS_FILE).section('settings', DEFAULT_SETTINGS)
+        logging.info(f"Settings reloaded ({', '.join(changed)}): {self.settings}")
+
+    def log_activity(self, status, duration, timestamp=None):
         entry = {
             "username": self.username,
             "hostname": self.hostname,
-            "timestamp": datetime.now(),
+            "timestamp": datetime.fromtimestamp(timestamp) if timestamp else datetime.now(),
             "status": status,
             "active_time": round(duration, 2) if status == "Inactive" else 0,
             "inactive_time": round(duration, 2) if status == "Active" else 0
         }
 
         try:
-            if self.db:
-                self.db.insert_pulse(entry)
-                logging.info(f"Logged {status} to database: {entry}")
-            else:
-                logging.warning("No DB connection available.")
+            self.spool.append(entry)
+            logging.info(f"Logged {status} to spool: {entry}")
         except Exception as e:
             logging.exception(f"Failed to log activity: {e}")
 
     def log_day_start_status(self, last_status, day_start_time):
         try:
-            self.log_activity(last_status, 0)
+            self.log_activity(last_status, 0, day_start_time)
             logging.info(f"Day start log: {last_status} at {datetime.fromtimestamp(day_start_time)}")
         except Exception as e:
             logging.exception("Failed to log day start status")
@@ -118,35 +136,13 @@ class InactivityMonitor:
         try:
             duration = day_end_time - last_change_time
             if duration > 0:
-                self.log_activity(last_status, duration)
+                # Stamped 23:59:59 so the pulse belongs to the day it closes, not to the next one
+                self.log_activity(last_status, duration, day_end_time)
                 logging.info(f"Day end log: {last_status} for {duration:.2f} sec at {datetime.fromtimestamp(day_end_time)}")
 
+            # The summary needs the database; the monitor loop must not wait for it
             day = datetime.fromtimestamp(day_end_time).date()
-            start = datetime.combine(day, datetime.min.time())
-            end = start + timedelta(days=1)
-
-            result = self.db.activity_collection.aggregate([
-                {"$match": {"timestamp": {"$gte": start, "$lt": end}}},
-                {"$group": {
-                    "_id": None,
-                    "total_active_time": {"$sum": "$active_time"}
-                }}
-            ])
-
-            total_active = round(next(result, {}).get("total_active_time", 0), 2)
-
-            summary_entry = {
-                "username": self.username,
-                "hostname": self.hostname,
-                "date": str(day),
-                "status": "Summary",
-                "total_active_time": total_active,
-                "timestamp": datetime.now(),
-                "type": "daily_summary"
-            }
-
-            self.db.insert_pulse(summary_entry)
-            logging.info(f"Daily summary inserted for {day}: {total_active} seconds active")
+            threading.Thread(target=self.write_daily_summary, args=(day,), name="daily-summary", daemon=True).start()
 
             return day_end_time
 
@@ -154,49 +150,133 @@ class InactivityMonitor:
             logging.exception("Failed during day end logging or summary")
             return last_change_time
 
-    def monitor(self):
-        last_status = "Active"
-        last_change_time = time.time()
-        last_date = datetime.now().date()
-        start_time = time.time()
-        total_runtime = self.settings.get("total_runtime", 0)
-        check_interval = self.settings.get("check_interval", 5)
+    def write_daily_summary(self, day):
+        """Sums this user's pulses from this host for `day` and stores the daily summary."""
+        db = self.get_db()
+        if not db:
+            logging.error(f"No database connection; daily summary for {day} skipped.")
+            return
 
-        while True:
-            try:
-                if total_runtime > 0 and (time.time() - start_time) > total_runtime:
-                    logging.info("Total runtime reached. Exiting monitor loop.")
-                    break
+        try:
+            # Make sure spooled pulses are in the collection before summing them
+            self.spool.drain(db)
+            totals = retry_call(
+                db.day_summary, self.username, self.hostname, day,
+                policy=getattr(db, "retry_policy", RetryPolicy()), breaker=getattr(db, "breaker", None),
+            )
+        except Exception as e:
+            logging.error(f"Daily summary for {day} skipped: {e}")
+            return
 
-                current_time = time.time()
-                current_date = datetime.now().date()
+        summary_entry = {
+            "username": self.username,
+            "hostname": self.hostname,
+            "date": str(day),
+            "status": "Summary",
+            "type": "daily_summary",
+            "total_active_time": round(totals["active_seconds"], 2),
+            "total_inactive_time": round(totals["inactive_seconds"], 2),
+            "pulses": totals["pulses"],
+            "start_time": totals["first_seen"],
+            "end_time": totals["last_seen"],
+            "timestamp": datetime.now(),
+        }
 
-                if current_date != last_date:
-                    day_end = datetime.combine(last_date, datetime.max.time()).replace(microsecond=0)
-                    last_change_time = self.log_day_end_status(last_status, last_change_time, day_end.timestamp())
+        db.insert_summary(summary_entry)
+        logging.info(f"Daily summary stored for {day}: {summary_entry['total_active_time']} seconds active")
 
-                    day_start = datetime.combine(current_date, datetime.min.time())
-                    self.log_day_start_status(last_status, day_start.timestamp())
-                    last_date = current_date
+        # Per-minute bitmap of the day for the team reports; see activity_bitmap.py
+        try:
+            rollup_bitmaps(db, day, username=self.username)
+        except Exception as e:
+            logging.error(f"Activity bitmap for {day} skipped: {e}")
 
-                if os.path.exists(self.status_file):
-                    with open(self.status_file, "r") as f:
-                        status = f.read().strip()
+    def read_status_file(self):
+        """Returns (status, now) from the status.txt snapshot, or None if it is missing."""
+        if not os.path.exists(self.status_file):
+            logging.warning("Status file not found.")
+            return None
+        with open(self.status_file, "r") as f:
+            return f.read().strip(), time.time()
+
+    def wait_for_status(self, listener, start_time, last_date):
+        """
+        Blocks until the reporter pushes a status change or the loop has work to do:
+        the next midnight, the end of total_runtime or the periodic snapshot resync.
+        Without a listener, sleeps check_interval and reads status.txt as before.
+        Returns:
+            tuple | None: (status, unix timestamp of the change)
+        """
+        if listener is None:
+            time.sleep(self.settings.get("check_interval", 5))
+            return self.read_status_file()
+
+        now = time.time()
+        next_midnight = datetime.combine(last_date + timedelta(days=1), datetime.min.time()).timestamp()
+        timeout = min(self.channel_settings.get("resync_interval", 300), next_midnight - now + 0.5)
+        total_runtime = self.settings.get("total_runtime", 0)
+        if total_runtime > 0:
+            timeout = min(timeout, start_time + total_runtime - now + 0.5)
 
-                    if status != last_status:
-                        duration = current_time - last_change_time
-                        self.log_activity(status, duration)
-                        logging.info(f"Status updated: {status}")
+        event = listener.receive(max(timeout, 0))
+        # Nothing pushed: compare with the snapshot in case an event was lost
+        return event if event else self.read_status_file()
 
-                        last_status = status
-                        last_change_time = current_time
-                else:
-                    logging.warning("Status file not found.")
+    def monitor(self):
+        last_status = "Active"
+        last_change_time = time.time()
+        last_date = datetime.now().date()
+        start_time = time.time()
+        config = get_config(SETTINGS_FILE)
 
-                time.sleep(check_interval)
+        listener = open_listener(BASE_DIR) if self.channel_settings.get("enabled", True) else None
+        event = self.read_status_file()
 
-            except Exception as e:
-                logging.exception("Error in monitor loop")
+        try:
+            while True:
+                try:
+                    # A stat per wakeup; re-parses and notifies only when config.yml changed
+                    try:
+                        config.refresh()
+                    except OSError as e:
+                        logging.error(f"Failed to refresh settings: {e}")
+                    total_runtime = self.settings.get("total_runtime", 0)
+
+                    if total_runtime > 0 and (time.time() - start_time) > total_runtime:
+                        logging.info("Total runtime reached. Exiting monitor loop.")
+                        break
+
+                    current_date = datetime.now().date()
+
+                    if current_date != last_date:
+                        day_end = datetime.combine(last_date, datetime.max.time()).replace(microsecond=0)
+                        last_change_time = self.log_day_end_status(last_status, last_change_time, day_end.timestamp())
+
+                        day_start = datetime.combine(current_date, datetime.min.time())
+                        self.log_day_start_status(last_status, day_start.timestamp())
+                        last_date = current_date
+
+                    if event:
+                        status, changed_at = event
+                        if status != last_status:
+                            # Events carry the reporter's time of the change; never count backwards
+                            changed_at = max(changed_at, last_change_time)
+                            duration = changed_at - last_change_time
+                            self.log_activity(status, duration, changed_at)
+                            logging.info(f"Status updated: {status}")
+
+                            last_status = status
+                            last_change_time = changed_at
+
+                    event = self.wait_for_status(listener, start_time, last_date)
+
+                except Exception as e:
+                    logging.exception("Error in monitor loop")
+                    event = None
+                    time.sleep(1)
+        finally:
+            if listener:
+                listener.close()
 
 
 # # Uncomment to run directly for testing
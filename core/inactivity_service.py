@@ -3,6 +3,7 @@
 # Author: Sanja
 # Refactored: 2025-04-17
 
+import asyncio
 import logging
 import threading
 import time
@@ -13,23 +14,23 @@ import sys
 script_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, script_dir)
 
-from idle_reporter import IdleReporter
+from idle_reporter import IdleReporter, SETTINGS_FILE, DEFAULT_SETTINGS
 from event_detector import EventDetector
-from connect_to_db import MongoDatabase
+from storage import open_database, STORAGE_DEFAULTS
+from pulse_spool import PulseSpool
+from config_service import get_config
+from async_db import AsyncMongoDatabase
+from log_setup import setup_logging, get_file_logger
 
 # Setup logging
 log_dir = "C:\\Users\\Public\\InactivityService"
 os.makedirs(log_dir, exist_ok=True)
 service_log_path = os.path.join(log_dir, "service.log")
+SPOOL_FILE = os.path.join(log_dir, "pulse_spool.db")
+SERVICE_EVENTS_LOG = "service_events.log"  # per-user event log in C:\Users\<user>\InactivityDetector
+DEFAULT_SPOOL_SETTINGS = {'max_bytes': 50 * 1024 * 1024, 'batch_size': 500, 'drain_interval': 30}
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-while logger.hasHandlers():
-    logger.removeHandler(logger.handlers[0])
-file_handler = logging.FileHandler(service_log_path)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+setup_logging(service_log_path, level=logging.INFO)
 
 logging.info("[STARTUP] Inactivity Detector Service initialized.")
 
@@ -39,17 +40,47 @@ class InactivityService:
         self.running = True
         self.reporter = IdleReporter()
         self.event_detector = EventDetector()
-        self.db = MongoDatabase()
+        self.mode = self.load_mode()
+        self.adb = None
+        # Lazy: service start never waits on the database. In async mode this
+        # synchronous handle only serves the spool drainer.
+        self.db = open_database(lazy=True, buffered=False if self.mode == "async" else None)
+        # Pulses the database cannot take while it is down wait on disk
+        self.spool_settings = get_config().section('spool', DEFAULT_SPOOL_SETTINGS)
+        self.spool = PulseSpool(
+            SPOOL_FILE,
+            max_bytes=self.spool_settings['max_bytes'],
+            batch_size=self.spool_settings['batch_size'],
+        )
+        self.db.set_fallback(self.spool)
         self.last_event_signature = None
         self.blocker = threading.Event()
 
+    def load_mode(self):
+        """Reads `service.mode` from config.yml: "threads" (default) or "async"."""
+        try:
+            mode = get_config().section('service', {'mode': 'threads'})['mode']
+            if mode == 'async' and get_config().section('storage', STORAGE_DEFAULTS)['backend'] != 'mongodb':
+                logging.warning("Async mode needs the MongoDB backend; using threads.")
+                return 'threads'
+            return mode
+        except Exception as e:
+            logging.error(f"Failed to load service mode: {e}")
+            return 'threads'
+
     def run(self):
+        if self.mode == "async":
+            self.run_async()
+            return
+
         logging.info("Inactivity Detector Service started (NSSM mode).")
         logging.info(f"Args passed: {sys.argv}")
 
         threading.Thread(target=self.reporter.monitor, daemon=True).start()
         threading.Thread(target=self.monitor_user_sessions, daemon=True).start()
         threading.Thread(target=self.log_events_loop, daemon=True).start()
+        threading.Thread(target=self.ensure_indexes, daemon=True).start()
+        self.spool.start_drainer(lambda: self.db, interval=self.spool_settings['drain_interval'])
 
         try:
             self.blocker.wait()  # Keep main thread alive
@@ -57,8 +88,92 @@ class InactivityService:
             logging.info("[SHUTDOWN] Service interrupted by user (Ctrl+C).")
         except Exception as e:
             logging.exception("[ERROR] Unexpected error in main loop: %s", e)
+        finally:
+            self.running = False
+            self.db.close()
+            self.spool.close()
+
+    def ensure_indexes(self):
+        """Creates the managed indexes once the lazily connected database is reachable."""
+        self.db.wait_until_ready()
+        try:
+            self.db.ensure_indexes()
+        except Exception as e:
+            logging.error(f"Failed to ensure indexes: {e}")
 
-    def monitor_user_sessions(self):
+    # === asyncio mode ===
+
+    def run_async(self):
+        logging.info("Inactivity Detector Service started (NSSM mode, asyncio).")
+        logging.info(f"Args passed: {sys.argv}")
+
+        self.spool.start_drainer(lambda: self.db, interval=self.spool_settings['drain_interval'])
+
+        try:
+            asyncio.run(self.main_async())
+        except KeyboardInterrupt:
+            logging.info("[SHUTDOWN] Service interrupted by user (Ctrl+C).")
+        except Exception as e:
+            logging.exception("[ERROR] Unexpected error in main loop: %s", e)
+        finally:
+            self.running = False
+            self.db.close()
+            self.spool.close()
+
+    async def main_async(self):
+        """Runs the reporter, session and event loops as coroutines on one event loop."""
+        self.adb = AsyncMongoDatabase()
+        # Lazy like threads mode: pulses go to the spool until the server answers
+        await self.adb.connect(lazy=True)
+        self.adb.set_fallback(self.spool)
+
+        tasks = [
+            asyncio.create_task(self.reporter_loop_async(), name="reporter"),
+            asyncio.create_task(self.monitor_user_sessions_async(), name="sessions"),
+            asyncio.create_task(self.log_events_loop_async(), name="events"),
+            asyncio.create_task(self.ensure_indexes_async(), name="indexes"),
+        ]
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # Cancelled by Ctrl+C / service stop: stop the loops, then let in-flight writes finish
+            self.running = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.adb.close()
+            logging.info("[SHUTDOWN] Async loops stopped and pending writes flushed.")
+
+    async def ensure_indexes_async(self):
+        """Creates the managed indexes once the lazily connected database is reachable."""
+        await self.adb.wait_until_ready()
+        try:
+            await self.adb.ensure_indexes()
+        except Exception as e:
+            logging.error(f"Failed to ensure indexes: {e}")
+
+    def load_idle_threshold(self):
+        """Returns the current `settings.timeout`; the config service only re-parses a changed file."""
+        try:
+            return get_config(SETTINGS_FILE).section('settings', DEFAULT_SETTINGS)['timeout']
+        except Exception as e:
+            logging.warning(f"Failed to refresh settings: {e}")
+            return self.reporter.settings.get('timeout', 300)
+
+    async def reporter_loop_async(self):
+        last_status = "Active"
+
+        while self.running:
+            # Like IdleReporter.monitor, a new timeout applies from the next poll
+            idle_threshold = await asyncio.to_thread(self.load_idle_threshold)
+            try:
+                last_status = await asyncio.to_thread(self.reporter.poll, last_status, idle_threshold)
+            except Exception:
+                logging.exception("Error while polling idle time")
+            await asyncio.sleep(self.reporter.next_poll_delay(last_status, idle_threshold))
+
+    async def monitor_user_sessions_async(self):
         try:
             import win32ts
         except ImportError:
@@ -69,33 +184,66 @@ class InactivityService:
 
         while self.running:
             try:
-                sessions = win32ts.WTSEnumerateSessions(None, 1, 0)
-
-                for session_id, _, _ in sessions:
-                    try:
-                        username = win32ts.WTSQuerySessionInformation(None, session_id, win32ts.WTSUserName)
-                        state = win32ts.WTSQuerySessionInformation(None, session_id, win32ts.WTSConnectState)
+                await asyncio.to_thread(self.poll_user_sessions, win32ts, user_session_states)
+            except Exception:
+                logging.exception("Error while monitoring session states")
+            await asyncio.sleep(10)
 
-                        if not username:
-                            continue
+    async def log_events_loop_async(self):
+        while self.running:
+            try:
+                events = await asyncio.to_thread(self.event_detector.get_latest_user_events, 1)
+                entry = self.process_event(events[0] if events else None)
+                if entry:
+                    # Fire-and-forget; the loop never waits on the database
+                    self.adb.schedule_pulse(entry)
+            except Exception as e:
+                logging.error("Event logging error: %s", e)
 
-                        prev_state = user_session_states.get(username)
+            await asyncio.sleep(10)
 
-                        if prev_state == win32ts.WTSActive and state == win32ts.WTSDisconnected:
-                            self.set_user_status(username, "OFFLINE")
-                        if prev_state == win32ts.WTSActive and state == win32ts.WTSLocked:
-                            self.set_user_status(username, "LOCKED")
+    # === thread mode ===
 
-                        user_session_states[username] = state
+    def monitor_user_sessions(self):
+        try:
+            import win32ts
+        except ImportError:
+            logging.error("win32ts module not found. Make sure pywin32 is installed.")
+            return
 
-                    except Exception:
-                        pass
+        user_session_states = {}
 
+        while self.running:
+            try:
+                self.poll_user_sessions(win32ts, user_session_states)
                 time.sleep(10)
 
             except Exception as e:
                 logging.exception("Error while monitoring session states")
 
+    def poll_user_sessions(self, win32ts, user_session_states):
+        sessions = win32ts.WTSEnumerateSessions(None, 1, 0)
+
+        for session_id, _, _ in sessions:
+            try:
+                username = win32ts.WTSQuerySessionInformation(None, session_id, win32ts.WTSUserName)
+                state = win32ts.WTSQuerySessionInformation(None, session_id, win32ts.WTSConnectState)
+
+                if not username:
+                    continue
+
+                prev_state = user_session_states.get(username)
+
+                if prev_state == win32ts.WTSActive and state == win32ts.WTSDisconnected:
+                    self.set_user_status(username, "OFFLINE")
+                if prev_state == win32ts.WTSActive and state == win32ts.WTSLocked:
+                    self.set_user_status(username, "LOCKED")
+
+                user_session_states[username] = state
+
+            except Exception:
+                pass
+
     def set_user_status(self, username, status):
         try:
             base_dir = os.path.join("C:\\Users\\Public\\InactivityService", "users", username)
@@ -114,51 +262,65 @@ class InactivityService:
         while self.running:
             try:
                 events = self.event_detector.get_latest_user_events(count=1)
-                event = events[0] if events else None
-
-                if not event:
-                    continue
-
-                if event['username'].upper().startswith("UMFD-") or event['username'].upper().startswith("DWM-"):
-                    continue
-
-                sig = (event['event_type'], event['username'], event['timestamp'])
-                if sig != self.last_event_signature:
-                    logging.info("Status updated: %s", event['event_type'])
-
-                    self.set_user_status(event['username'], event['event_type'].upper())
-                    self.last_event_signature = sig
+                entry = self.process_event(events[0] if events else None)
 
+                if entry:
                     try:
-                        entry = {
-                            "username": event['username'],
-                            "hostname": event['hostname'],
-                            "event_type": event['event_type'].upper(),
-                            "timestamp": datetime.now(),
-                            "source": "event_detector"
-                        }
                         self.db.insert_pulse(entry)
                         logging.info("Event pushed to DB.")
                     except Exception as db_err:
                         logging.warning(f"DB write failed: {db_err}")
 
-                    try:
-                        user_profile = os.path.join("C:\\Users", event['username'])
-                        user_log_dir = os.path.join(user_profile, "InactivityDetector")
-                        os.makedirs(user_log_dir, exist_ok=True)
-                        user_log_path = os.path.join(user_log_dir, "idle_reporter.log")
-
-                        with open(user_log_path, "a") as f:
-                            f.write(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S,%f')[:-3]} - INFO - Status updated: {event['event_type'].capitalize()}\n")
-
-                    except Exception as e:
-                        logging.warning(f"Could not write per-user event log: {e}")
-
             except Exception as e:
                 logging.error("Event logging error: %s", e)
 
             time.sleep(10)
 
+    def process_event(self, event):
+        """
+        Handles a new logon/logoff event: updates the status file and per-user log.
+        Returns:
+            dict: The pulse to store, or None if the event was filtered or already seen.
+        """
+        if not event:
+            return None
+
+        if event['username'].upper().startswith("UMFD-") or event['username'].upper().startswith("DWM-"):
+            return None
+
+        sig = (event['event_type'], event['username'], event['timestamp'])
+        if sig == self.last_event_signature:
+            return None
+
+        logging.info("Status updated: %s", event['event_type'])
+
+        self.set_user_status(event['username'], event['event_type'].upper())
+        self.last_event_signature = sig
+
+        entry = {
+            "username": event['username'],
+            "hostname": event['hostname'],
+            "event_type": event['event_type'].upper(),
+            "timestamp": datetime.now(),
+            "source": "event_detector"
+        }
+
+        try:
+            user_profile = os.path.join("C:\\Users", event['username'])
+            user_log_dir = os.path.join(user_profile, "InactivityDetector")
+            os.makedirs(user_log_dir, exist_ok=True)
+            # Not idle_reporter.log: the user's IdleReporter process owns and rotates that file
+            user_log_path = os.path.join(user_log_dir, SERVICE_EVENTS_LOG)
+
+            # Queued and rotated; the file stays open instead of being reopened per event
+            user_logger = get_file_logger(f"user_events.{event['username'].lower()}", user_log_path)
+            user_logger.info(f"Status updated: {event['event_type'].capitalize()}")
+
+        except Exception as e:
+            logging.warning(f"Could not write per-user event log: {e}")
+
+        return entry
+
 
 if __name__ == '__main__':
     service = InactivityService()
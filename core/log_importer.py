@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+# log_importer.py - Backfill pulses from idle_reporter.log / service.log / service_events.log history
+# Author: Sanja
+#
+# Usage:
+#   python log_importer.py \\HOST01\C$\Users\sanja\InactivityDetector
+#   python log_importer.py D:\collected --workers 8             (every InactivityDetector folder below)
+#   python log_importer.py old_logs --username sanja --hostname HOST01 --dry-run
+#
+# Hosts that ran without database connectivity still have the reporter's logs:
+#   <date> <time>,<ms> - INFO - Status updated: Active | Inactive      (idle_reporter.log)
+#   <date> <time>,<ms> - INFO - Status updated: Logon | Logoff | ...   (service.log, service_events.log)
+# The logs of one InactivityDetector folder, rotated copies and .gz files included,
+# are merged into one timestamp-ordered stream and replayed through the same state
+# machine as the monitor: every Active/Inactive change becomes a pulse carrying the
+# duration of the period it ends. Session events close the open period.
+#
+# Pulse ids are derived from (timestamp, username, hostname, status), so importing
+# the same logs twice, or overlapping copies of them, stores every pulse once.
+# Each folder is parsed and written by its own worker process; the parent reports
+# progress and throughput from the bytes the workers have read.
+
+import os
+import re
+import sys
+import gzip
+import time
+import heapq
+import queue
+import struct
+import hashlib
+import calendar
+import argparse
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from bson import ObjectId
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, script_dir)
+
+from storage import open_database, BACKENDS
+
+LOG_NAMES       = ("idle_reporter.log", "service.log", "service_events.log")
+LINE            = re.compile(rb"^(\d{4})-(\d\d)-(\d\d) (\d\d):(\d\d):(\d\d),(\d{3}) - \w+ - Status updated: (.+?)\s*$")
+MARKER          = b"Status updated: "
+TRANSITIONS     = ("Active", "Inactive")
+SESSION_START   = ("logon", "startup")
+SESSION_END     = ("logoff", "logoff (session end)")
+DRIVE           = re.compile(r"^[A-Za-z][:$]$")
+PROGRESS_BYTES  = 4 * 1024 * 1024       # workers report after roughly this much input
+
+
+def pulse_id(timestamp, username, hostname, status):
+    """Deterministic ObjectId: the pulse's second as the timestamp part, a hash of the pulse as the rest."""
+    digest = hashlib.sha1(f"{username}|{hostname}|{timestamp.isoformat()}|{status}".encode("utf-8")).digest()
+    return ObjectId(struct.pack(">I", calendar.timegm(timestamp.timetuple())) + digest[:8])
+
+
+def infer_owner(folder):
+    """
+    Reads (username, hostname) from a path like \\\\HOST\\C$\\Users\\<user>\\InactivityDetector
+    or <root>\\<host>\\Users\\<user>\\InactivityDetector. Either part may be None.
+    """
+    parts = [part for part in re.split(r"[\\/]+", os.path.abspath(folder)) if part]
+    if "InactivityDetector" not in parts:
+        return None, None
+    index = len(parts) - 1 - parts[::-1].index("InactivityDetector")
+    username = parts[index - 1] if index >= 1 else None
+
+    hostname = None
+    if index >= 3 and parts[index - 2].lower() == "users":
+        candidates = [part for part in parts[:index - 2] if not DRIVE.match(part)]
+        hostname = candidates[-1] if candidates else None
+    return username, hostname
+
+
+# =============================================================================
+# Discovery
+# =============================================================================
+def discover(paths, username=None, hostname=None):
+    """
+    Groups the log files below `paths` by folder.
+    Returns:
+        list: (folder, username, hostname, [files]) per folder, largest first so
+              the pool is not left waiting on one big folder at the end.
+    """
+    folders = {}
+    for path in paths:
+        if os.path.isfile(path):
+            folders.setdefault(os.path.dirname(os.path.abspath(path)), set()).add(os.path.abspath(path))
+            continue
+        for root, _, names in os.walk(path):
+            files = [os.path.join(root, name) for name in names if name.startswith(LOG_NAMES)]
+            if files:
+                folders.setdefault(os.path.abspath(root), set()).update(files)
+
+    groups = []
+    for folder, files in folders.items():
+        user, host = infer_owner(folder)
+        user, host = username or user, hostname or host
+        if not user or not host:
+            logging.warning(f"Skipping {folder}: cannot tell the user and host; pass --username/--hostname.")
+            continue
+        groups.append((folder, user, host, sorted(files)))
+
+    groups.sort(key=lambda group: -sum(os.path.getsize(path) for path in group[3]))
+    return groups
+
+
+# =============================================================================
+# Parsing
+# =============================================================================
+def read_events(path, progress=None):
+    """
+    Streams (timestamp, message) from one log file, in file order.
+    `progress(bytes)` is called with the compressed bytes consumed since the last call.
+    """
+    with open(path, "rb") as raw:
+        stream = gzip.GzipFile(fileobj=raw) if path.endswith(".gz") else raw
+        reported = 0
+        for line in stream:
+            if progress and raw.tell() - reported >= PROGRESS_BYTES:
+                progress(raw.tell() - reported)
+                reported = raw.tell()
+            if MARKER not in line:
+                continue
+            match = LINE.match(line)
+            if not match:
+                continue
+            year, month, day, hour, minute, second, millis, message = match.groups()
+            timestamp = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second), int(millis) * 1000)
+            yield timestamp, message.decode("utf-8", "replace")
+        if progress:
+            progress(raw.tell() - reported)
+
+
+def reconstruct_pulses(events, username, hostname, max_gap):
+    """
+    Replays timestamp-ordered (timestamp, message) events into monitor-style pulses.
+    A status pulse carries the length of the period it ends: "Inactive" the preceding
+    active time, "Active" the preceding inactive time. Periods longer than `max_gap`
+    seconds (the host was off or asleep) are not counted.
+    """
+    status, since = None, None
+    for timestamp, message in events:
+        kind = message.lower()
+        if message in TRANSITIONS:
+            if message == status:
+                continue
+            duration = (timestamp - since).total_seconds() if status else 0
+            yield make_pulse(username, hostname, timestamp, message, duration if duration <= max_gap else 0)
+            status, since = message, timestamp
+        elif kind in SESSION_END:
+            if status == "Active":
+                duration = (timestamp - since).total_seconds()
+                yield make_pulse(username, hostname, timestamp, "Inactive", duration if duration <= max_gap else 0)
+            status, since = None, None
+        elif kind in SESSION_START:
+            status, since = None, None
+
+
+def make_pulse(username, hostname, timestamp, status, duration):
+    duration = round(max(duration, 0), 2)
+    return {
+        "_id": pulse_id(timestamp, username, hostname, status),
+        "username": username,
+        "hostname": hostname,
+        "timestamp": timestamp,
+        "status": status,
+        "active_time": duration if status == "Inactive" else 0,
+        "inactive_time": duration if status == "Active" else 0,
+        "source": "log_import",
+    }
+
+
+# =============================================================================
+# Worker
+# =============================================================================
+def import_group(group, options, progress_queue=None):
+    """
+    Parses one folder's logs and writes its pulses in batches. Runs in a worker process,
+    which opens its own database connection.
+    Returns:
+        dict: folder, pulses and inserted counts.
+    """
+    folder, username, hostname, files = group
+
+    def progress(consumed):
+        if progress_queue is not None:
+            progress_queue.put(consumed)
+
+    events = heapq.merge(*(read_events(path, progress) for path in files), key=lambda event: event[0])
+    pulses = reconstruct_pulses(events, username, hostname, options["max_gap"])
+
+    db = None if options["dry_run"] else open_database(options["backend"], buffered=False)
+    total = inserted = 0
+    try:
+        batch = []
+        for pulse in pulses:
+            batch.append(pulse)
+            if len(batch) >= options["batch_size"]:
+                inserted += db.insert_pulses(batch) if db else 0
+                total += len(batch)
+                batch = []
+        inserted += db.insert_pulses(batch) if db and batch else 0
+        total += len(batch)
+    finally:
+        if db:
+            db.close()
+    return {"folder": folder, "pulses": total, "inserted": inserted}
+
+
+# =============================================================================
+# import_logs
+# =============================================================================
+def import_logs(groups, backend=None, workers=None, batch_size=1000, max_gap=12 * 3600,
+                dry_run=False, report_every=5):
+    """
+    Imports every folder group on a process pool and logs progress while it runs.
+    Returns:
+        dict: Totals for bytes, pulses and inserted pulses.
+    """
+    options = {"backend": backend, "batch_size": batch_size, "max_gap": max_gap, "dry_run": dry_run}
+    total_bytes = sum(os.path.getsize(path) for group in groups for path in group[3])
+    totals = {"bytes": 0, "pulses": 0, "inserted": 0, "failed": 0}
+    started = last_report = time.monotonic()
+
+    with multiprocessing.Manager() as manager, ProcessPoolExecutor(max_workers=workers) as pool:
+        progress_queue = manager.Queue()
+        pending = {pool.submit(import_group, group, options, progress_queue): group for group in groups}
+
+        while pending:
+            done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                folder = pending.pop(future)[0]
+                try:
+                    result = future.result()
+                    totals["pulses"] += result["pulses"]
+                    totals["inserted"] += result["inserted"]
+                    logging.info(f"{folder}: {result['pulses']} pulses, {result['inserted']} new.")
+                except Exception as e:
+                    totals["failed"] += 1
+                    logging.error(f"Import failed for {folder}: {e}")
+
+            try:
+                while True:
+                    totals["bytes"] += progress_queue.get_nowait()
+            except queue.Empty:
+                pass
+
+            if time.monotonic() - last_report >= report_every or not pending:
+                last_report = time.monotonic()
+                elapsed = max(last_report - started, 1e-6)
+                logging.info(
+                    f"Progress: {totals['bytes'] / 1024 / 1024:.0f}/{total_bytes / 1024 / 1024:.0f} MiB "
+                    f"({100 * totals['bytes'] / max(total_bytes, 1):.0f}%), "
+                    f"{totals['bytes'] / 1024 / 1024 / elapsed:.1f} MiB/s, "
+                    f"{len(groups) - len(pending)}/{len(groups)} folders, "
+                    f"{totals['pulses'] / elapsed:.0f} pulses/s."
+                )
+
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill activity pulses from Idle Reporter log files.")
+    parser.add_argument("paths", nargs="+", help="Log files or folders to search for InactivityDetector logs.")
+    parser.add_argument("--username", help="User for logs outside a Users\\<name>\\InactivityDetector folder.")
+    parser.add_argument("--hostname", help="Host for logs whose path does not name it.")
+    parser.add_argument("--backend", choices=BACKENDS, help="Storage backend; defaults to storage.backend.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Pulses per bulk insert.")
+    parser.add_argument("--max-gap", type=float, default=12 * 3600,
+                        help="Seconds after which a period is treated as downtime and not counted.")
+    parser.add_argument("--dry-run", action="store_true", help="Parse and count only; write nothing.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    groups = discover(args.paths, args.username, args.hostname)
+    if not groups:
+        logging.warning("No importable log files found.")
+        return
+
+    started = time.monotonic()
+    totals = import_logs(groups, args.backend, args.workers, args.batch_size, args.max_gap, args.dry_run)
+    elapsed = max(time.monotonic() - started, 1e-6)
+    logging.info(
+        f"Imported {totals['inserted']} new of {totals['pulses']} pulses from "
+        f"{totals['bytes'] / 1024 / 1024:.1f} MiB in {elapsed:.1f}s "
+        f"({totals['bytes'] / 1024 / 1024 / elapsed:.1f} MiB/s); {totals['failed']} folders failed."
+    )
+
+
+if __name__ == "__main__":
+    main()
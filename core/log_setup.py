@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# log_setup.py - Non-blocking, rotating log files for the agents
+# Author: Sanja
+
+# Heart Beat Application - Log Setup
+# The agents log from their polling loops, often to a home drive on the network.
+# Loggers set up here only put records on an in-memory queue; one background
+# listener thread per process formats them and writes them to their files:
+#   - size ("size", max_bytes/backup_count) or time ("time", when/backup_count)
+#     based rotation, configured in the `logging` section of config.yml
+#   - rotated files are gzipped by the listener (idle_reporter.log.1.gz, ...);
+#     log_importer reads them as they are
+#   - every file has exactly one handler per process, however many loggers
+#     write to it, so rotation never races within a process
+# =============================================================================
+# Imports
+# =============================================================================
+import os
+import gzip
+import queue
+import atexit
+import shutil
+import logging
+import threading
+import logging.handlers
+
+from config_service import get_config
+
+LOG_FORMAT          = "%(asctime)s - %(levelname)s - %(message)s"
+LOGGING_DEFAULTS    = {
+    "rotation": "size",         # "size", "time" or "none"
+    "max_bytes": 10 * 1024 * 1024,
+    "when": "midnight",         # TimedRotatingFileHandler interval for "time"
+    "backup_count": 5,
+    "compress": True,
+}
+
+_queue          = queue.SimpleQueue()
+_targets        = {}            # normalized path -> file handler
+_lock           = threading.Lock()
+_listener       = None
+
+
+# -----------------------------------------------------------------------------
+# File handlers
+# -----------------------------------------------------------------------------
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def file_handler(path, settings=None):
+    """
+    Builds the rotating file handler for `path`.
+    Args:
+        settings (dict, optional): Overrides for the `logging` section of config.yml.
+    Returns:
+        logging.Handler: A handler that opens the file on the first record.
+    """
+    if settings is None:
+        try:
+            settings = get_config().section("logging", LOGGING_DEFAULTS)
+        except Exception:
+            settings = LOGGING_DEFAULTS
+    settings = {**LOGGING_DEFAULTS, **settings}
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    rotation = settings["rotation"]
+    if rotation == "time":
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=settings["when"], backupCount=settings["backup_count"], delay=True, encoding="utf-8"
+        )
+    elif rotation == "size":
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=settings["max_bytes"], backupCount=settings["backup_count"], delay=True, encoding="utf-8"
+        )
+    else:
+        handler = logging.FileHandler(path, delay=True, encoding="utf-8")
+
+    if rotation in ("size", "time") and settings["compress"]:
+        handler.namer = lambda name: name + ".gz"
+        handler.rotator = _gzip_rotator
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return handler
+
+
+# =============================================================================
+# Queue plumbing
+# =============================================================================
+class _TargetQueueHandler(logging.handlers.QueueHandler):
+    """Queues records tagged with the file they belong to."""
+
+    def __init__(self, target):
+        super().__init__(_queue)
+        self.target = target
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.log_target = self.target
+        return record
+
+
+class _Router(logging.Handler):
+    """Runs on the listener thread; hands each record to its file's handler."""
+
+    def handle(self, record):
+        handler = _targets.get(getattr(record, "log_target", None))
+        if handler:
+            handler.handle(record)
+        return True
+
+
+def _target(path, settings):
+    """Registers the file handler for `path` once and makes sure the listener runs."""
+    global _listener
+    key = os.path.normcase(os.path.abspath(path))
+    with _lock:
+        if key not in _targets:
+            _targets[key] = file_handler(path, settings)
+        if _listener is None:
+            _listener = logging.handlers.QueueListener(_queue, _Router())
+            _listener.start()
+            atexit.register(stop_logging)
+    return key
+
+
+def stop_logging():
+    """Writes out queued records, stops the listener and closes the files."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        for handler in _targets.values():
+            handler.close()
+        _targets.clear()
+
+
+# =============================================================================
+# Public API
+# =============================================================================
+def setup_logging(path, level=logging.INFO, settings=None):
+    """
+    Sends the root logger to `path` through the queue, replacing its handlers
+    (including any a basicConfig call installed).
+    Args:
+        path (str): Log file.
+        level (int): Root logger level.
+        settings (dict, optional): Rotation settings; defaults to config.yml.
+    """
+    handler = _TargetQueueHandler(_target(path, settings))
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def get_file_logger(name, path, level=logging.INFO, settings=None):
+    """
+    Returns the logger `name`, writing to `path` through the queue and nowhere else.
+    Repeated calls return the same logger without adding handlers.
+    """
+    logger = logging.getLogger(name)
+    if not any(isinstance(handler, _TargetQueueHandler) for handler in logger.handlers):
+        logger.addHandler(_TargetQueueHandler(_target(path, settings)))
+        logger.setLevel(level)
+        logger.propagate = False
+    return logger
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# migrate_pulses.py - Copy activity pulses between storage layouts
+# Author: Sanja
+#
+# Usage:
+#   python migrate_pulses.py timeseries                       (activity_pulse -> activity_pulse_ts)
+#   python migrate_pulses.py timeseries --batch-size 5000 --target activity_pulse_ts
+#   python migrate_pulses.py compact                          (activity_pulse -> activity_pulse_compact)
+#
+# The copy runs in `_id` order and records its progress in the 'pulse_migrations'
+# collection, so an interrupted run resumes where it stopped. Switch
+# `mongodb.pulse_layout` to the new layout in config.yml once the copy is done;
+# the source collection is left untouched.
+
+import os
+import sys
+import time
+import argparse
+import logging
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, script_dir)
+
+from connect_to_db import MongoDatabase, MANAGED_INDEXES
+
+CHECKPOINTS = "pulse_migrations"
+
+
+TARGETS = {
+    "timeseries": "timeseries_collection",
+    "compact": "compact_collection",
+}
+
+
+def migrate(db, layout, source="activity_pulse", target=None, batch_size=1000, restart=False):
+    """
+    Copies raw pulses from the flat collection into the collection of another layout.
+    Args:
+        db (MongoDatabase): Connected database.
+        layout (str): "timeseries" or "compact".
+        source (str): Flat pulse collection.
+        target (str): Target collection, created if missing. Defaults to the configured one.
+        batch_size (int): Pulses per `insert_many`.
+        restart (bool): Ignore the stored checkpoint and start from the beginning.
+    Returns:
+        int: Number of pulses copied in this run.
+    """
+    target = target or getattr(db, TARGETS[layout])
+    if target == source:
+        raise ValueError("Source and target collection must differ.")
+
+    codec = MongoDatabase.build_codec(db.db, layout)
+    if codec.timeseries:
+        db.ensure_timeseries_collection(target)
+    if codec.compact:
+        codec.names.ensure_index()
+        codec.names.load()
+    for collection_name, keys, options in MANAGED_INDEXES:
+        if collection_name == "activity_pulse":
+            db.db[target].create_index(codec.sort(keys), **options)
+
+    checkpoints = db.db[CHECKPOINTS]
+    checkpoint_id = f"{source}->{target}"
+
+    query = {}
+    state = None if restart else checkpoints.find_one({"_id": checkpoint_id})
+    if state:
+        query["_id"] = {"$gt": state["last_id"]}
+        logging.info(f"Resuming migration after _id {state['last_id']}.")
+
+    copied = 0
+    started = time.perf_counter()
+    cursor = db.db[source].find(query, sort=[("_id", 1)], batch_size=batch_size)
+    try:
+        batch = []
+        for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                copied += _copy_batch(db, codec, target, batch, checkpoints, checkpoint_id)
+                batch = []
+        if batch:
+            copied += _copy_batch(db, codec, target, batch, checkpoints, checkpoint_id)
+    finally:
+        cursor.close()
+
+    elapsed = max(time.perf_counter() - started, 1e-6)
+    logging.info(f"Copied {copied} pulses into '{target}' at {copied / elapsed:.0f} pulses/s.")
+    return copied
+
+
+def _copy_batch(db, codec, target, batch, checkpoints, checkpoint_id):
+    """Writes one batch, skipping pulses a previous run already copied, then moves the checkpoint."""
+    query = MongoDatabase.existing_pulses_query(batch)
+    existing = {row["_id"] for row in db.db[target].find(codec.query(query), {"_id": 1})} if query else set()
+    fresh = [codec.encode(doc) for doc in batch if doc["_id"] not in existing]
+    if fresh:
+        db.db[target].insert_many(fresh, ordered=False)
+
+    checkpoints.update_one({"_id": checkpoint_id}, {"$set": {"last_id": batch[-1]["_id"]}}, upsert=True)
+    return len(fresh)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate activity pulses between storage layouts.")
+    commands = parser.add_subparsers(dest="layout", required=True)
+
+    for layout, help_text in (
+        ("timeseries", "Copy activity_pulse into a time-series collection."),
+        ("compact", "Copy activity_pulse into the compact collection, interning users and hosts."),
+    ):
+        command = commands.add_parser(layout, help=help_text)
+        command.add_argument("--source", default="activity_pulse", help="Flat pulse collection.")
+        command.add_argument("--target", help=f"Target collection (default: mongodb.{TARGETS[layout]}).")
+        command.add_argument("--batch-size", type=int, default=1000)
+        command.add_argument("--restart", action="store_true", help="Ignore the stored checkpoint.")
+    args = parser.parse_args()
+
+    with MongoDatabase(buffered=False) as db:
+        migrate(
+            db, args.layout, source=args.source, target=args.target,
+            batch_size=args.batch_size, restart=args.restart,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+# pulse_archive.py - Compressed, date-partitioned archive of old activity pulses
+# Author: Sanja
+
+# Heart Beat Application - Pulse Archive
+# Raw pulses older than the hot window are moved out of MongoDB into files on a
+# shared path, one file per user and day:
+#
+#   <archive.path>/2025/04/2025-04-17/sanja.jsonl.zst   (zstandard if installed)
+#   <archive.path>/2025/04/2025-04-17/sanja.jsonl.gz    (gzip otherwise)
+#
+# Each line is one logical pulse in MongoDB extended JSON, sorted by timestamp.
+# Readers only open the day directories inside the requested range, and only
+# the file of the requested user, so a query never scans unrelated partitions.
+# The per-day rollups stay in 'daily_user_stats'.
+# =============================================================================
+# Imports
+# =============================================================================
+import os
+import io
+import gzip
+from datetime import datetime
+from urllib.parse import quote
+from bson import json_util
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXTENSIONS      = {"zstd": ".jsonl.zst", "gzip": ".jsonl.gz"}
+ARCHIVE_JSON    = json_util.JSONOptions(json_mode=json_util.JSONMode.RELAXED, tz_aware=False)
+RANGE_OPERATORS = {
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+
+def matches(doc, query):
+    """
+    Evaluates the subset of MongoDB filters that the pulse queries use
+    (equality, comparison operators, $in/$nin, $and/$or) against a logical pulse.
+    """
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, part) for part in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+            for operator, operand in condition.items():
+                if operator not in RANGE_OPERATORS:
+                    raise ValueError(f"Operator {operator} is not supported on archived pulses.")
+                if not RANGE_OPERATORS[operator](doc.get(key), operand):
+                    return False
+        elif doc.get(key) != condition:
+            return False
+    return True
+
+
+def project(doc, projection):
+    """Applies a list or inclusion/exclusion dict projection the way MongoDB would."""
+    if not projection:
+        return doc
+    if not isinstance(projection, dict):
+        projection = {field: 1 for field in projection}
+
+    excluded = [field for field, value in projection.items() if not value]
+    included = [field for field, value in projection.items() if value]
+    if included:
+        keep = set(included) | ({"_id"} if "_id" not in excluded else set())
+        return {key: value for key, value in doc.items() if key in keep}
+    return {key: value for key, value in doc.items() if key not in excluded}
+
+
+# =============================================================================
+# PulseArchive Class
+# =============================================================================
+class PulseArchive:
+
+    # -------------------------------------------------------------------------
+    # _init_
+    # -------------------------------------------------------------------------
+    def __init__(self, path, compression="auto"):
+        """
+        Args:
+            path (str): Root directory of the archive (usually a shared drive).
+            compression (str): "zstd", "gzip" or "auto" (zstd when the zstandard package is installed).
+        """
+        if compression == "auto":
+            compression = "zstd" if zstandard else "gzip"
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unknown archive compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstd archive compression needs the 'zstandard' package.")
+
+        self.path           = path
+        self.compression    = compression
+
+    # -------------------------------------------------------------------------
+    # day_dir / partition_path
+    # -------------------------------------------------------------------------
+    def day_dir(self, day):
+        return os.path.join(self.path, f"{day:%Y}", f"{day:%m}", f"{day:%Y-%m-%d}")
+
+    def partition_path(self, day, username, compression=None):
+        name = quote(str(username), safe="") + EXTENSIONS[compression or self.compression]
+        return os.path.join(self.day_dir(day), name)
+
+    # -------------------------------------------------------------------------
+    # days
+    # -------------------------------------------------------------------------
+    def days(self, start=None, end=None):
+        """
+        Returns the archived days inside [start, end], oldest first.
+        Only the year and month directories overlapping the range are listed.
+        """
+        first = start.date() if isinstance(start, datetime) else start
+        last = end.date() if isinstance(end, datetime) else end
+
+        found = []
+        for year in self._listdir(self.path):
+            if not year.isdigit() or (first and int(year) < first.year) or (last and int(year) > last.year):
+                continue
+            for month in self._listdir(os.path.join(self.path, year)):
+                if not month.isdigit():
+                    continue
+                if first and (int(year), int(month)) < (first.year, first.month):
+                    continue
+                if last and (int(year), int(month)) > (last.year, last.month):
+                    continue
+                for name in self._listdir(os.path.join(self.path, year, month)):
+                    try:
+                        day = datetime.strptime(name, "%Y-%m-%d").date()
+                    except ValueError:
+                        continue
+                    if (not first or day >= first) and (not last or day <= last):
+                        found.append(day)
+        return sorted(found)
+
+    @staticmethod
+    def _listdir(path):
+        try:
+            return os.listdir(path)
+        except FileNotFoundError:
+            return []
+
+    # -------------------------------------------------------------------------
+    # partitions
+    # -------------------------------------------------------------------------
+    def partitions(self, start=None, end=None, username=None):
+        """Yields (day, path) for every partition file a query over the range must read."""
+        for day in self.days(start, end):
+            for path in self._day_partitions(day, username):
+                yield day, path
+
+    def _day_partitions(self, day, username=None):
+        if username is not None:
+            candidates = [self.partition_path(day, username, compression) for compression in EXTENSIONS]
+            return [path for path in candidates if os.path.exists(path)]
+        folder = self.day_dir(day)
+        return sorted(os.path.join(folder, name) for name in self._listdir(folder) if self._codec_of(name))
+
+    # -------------------------------------------------------------------------
+    # write_partition
+    # -------------------------------------------------------------------------
+    def write_partition(self, day, username, docs):
+        """
+        Writes one user's pulses for one day. Pulses already in the partition are kept
+        and de-duplicated by `_id`, so re-running an interrupted archive job is safe.
+        The file is written next to its final name and swapped in atomically.
+        Returns:
+            str: Path of the partition file.
+        """
+        path = self.partition_path(day, username)
+        existing = self._day_partitions(day, username)
+        merged = {doc["_id"]: doc for old in existing for doc in self.read_partition(old)}
+        merged.update((doc["_id"], doc) for doc in docs)
+        ordered = sorted(merged.values(), key=lambda doc: doc.get("timestamp") or datetime.min)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with self._open(temp_path, "wb") as file:
+            for doc in ordered:
+                file.write(json_util.dumps(doc, json_options=ARCHIVE_JSON).encode("utf-8") + b"\n")
+        os.replace(temp_path, path)
+
+        # A partition written with the other compression has just been merged in
+        for old in existing:
+            if old != path:
+                os.remove(old)
+        return path
+
+    # -------------------------------------------------------------------------
+    # read_partition
+    # -------------------------------------------------------------------------
+    def read_partition(self, path):
+        """Yields the pulses stored in one partition file, in timestamp order."""
+        with self._open(path, "rb") as file:
+            for line in io.TextIOWrapper(file, encoding="utf-8"):
+                if line.strip():
+                    yield json_util.loads(line, json_options=ARCHIVE_JSON)
+
+    # -------------------------------------------------------------------------
+    # iter_pulses
+    # -------------------------------------------------------------------------
+    def iter_pulses(self, username=None, hostname=None, start=None, end=None, query=None,
+                    projection=None, descending=False):
+        """
+        Streams archived pulses in timestamp order, reading only the partitions
+        that overlap the range (and belong to `username`, when given).
+        Args:
+            username, hostname, start, end, query: Same meaning as `MongoDatabase.build_query`.
+            projection (dict or list, optional): Fields to return.
+            descending (bool): Newest first instead of oldest first.
+        Yields:
+            dict: Logical pulse documents.
+        """
+        query = dict(query or {})
+        if hostname:
+            query["hostname"] = hostname
+        bounds = {}
+        if start:
+            bounds["$gte"] = start
+        if end:
+            bounds["$lte"] = end
+        if bounds:
+            query = {"$and": [query, {"timestamp": bounds}]}
+
+        days = self.days(start, end)
+        if descending:
+            days.reverse()
+
+        for day in days:
+            paths = self._day_partitions(day, username)
+            if not paths:
+                continue
+            # One user-day is a few hundred pulses; several users are merged into one order
+            docs = [doc for path in paths for doc in self.read_partition(path)]
+            if len(paths) > 1 or descending:
+                docs.sort(key=lambda doc: doc.get("timestamp") or datetime.min, reverse=descending)
+
+            for doc in docs:
+                if matches(doc, query):
+                    yield project(doc, projection)
+
+    # -------------------------------------------------------------------------
+    # helpers
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _codec_of(path):
+        for compression, extension in EXTENSIONS.items():
+            if path.endswith(extension):
+                return compression
+        return None
+
+    def _open(self, path, mode):
+        compression = self._codec_of(path.replace(".tmp", "")) or self.compression
+        if compression == "zstd":
+            if zstandard is None:
+                raise RuntimeError(f"Reading {path} needs the 'zstandard' package.")
+            return zstandard.open(path, mode)
+        return gzip.open(path, mode)
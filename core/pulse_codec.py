@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+# pulse_codec.py - Maps logical pulse fields to the stored document layout
+# Author: Sanja
+
+# Heart Beat Application - Pulse Codec
+# Callers always read and write logical pulses (username, hostname, timestamp,
+# status, active_time, ...). The codec translates them to and from the layout
+# configured in config.yml, so queries, projections, sorts and pipelines work
+# unchanged on every layout:
+#   - "standard":   flat documents in 'activity_pulse'
+#   - "timeseries": MongoDB time-series collection, timeField=timestamp and
+#                   metaField=meta holding {username, hostname}
+#   - "compact":    single-letter keys, whole-second durations, status codes and
+#                   username/hostname interned as integer ids in 'pulse_names'
+# =============================================================================
+# Imports
+# =============================================================================
+import logging
+import threading
+from pymongo import ASCENDING, ReturnDocument, errors
+
+LAYOUTS         = ("standard", "timeseries", "compact")
+TIME_FIELD      = "timestamp"
+META_FIELD      = "meta"
+META_KEYS       = ("username", "hostname")
+
+NAMES_COLLECTION = "pulse_names"
+NAME_KINDS      = {"username": "user", "hostname": "host"}
+UNKNOWN_NAME_ID = -1     # stands in for names that were never interned, so they match nothing
+COMPACT_KEYS    = {
+    "username": "u",
+    "hostname": "h",
+    "timestamp": "t",
+    "status": "s",
+    "active_time": "a",
+    "inactive_time": "i",
+}
+COMPACT_FIELDS  = {short: name for name, short in COMPACT_KEYS.items()}
+COMPACT_STATUS  = {"Active": 1, "Inactive": 0}
+STATUS_NAMES    = {code: status for status, code in COMPACT_STATUS.items()}
+INTEGER_FIELDS  = ("active_time", "inactive_time")
+LIST_OPERATORS  = ("$in", "$nin")
+VALUE_OPERATORS = ("$eq", "$ne")
+
+
+# =============================================================================
+# PulseNames Class
+# =============================================================================
+class PulseNames:
+    """
+    Interns usernames and hostnames as small integer ids for the compact layout.
+    Documents in 'pulse_names' look like {_id: 7, kind: "user", name: "sanja"};
+    the next free id lives in the {_id: "sequence"} document. Lookups are cached
+    in both directions, so the database is only asked about names it has not seen.
+    """
+
+    # -------------------------------------------------------------------------
+    # _init_
+    # -------------------------------------------------------------------------
+    def __init__(self, collection):
+        self.collection = collection
+        self._ids       = {}
+        self._names     = {}
+        self._lock      = threading.Lock()
+
+    # -------------------------------------------------------------------------
+    # ensure_index
+    # -------------------------------------------------------------------------
+    def ensure_index(self):
+        self.collection.create_index([("kind", ASCENDING), ("name", ASCENDING)], unique=True, name="kind_name")
+
+    # -------------------------------------------------------------------------
+    # id_for
+    # -------------------------------------------------------------------------
+    def id_for(self, kind, name, create=True):
+        """
+        Returns the id of a name, allocating one if needed.
+        Args:
+            kind (str): "user" or "host".
+            name (str): The username or hostname.
+            create (bool): Allocate an id for unseen names. Queries pass False.
+        Returns:
+            int: The id, or UNKNOWN_NAME_ID for an unseen name when `create` is False.
+        """
+        key = (kind, name)
+        with self._lock:
+            if key in self._ids:
+                return self._ids[key]
+
+        row = self.collection.find_one({"kind": kind, "name": name})
+        if row is None:
+            if not create:
+                return UNKNOWN_NAME_ID
+            row = self._allocate(kind, name)
+
+        self._remember(row)
+        return row["_id"]
+
+    def _allocate(self, kind, name):
+        """Reserves the next id for `name`. Concurrent writers fall back to the winner's row."""
+        sequence = self.collection.find_one_and_update(
+            {"_id": "sequence"}, {"$inc": {"next": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        row = {"_id": sequence["next"], "kind": kind, "name": name}
+        try:
+            self.collection.insert_one(row)
+        except errors.DuplicateKeyError:
+            row = self.collection.find_one({"kind": kind, "name": name})
+        logging.info(f"Interned {kind} '{name}' as {row['_id']}.")
+        return row
+
+    # -------------------------------------------------------------------------
+    # name_for
+    # -------------------------------------------------------------------------
+    def name_for(self, name_id):
+        """Returns the name behind an id, or the id itself if it is unknown."""
+        with self._lock:
+            if name_id in self._names:
+                return self._names[name_id]
+
+        row = self.collection.find_one({"_id": name_id})
+        if row is None:
+            return name_id
+        self._remember(row)
+        return row["name"]
+
+    # -------------------------------------------------------------------------
+    # load
+    # -------------------------------------------------------------------------
+    def load(self):
+        """Caches the whole dictionary; it holds one row per user and host."""
+        for row in self.collection.find({"kind": {"$exists": True}}):
+            self._remember(row)
+
+    def _remember(self, row):
+        with self._lock:
+            self._ids[(row["kind"], row["name"])] = row["_id"]
+            self._names[row["_id"]] = row["name"]
+
+
+# =============================================================================
+# PulseCodec Class
+# =============================================================================
+class PulseCodec:
+
+    # -------------------------------------------------------------------------
+    # _init_
+    # -------------------------------------------------------------------------
+    def __init__(self, layout="standard", names=None):
+        """
+        Args:
+            layout (str): One of LAYOUTS.
+            names (PulseNames, optional): Name dictionary, required by the compact layout.
+        """
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown pulse layout: {layout}")
+        if layout == "compact" and names is None:
+            raise ValueError("The compact pulse layout needs a PulseNames dictionary.")
+        self.layout = layout
+        self.names  = names
+
+    @property
+    def timeseries(self):
+        return self.layout == "timeseries"
+
+    @property
+    def compact(self):
+        return self.layout == "compact"
+
+    # -------------------------------------------------------------------------
+    # field / expr
+    # -------------------------------------------------------------------------
+    def field(self, name):
+        """Returns the stored path of a logical field."""
+        if self.timeseries and name in META_KEYS:
+            return f"{META_FIELD}.{name}"
+        if self.compact:
+            return COMPACT_KEYS.get(name, name)
+        return name
+
+    def expr(self, name):
+        """Returns an aggregation field reference (`$path`) for a logical field."""
+        return "$" + self.field(name)
+
+    # -------------------------------------------------------------------------
+    # encode / decode
+    # -------------------------------------------------------------------------
+    def encode(self, doc):
+        """Converts a logical pulse into the stored document. The input is not modified."""
+        if self.timeseries:
+            stored = {key: value for key, value in doc.items() if key not in META_KEYS}
+            meta = {key: doc[key] for key in META_KEYS if key in doc}
+            if meta:
+                stored[META_FIELD] = meta
+            return stored
+
+        if self.compact:
+            return {self.field(key): self.encode_value(key, value, create=True) for key, value in doc.items()}
+
+        return doc
+
+    def decode(self, doc):
+        """Converts a stored document back into a logical pulse (in place)."""
+        if self.timeseries:
+            meta = doc.pop(META_FIELD, None) or {}
+            doc.update(meta)
+
+        elif self.compact:
+            for short in [key for key in doc if key in COMPACT_FIELDS]:
+                name = COMPACT_FIELDS[short]
+                value = doc.pop(short)
+                if name in NAME_KINDS:
+                    value = self.names.name_for(value)
+                elif name == "status":
+                    value = STATUS_NAMES.get(value, value)
+                doc[name] = value
+
+        return doc
+
+    def encode_value(self, name, value, create=False):
+        """Encodes one field value, e.g. a literal compared inside an aggregation expression."""
+        if not self.compact:
+            return value
+        if name in NAME_KINDS and isinstance(value, str):
+            return self.names.id_for(NAME_KINDS[name], value, create=create)
+        if name == "status":
+            return COMPACT_STATUS.get(value, value)
+        if name in INTEGER_FIELDS and isinstance(value, float):
+            return int(round(value))
+        return value
+
+    # -------------------------------------------------------------------------
+    # query / projection / sort
+    # -------------------------------------------------------------------------
+    def query(self, query):
+        """Maps the field names (and compact values) of a logical filter, including nested $and/$or/$nor."""
+        if self.layout == "standard" or not query:
+            return query
+
+        mapped = {}
+        for key, value in query.items():
+            if key in ("$and", "$or", "$nor"):
+                mapped[key] = [self.query(part) for part in value]
+            elif self.compact:
+                mapped[self.field(key)] = self.encode_condition(key, value)
+            else:
+                mapped[self.field(key)] = value
+        return mapped
+
+    def encode_condition(self, name, condition):
+        """Encodes equality and membership operands; range operands are left as they are."""
+        if not isinstance(condition, dict):
+            return self.encode_value(name, condition)
+
+        encoded = {}
+        for operator, operand in condition.items():
+            if operator in LIST_OPERATORS:
+                operand = [self.encode_value(name, value) for value in operand]
+            elif operator in VALUE_OPERATORS:
+                operand = self.encode_value(name, operand)
+            encoded[operator] = operand
+        return encoded
+
+    def projection(self, projection):
+        """Maps a projection given as a list of fields or as a dict."""
+        if self.layout == "standard" or not projection:
+            return projection
+        if isinstance(projection, dict):
+            return {self.field(key): value for key, value in projection.items()}
+        return [self.field(key) for key in projection]
+
+    def sort(self, sort):
+        """Maps a sort specification given as a list of (field, direction) pairs."""
+        if self.layout == "standard" or not sort:
+            return sort
+        return [(self.field(key), direction) for key, direction in sort]
+
+    # -------------------------------------------------------------------------
+    # name_stages
+    # -------------------------------------------------------------------------
+    def name_stages(self, paths):
+        """
+        Pipeline stages that turn interned ids at `paths` (e.g. "_id.username") back
+        into names. Only the compact layout needs them; other layouts get [].
+        """
+        if not self.compact:
+            return []
+
+        stages = []
+        for path in paths:
+            stages += [
+                {"$lookup": {
+                    "from": self.names.collection.name,
+                    "localField": path,
+                    "foreignField": "_id",
+                    "as": "_name",
+                }},
+                {"$addFields": {path: {"$ifNull": [{"$arrayElemAt": ["$_name.name", 0]}, "$" + path]}}},
+                {"$project": {"_name": 0}},
+            ]
+        return stages
+
+    # -------------------------------------------------------------------------
+    # timeseries_options
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def timeseries_options(granularity="seconds"):
+        """Options for `create_collection(..., timeseries=...)`."""
+        return {"timeField": TIME_FIELD, "metaField": META_FIELD, "granularity": granularity}
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+# pulse_spool.py - Durable local spool for activity pulses
+# Author: Sanja
+
+# Heart Beat Application - Pulse Spool
+# Every pulse is appended to a small SQLite file in the user's InactivityDetector
+# folder before it goes anywhere near MongoDB. A background drainer replays the
+# spool in bulk once a database connection is available, so a slow or unreachable
+# server never blocks the monitor loop and never loses a pulse. Pulses the
+# database rejects for good (validation, oversized documents) are moved to the
+# 'dead_letters' table so they cannot block the pulses queued behind them.
+# =============================================================================
+# Imports
+# =============================================================================
+import os
+import sys
+import time
+import sqlite3
+import logging
+import threading
+from bson import ObjectId, json_util
+from pymongo import errors
+
+script_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, script_path)
+
+from resilience import CircuitOpenError, is_transient
+
+
+# =============================================================================
+# PulseSpool Class
+# =============================================================================
+class PulseSpool:
+
+    # -------------------------------------------------------------------------
+    # _init_
+    # -------------------------------------------------------------------------
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, batch_size=500):
+        """
+        Opens (or creates) the spool file.
+        Args:
+            path (str): Location of the SQLite spool file.
+            max_bytes (int): Upper bound for queued pulse data. Oldest pulses are dropped beyond it.
+            batch_size (int): Number of pulses replayed per `insert_many` call.
+        """
+        self.path           = path
+        self.max_bytes      = max_bytes
+        self.batch_size     = batch_size
+        self._lock          = threading.Lock()
+        self._drain_lock    = threading.Lock()   # one drain at a time (drainer thread, day-end summary)
+        self._wakeup        = threading.Event()
+        self._stop          = threading.Event()
+        self._thread        = None
+        self.drain_stats    = {
+            "drained": 0,
+            "batches": 0,
+            "dropped": 0,
+            "rejected": 0,      # pulses moved to the dead-letter table
+            "last_rate": 0.0,   # pulses per second during the last drain
+            "last_drain": None,
+        }
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pulses ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " doc TEXT NOT NULL,"
+            " size INTEGER NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letters ("
+            " seq INTEGER PRIMARY KEY,"
+            " doc TEXT NOT NULL,"
+            " error TEXT,"
+            " failed_at REAL NOT NULL)"
+        )
+        self._pending_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM pulses").fetchone()[0]
+
+    # -------------------------------------------------------------------------
+    # append
+    # -------------------------------------------------------------------------
+    def append(self, doc):
+        """
+        Appends a pulse to the spool and wakes the drainer.
+        A stable `_id` is assigned here so that replaying the same pulse twice is harmless.
+        """
+        doc.setdefault("_id", ObjectId())
+        payload = json_util.dumps(doc)
+
+        with self._lock:
+            self.conn.execute("INSERT INTO pulses (doc, size) VALUES (?, ?)", (payload, len(payload)))
+            self._pending_bytes += len(payload)
+            if self._pending_bytes > self.max_bytes:
+                self._trim()
+
+        self._wakeup.set()
+
+    # -------------------------------------------------------------------------
+    # _trim
+    # -------------------------------------------------------------------------
+    def _trim(self):
+        """Drops the oldest pulses until the spool fits in `max_bytes`. Caller holds the lock."""
+        while self._pending_bytes > self.max_bytes:
+            rows = self.conn.execute("SELECT seq, size FROM pulses ORDER BY seq LIMIT 100").fetchall()
+            if not rows:
+                self._pending_bytes = 0
+                break
+            self.conn.execute("DELETE FROM pulses WHERE seq <= ?", (rows[-1][0],))
+            self._pending_bytes -= sum(size for _, size in rows)
+            self.drain_stats["dropped"] += len(rows)
+
+        logging.warning(f"Pulse spool over {self.max_bytes} bytes; {self.drain_stats['dropped']} oldest pulses dropped so far.")
+
+    # -------------------------------------------------------------------------
+    # pending
+    # -------------------------------------------------------------------------
+    def pending(self):
+        """Returns the number of pulses waiting to be replayed."""
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM pulses").fetchone()[0]
+
+    # -------------------------------------------------------------------------
+    # drain
+    # -------------------------------------------------------------------------
+    def drain(self, db):
+        """
+        Replays queued pulses into the database in bulk, oldest first.
+        Rows are only deleted after the database acknowledged the batch, and the
+        stable `_id`s make a replay after a crash safe. Transient failures leave the
+        batch queued for the next drain; pulses rejected for good are moved to the
+        dead-letter table and the rest of the spool keeps draining.
+        Concurrent calls run one after the other: `_lock` only guards the spool file,
+        and two drains replaying the same batch could store it twice (time-series
+        collections have no unique `_id` index to stop them).
+        Args:
+            db (MongoDatabase): Connected database exposing `insert_pulses`.
+        Returns:
+            int: Number of pulses moved out of the spool.
+        """
+        with self._drain_lock:
+            return self._drain(db)
+
+    def _drain(self, db):
+        drained = 0
+        started = time.perf_counter()
+
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT seq, doc, size FROM pulses ORDER BY seq LIMIT ?", (self.batch_size,)
+                ).fetchall()
+            if not rows:
+                break
+
+            docs = [json_util.loads(doc) for _, doc, _ in rows]
+            rejected = []
+            try:
+                db.insert_pulses(docs)
+            except CircuitOpenError:
+                logging.info("Database circuit open; pulses stay in the spool.")
+                break
+            except Exception as e:
+                if is_transient(e):
+                    logging.error(f"Pulse spool drain failed, will retry: {e}")
+                    break
+                try:
+                    rejected = self._rejected_rows(db, rows, docs, e)
+                except Exception as retry_error:
+                    logging.error(f"Pulse spool drain failed, will retry: {retry_error}")
+                    break
+                logging.error(f"Database rejected {len(rejected)} spooled pulses, moved to dead letters: {e}")
+
+            with self._lock:
+                self.conn.execute("BEGIN")
+                self.conn.executemany(
+                    "INSERT INTO dead_letters (seq, doc, error, failed_at) VALUES (?, ?, ?, ?)",
+                    [(seq, doc, str(error), time.time()) for (seq, doc, _), error in rejected],
+                )
+                self.conn.execute("DELETE FROM pulses WHERE seq <= ?", (rows[-1][0],))
+                self.conn.execute("COMMIT")
+                self._pending_bytes = max(0, self._pending_bytes - sum(size for _, _, size in rows))
+
+            drained += len(rows) - len(rejected)
+            self.drain_stats["rejected"] += len(rejected)
+            self.drain_stats["batches"] += 1
+
+        if drained:
+            elapsed = max(time.perf_counter() - started, 1e-6)
+            self.drain_stats["drained"]     += drained
+            self.drain_stats["last_rate"]   = drained / elapsed
+            self.drain_stats["last_drain"]  = time.time()
+            logging.info(f"Drained {drained} pulses from spool at {drained / elapsed:.0f} pulses/s.")
+
+        return drained
+
+    # -------------------------------------------------------------------------
+    # _rejected_rows
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _rejected_rows(db, rows, docs, error):
+        """
+        Finds the pulses of a failed batch the database refused for good.
+        A BulkWriteError names them in `writeErrors` (duplicates excepted) and the
+        others were written; any other error does not say which pulse caused it,
+        so each one is retried alone. Transient errors during that retry propagate.
+        Returns:
+            list: (row, error) pairs of the rejected pulses.
+        """
+        if isinstance(error, errors.BulkWriteError):
+            failed = {
+                err["index"]: err.get("errmsg", str(error))
+                for err in error.details.get("writeErrors", []) if err.get("code") != 11000
+            }
+            return [(rows[index], message) for index, message in sorted(failed.items())]
+
+        rejected = []
+        for row, doc in zip(rows, docs):
+            try:
+                db.insert_pulses([doc])
+            except Exception as e:
+                if isinstance(e, CircuitOpenError) or is_transient(e):
+                    raise
+                rejected.append((row, e))
+        return rejected
+
+    # -------------------------------------------------------------------------
+    # start_drainer
+    # -------------------------------------------------------------------------
+    def start_drainer(self, get_db, interval=30):
+        """
+        Starts a background thread that drains the spool after every append
+        and at least every `interval` seconds.
+        Args:
+            get_db (callable): Returns a connected database, or None if it is still unreachable.
+            interval (float): Seconds between retries when nothing new was appended.
+        """
+        def loop():
+            while not self._stop.is_set():
+                self._wakeup.wait(interval)
+                self._wakeup.clear()
+                if self._stop.is_set():
+                    break
+                try:
+                    db = get_db()
+                    if db:
+                        self.drain(db)
+                except Exception as e:
+                    logging.error(f"Pulse spool drainer error: {e}")
+
+        self._thread = threading.Thread(target=loop, name="pulse-spool-drainer", daemon=True)
+        self._thread.start()
+
+    # -------------------------------------------------------------------------
+    # close
+    # -------------------------------------------------------------------------
+    def close(self):
+        """Stops the drainer and closes the spool file. Undrained pulses stay on disk."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# rebuild_daily_stats.py - Recompute daily_user_stats from raw pulses
+# Author: Sanja
+#
+# Usage:
+#   python rebuild_daily_stats.py                                  (all history)
+#   python rebuild_daily_stats.py --start 2025-04-01 --end 2025-04-30 --user sanja
+
+import os
+import sys
+import argparse
+import logging
+from datetime import datetime
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, script_dir)
+
+from connect_to_db import MongoDatabase
+
+
+def parse_day(value):
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute daily_user_stats from activity_pulse.")
+    parser.add_argument("--start", type=parse_day, help="First day to rebuild (YYYY-MM-DD).")
+    parser.add_argument("--end", type=parse_day, help="Last day to rebuild (YYYY-MM-DD).")
+    parser.add_argument("--user", help="Only rebuild this user's rollups.")
+    args = parser.parse_args()
+
+    end = datetime.combine(args.end.date(), datetime.max.time()) if args.end else None
+
+    with MongoDatabase(buffered=False) as db:
+        db.rebuild_daily_stats(start=args.start, end=end, username=args.user)
+        logging.info(f"daily_user_stats now holds {db.daily_stats_collection.count_documents({})} rollups.")
+
+
+if __name__ == "__main__":
+    main()
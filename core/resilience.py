@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+# resilience.py - Retries, backoff and a circuit breaker for database writes
+# Author: Sanja
+
+# Heart Beat Application - Resilience
+# When the server is slow or gone, every write would otherwise wait for the full
+# server-selection timeout. The write path therefore:
+#   - retries transient failures a bounded number of times, sleeping a jittered
+#     exponential backoff between attempts (background threads only)
+#   - counts consecutive failures in a circuit breaker; once it opens, writes fail
+#     at once with CircuitOpenError and the caller hands its pulses to a fallback
+#     sink (the local PulseSpool) instead of waiting
+#   - after `reset_timeout` lets a single trial write through; its outcome closes
+#     the breaker again or keeps it open for another period
+# =============================================================================
+# Imports
+# =============================================================================
+import time
+import random
+import asyncio
+import sqlite3
+import logging
+import threading
+from pymongo import errors
+
+RESILIENCE_DEFAULTS = {
+    "attempts": 3,              # tries per batch write, first one included
+    "base_delay": 0.5,          # seconds; the backoff ceiling doubles per attempt
+    "max_delay": 10.0,          # seconds; cap of the backoff ceiling
+    "failure_threshold": 3,     # consecutive transient failures that open the breaker
+    "reset_timeout": 30.0,      # seconds the breaker stays open before a trial write
+    "write_timeout": 2.0,       # seconds an agent's single-pulse write may take
+}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of attempting a write while the circuit breaker is open."""
+
+
+def is_transient(error):
+    """True for errors worth retrying: lost connections, timeouts and a busy SQLite file."""
+    if isinstance(error, (errors.ConnectionFailure, errors.ExecutionTimeout, errors.WTimeoutError, OSError)):
+        return True
+    if isinstance(error, sqlite3.OperationalError):
+        return "locked" in str(error) or "busy" in str(error)
+    # pymongo >= 4.2 flags client-side operation timeouts
+    return bool(getattr(error, "timeout", False))
+
+
+# =============================================================================
+# RetryPolicy Class
+# =============================================================================
+class RetryPolicy:
+
+    def __init__(self, attempts=3, base_delay=0.5, max_delay=10.0, rng=None):
+        self.attempts   = max(1, int(attempts))
+        self.base_delay = base_delay
+        self.max_delay  = max_delay
+        self._rng       = rng or random.Random()
+
+    def delay(self, attempt):
+        """
+        "Full jitter" backoff: a random delay between 0 and base_delay * 2**attempt (capped),
+        so agents that lost the server at the same moment do not retry in lockstep.
+        """
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+# =============================================================================
+# CircuitBreaker Class
+# =============================================================================
+class CircuitBreaker:
+    CLOSED      = "closed"
+    OPEN        = "open"
+    HALF_OPEN   = "half_open"
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0, name="database", clock=time.monotonic):
+        self.failure_threshold  = max(1, int(failure_threshold))
+        self.reset_timeout      = reset_timeout
+        self.name               = name
+        self.state              = self.CLOSED
+        self.failures           = 0
+        self.opened_at          = None
+        self.stats              = {"opened": 0, "rejected": 0}
+        self._clock             = clock
+        self._trial_running     = False
+        self._lock              = threading.Lock()
+
+    # -------------------------------------------------------------------------
+    # allow
+    # -------------------------------------------------------------------------
+    def allow(self):
+        """
+        Returns True if a write may be attempted now. While open, only one trial
+        write is let through once `reset_timeout` has passed.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self._clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    # -------------------------------------------------------------------------
+    # record_success / record_failure
+    # -------------------------------------------------------------------------
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logging.info(f"{self.name} reachable again; circuit closed.")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                if self.state == self.CLOSED:
+                    self.stats["opened"] += 1
+                    logging.warning(
+                        f"{self.name} failed {self.failures} times in a row; circuit open, "
+                        f"writes go to the fallback for the next {self.reset_timeout:.0f}s."
+                    )
+                self.state = self.OPEN
+                self.opened_at = self._clock()
+                self._trial_running = False
+
+    @property
+    def is_open(self):
+        return self.state != self.CLOSED
+
+
+def retry_call(func, *args, policy=None, breaker=None, sleep=time.sleep, **kwargs):
+    """
+    Calls `func(*args, **kwargs)` under the circuit breaker, retrying transient
+    errors up to `policy.attempts` times with jittered exponential backoff.
+    Errors that prove the server answered (duplicate keys, validation, ...) count
+    as a success for the breaker and are raised at once.
+    Raises:
+        CircuitOpenError: The breaker is open; nothing was attempted.
+    """
+    attempts = policy.attempts if policy else 1
+    for attempt in range(attempts):
+        if breaker and not breaker.allow():
+            raise CircuitOpenError(f"{breaker.name} circuit is open")
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if not is_transient(e):
+                if breaker:
+                    breaker.record_success()
+                raise
+            if breaker:
+                breaker.record_failure()
+            if attempt + 1 >= attempts or (breaker and breaker.is_open):
+                raise
+            delay = policy.delay(attempt)
+            logging.warning(f"Transient database error, retry {attempt + 1}/{attempts - 1} in {delay:.2f}s: {e}")
+            sleep(delay)
+            continue
+
+        if breaker:
+            breaker.record_success()
+        return result
+
+
+async def retry_call_async(func, *args, policy=None, breaker=None, sleep=asyncio.sleep, **kwargs):
+    """Coroutine counterpart of `retry_call` for the asyncio data-access layer; `func` is awaited."""
+    attempts = policy.attempts if policy else 1
+    for attempt in range(attempts):
+        if breaker and not breaker.allow():
+            raise CircuitOpenError(f"{breaker.name} circuit is open")
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            if not is_transient(e):
+                if breaker:
+                    breaker.record_success()
+                raise
+            if breaker:
+                breaker.record_failure()
+            if attempt + 1 >= attempts or (breaker and breaker.is_open):
+                raise
+            delay = policy.delay(attempt)
+            logging.warning(f"Transient database error, retry {attempt + 1}/{attempts - 1} in {delay:.2f}s: {e}")
+            await sleep(delay)
+            continue
+
+        if breaker:
+            breaker.record_success()
+        return result
@@ -0,0 +1,530 @@
+# -*- coding: utf-8 -*-
+# sqlite_backend.py - Embedded SQLite storage backend
+# Author: Sanja
+
+# Heart Beat Application - SQLite Backend
+# Same interface as MongoDatabase on top of a single SQLite file, for small
+# sites, offline laptops and benchmarks without a MongoDB server.
+#   - WAL journal, so GUI reads never block the agents' writes
+#   - pulses are written in batched transactions; the daily rollups are folded
+#     in the same transaction, so they can never drift from the raw pulses
+#   - (username, timestamp) and (timestamp) indexes serve the range queries
+# Timestamps are stored as ISO-8601 text, which sorts chronologically.
+# =============================================================================
+# Imports
+# =============================================================================
+import os
+import sys
+import time
+import sqlite3
+import logging
+import itertools
+import threading
+from datetime import datetime, timedelta
+from bson import ObjectId, json_util
+
+script_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, script_path)
+
+from storage import StorageBackend
+from config_service import get_config
+from connect_to_db import MongoDatabase
+from pulse_archive import matches, project
+
+DEFAULT_PATH        = os.path.join(os.environ.get("USERPROFILE", os.path.expanduser("~")), "InactivityDetector", "heartbeat.db")
+SQLITE_DEFAULTS     = {"path": "", "batch_size": 200, "flush_interval": 5.0}
+PULSE_COLUMNS       = ("username", "hostname", "timestamp", "status", "active_time", "inactive_time")
+ROLLUP_PREFIXES     = {"day": 10, "month": 7, "total": None}    # length of the ISO timestamp prefix
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pulses (
+    id              TEXT PRIMARY KEY,
+    username        TEXT,
+    hostname        TEXT,
+    timestamp       TEXT,
+    status          TEXT,
+    active_time     REAL DEFAULT 0,
+    inactive_time   REAL DEFAULT 0,
+    extra           TEXT
+);
+CREATE INDEX IF NOT EXISTS pulses_username_timestamp ON pulses (username, timestamp);
+CREATE INDEX IF NOT EXISTS pulses_timestamp ON pulses (timestamp);
+CREATE INDEX IF NOT EXISTS pulses_day_summary ON pulses (username, hostname, timestamp, active_time, inactive_time);
+
+CREATE TABLE IF NOT EXISTS daily_user_stats (
+    username                TEXT,
+    hostname                TEXT,
+    date                    TEXT,
+    active_seconds          REAL DEFAULT 0,
+    inactive_seconds        REAL DEFAULT 0,
+    active_transitions      INTEGER DEFAULT 0,
+    inactive_transitions    INTEGER DEFAULT 0,
+    first_seen              TEXT,
+    last_seen               TEXT,
+    PRIMARY KEY (username, date, hostname)
+);
+
+CREATE TABLE IF NOT EXISTS session_summaries (
+    id          TEXT PRIMARY KEY,
+    username    TEXT,
+    hostname    TEXT,
+    start_time  TEXT,
+    doc         TEXT
+);
+CREATE INDEX IF NOT EXISTS session_summaries_username_start ON session_summaries (username, start_time);
+
+CREATE TABLE IF NOT EXISTS activity_bitmaps (
+    username        TEXT,
+    date            TEXT,
+    bits            BLOB,
+    active_minutes  INTEGER DEFAULT 0,
+    PRIMARY KEY (username, date)
+);
+"""
+
+DAILY_STATS_UPSERT = """
+INSERT INTO daily_user_stats (
+    username, hostname, date, active_seconds, inactive_seconds,
+    active_transitions, inactive_transitions, first_seen, last_seen
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (username, date, hostname) DO UPDATE SET
+    active_seconds          = active_seconds + excluded.active_seconds,
+    inactive_seconds        = inactive_seconds + excluded.inactive_seconds,
+    active_transitions      = active_transitions + excluded.active_transitions,
+    inactive_transitions    = inactive_transitions + excluded.inactive_transitions,
+    first_seen              = min(first_seen, excluded.first_seen),
+    last_seen               = max(last_seen, excluded.last_seen)
+"""
+
+DAY_SUMMARY_SQL = """
+SELECT SUM(active_time), SUM(inactive_time), COUNT(*), MIN(timestamp), MAX(timestamp)
+FROM pulses INDEXED BY pulses_day_summary
+WHERE username = ? AND hostname = ? AND timestamp >= ? AND timestamp < ?
+"""
+
+
+def _to_text(value):
+    return value.isoformat(sep=" ", timespec="microseconds") if isinstance(value, datetime) else value
+
+
+def _to_datetime(value):
+    return datetime.fromisoformat(value) if value else value
+
+
+# =============================================================================
+# SQLiteDatabase Class
+# =============================================================================
+class SQLiteDatabase(StorageBackend):
+
+    # -------------------------------------------------------------------------
+    # _init_
+    # -------------------------------------------------------------------------
+    def __init__(self, path=None, buffered=None, lazy=None, batch_size=None, flush_interval=None):
+        """
+        Opens (or creates) the database file.
+        Args:
+            path (str, optional): Database file. Defaults to `storage.sqlite.path`,
+                or heartbeat.db in the user's InactivityDetector folder.
+            buffered (bool, optional): Queue single pulses and write them in batches. Defaults to True.
+            lazy (bool, optional): Accepted for interface compatibility; opening a file never blocks.
+            batch_size (int, optional): Pulses per buffered transaction.
+            flush_interval (float, optional): Seconds after which a partial batch is written.
+        """
+        settings = {**SQLITE_DEFAULTS, **(get_config().section("storage").get("sqlite") or {})}
+
+        self.path           = path or settings["path"] or DEFAULT_PATH
+        self.buffered       = True if buffered is None else buffered
+        self.batch_size     = int(batch_size or settings["batch_size"])
+        self.flush_interval = float(flush_interval or settings["flush_interval"])
+        self._buffer        = []
+        self._last_flush    = time.monotonic()
+        self._lock          = threading.RLock()
+        self._flush_wakeup  = threading.Event()
+        self._flush_thread  = None
+        self._closing       = False
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Other processes (log imports, a second agent) may hold the write lock for a moment
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.ensure_indexes()
+        logging.info(f"Opened SQLite storage at {self.path}")
+
+        if self.buffered:
+            self._start_flush_thread()
+
+    # ------------------------------------------------------------------------
+    # ensure_indexes
+    # ------------------------------------------------------------------------
+    def ensure_indexes(self):
+        """Creates the tables and indexes if they do not exist yet."""
+        with self._lock:
+            self.conn.executescript(SCHEMA)
+
+    # -------------------------------------------------------------------------
+    # insert_pulse
+    # -------------------------------------------------------------------------
+    def insert_pulse(self, data):
+        """Stores one pulse; in buffered mode it is written with the next batch."""
+        if not self.buffered:
+            self.insert_pulses([data])
+            return
+
+        with self._lock:
+            data.setdefault("_id", ObjectId())
+            self._buffer.append(data)
+            due = len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    # -------------------------------------------------------------------------
+    # insert_pulses
+    # -------------------------------------------------------------------------
+    def insert_pulses(self, docs):
+        """
+        Writes pulses and their rollups in one transaction. Pulses whose `_id` is
+        already stored are skipped, so a spool replay is harmless.
+        Returns:
+            int: Number of pulses actually inserted.
+        """
+        if not docs:
+            return 0
+
+        inserted = []
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                for doc in docs:
+                    doc.setdefault("_id", ObjectId())
+                    cursor = self.conn.execute(
+                        "INSERT OR IGNORE INTO pulses VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._pulse_values(doc)
+                    )
+                    if cursor.rowcount:
+                        inserted.append(doc)
+
+                self.conn.executemany(DAILY_STATS_UPSERT, [
+                    (
+                        username, hostname, day, totals["active_seconds"], totals["inactive_seconds"],
+                        totals["transitions"].get("Active", 0), totals["transitions"].get("Inactive", 0),
+                        _to_text(totals["first_seen"]), _to_text(totals["last_seen"]),
+                    )
+                    for (username, hostname, day), totals in MongoDatabase.daily_stats_totals(inserted).items()
+                ])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        return len(inserted)
+
+    @staticmethod
+    def _pulse_values(doc):
+        extra = {key: value for key, value in doc.items() if key != "_id" and key not in PULSE_COLUMNS}
+        return (
+            str(doc["_id"]),
+            doc.get("username"),
+            doc.get("hostname"),
+            _to_text(doc.get("timestamp")),
+            doc.get("status"),
+            doc.get("active_time") or 0,
+            doc.get("inactive_time") or 0,
+            json_util.dumps(extra) if extra else None,
+        )
+
+    # -------------------------------------------------------------------------
+    # flush
+    # -------------------------------------------------------------------------
+    def flush(self):
+        """
+        Writes all buffered pulses in one transaction. On failure they stay queued.
+        Returns:
+            int: Number of pulses inserted.
+        """
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+            if not batch:
+                return 0
+            try:
+                return self.insert_pulses(batch)
+            except Exception as e:
+                self._buffer[:0] = batch
+                logging.error(f"Database Error (flush): {e}")
+                return 0
+
+    # -------------------------------------------------------------------------
+    # _start_flush_thread
+    # -------------------------------------------------------------------------
+    def _start_flush_thread(self):
+        """Starts the background thread that writes a partial batch after `flush_interval`."""
+        self._flush_thread = threading.Thread(target=self._flush_loop, name="sqlite-flusher", daemon=True)
+        self._flush_thread.start()
+
+    # -------------------------------------------------------------------------
+    # _flush_loop
+    # -------------------------------------------------------------------------
+    def _flush_loop(self):
+        """Flushes every `flush_interval` seconds, so a quiet agent's last pulses are not held back."""
+        while not self._closing:
+            self._flush_wakeup.wait(self.flush_interval)
+            self._flush_wakeup.clear()
+            if self._closing:
+                break
+            self.flush()
+
+    # -------------------------------------------------------------------------
+    # insert_summary
+    # -------------------------------------------------------------------------
+    def insert_summary(self, data):
+        """Stores a session summary."""
+        try:
+            data.setdefault("_id", ObjectId())
+            with self._lock:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO session_summaries VALUES (?, ?, ?, ?, ?)",
+                    (str(data["_id"]), data.get("username"), data.get("hostname"),
+                     _to_text(data.get("start_time")), json_util.dumps(data)),
+                )
+            logging.info("Summary inserted successfully.")
+        except Exception as e:
+            logging.error(f"Database Error (summary_collections): {e}")
+
+    # ------------------------------------------------------------------------
+    # iter_logs
+    # ------------------------------------------------------------------------
+    def iter_logs(self, username=None, hostname=None, start=None, end=None, query=None,
+                  projection=None, sort=None, limit=0, batch_size=None, no_cursor_timeout=False):
+        """
+        Streams pulses in the inclusive [start, end] range, `batch_size` rows per fetch.
+        User, host and range filters run in SQL on the indexes; any extra `query`
+        conditions are evaluated on the decoded pulses.
+        Args:
+            See `MongoDatabase.iter_logs`. Sorting is limited to the pulse columns.
+        """
+        self.flush()
+
+        where, params = self._where(username, hostname, start, end)
+        order = []
+        for field, direction in sort or []:
+            column = "id" if field == "_id" else field
+            if column != "id" and column not in PULSE_COLUMNS:
+                raise ValueError(f"Cannot sort SQLite pulses by '{field}'.")
+            order.append(f"{column} {'DESC' if direction < 0 else 'ASC'}")
+
+        sql = "SELECT * FROM pulses" + where
+        if order:
+            sql += " ORDER BY " + ", ".join(order)
+        if limit and not query:
+            sql += f" LIMIT {int(limit)}"
+
+        docs = (
+            project(doc, projection)
+            for doc in self._iter_rows(sql, params, batch_size or 1000)
+            if not query or matches(doc, query)
+        )
+        return itertools.islice(docs, limit) if limit else docs
+
+    def _iter_rows(self, sql, params, batch_size):
+        with self._lock:
+            cursor = self.conn.execute(sql, params)
+        try:
+            while True:
+                with self._lock:
+                    rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._pulse_doc(row)
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _where(username=None, hostname=None, start=None, end=None):
+        clauses, params = [], []
+        for column, value in (("username", username), ("hostname", hostname)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if start:
+            clauses.append("timestamp >= ?")
+            params.append(_to_text(start))
+        if end:
+            clauses.append("timestamp <= ?")
+            params.append(_to_text(end))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    @staticmethod
+    def _pulse_doc(row):
+        pulse_id, username, hostname, timestamp, status, active_time, inactive_time, extra = row
+        doc = {
+            "_id": ObjectId(pulse_id) if ObjectId.is_valid(pulse_id) else pulse_id,
+            "username": username,
+            "hostname": hostname,
+            "timestamp": _to_datetime(timestamp),
+            "status": status,
+            "active_time": active_time,
+            "inactive_time": inactive_time,
+        }
+        if extra:
+            doc.update(json_util.loads(extra))
+        return doc
+
+    # ------------------------------------------------------------------------
+    # latest_pulse_marker
+    # ------------------------------------------------------------------------
+    def latest_pulse_marker(self, username=None, hostname=None):
+        """(timestamp, _id) of the newest pulse, read through the (username, timestamp) index."""
+        self.flush()
+        where, params = self._where(username, hostname)
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT timestamp, id FROM pulses{where} ORDER BY timestamp DESC LIMIT 1", params
+            ).fetchone()
+        if row is None:
+            return None
+        return _to_datetime(row[0]), ObjectId(row[1]) if ObjectId.is_valid(row[1]) else row[1]
+
+    # ------------------------------------------------------------------------
+    # rollup_activity
+    # ------------------------------------------------------------------------
+    def rollup_activity(self, start=None, end=None, username=None, hostname=None, granularity="day"):
+        """Same result shape as `MongoDatabase.rollup_activity`, computed with one GROUP BY."""
+        if granularity not in ROLLUP_PREFIXES:
+            raise ValueError(f"Unknown rollup granularity: {granularity}")
+
+        self.flush()
+        prefix = ROLLUP_PREFIXES[granularity]
+        period = f"substr(timestamp, 1, {prefix})" if prefix else "NULL"
+        where, params = self._where(username, hostname, start, end)
+        sql = (
+            f"SELECT username, {period} AS period, SUM(active_time), SUM(inactive_time)"
+            f" FROM pulses{where} GROUP BY username, period ORDER BY username, period"
+        )
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+
+        return [
+            {"username": user, "period": period, "active_seconds": active, "inactive_seconds": inactive}
+            for user, period, active, inactive in rows
+        ]
+
+    # ------------------------------------------------------------------------
+    # day_summary
+    # ------------------------------------------------------------------------
+    def day_summary(self, username, hostname, day):
+        """Same result as `MongoDatabase.day_summary`, answered from the covering 'pulses_day_summary' index."""
+        self.flush()
+        start = datetime.combine(day, datetime.min.time())
+        with self._lock:
+            active, inactive, pulses, first_seen, last_seen = self.conn.execute(
+                DAY_SUMMARY_SQL, (username, hostname, _to_text(start), _to_text(start + timedelta(days=1)))
+            ).fetchone()
+
+        return MongoDatabase.day_summary_row(username, hostname, day, {
+            "active_seconds": active,
+            "inactive_seconds": inactive,
+            "pulses": pulses,
+            "first_seen": _to_datetime(first_seen),
+            "last_seen": _to_datetime(last_seen),
+        })
+
+    # ------------------------------------------------------------------------
+    # get_daily_stats
+    # ------------------------------------------------------------------------
+    def get_daily_stats(self, username=None, hostname=None, start_date=None, end_date=None):
+        """Per-day rollups shaped like the 'daily_user_stats' documents, sorted by date."""
+        self.flush()
+        clauses, params = [], []
+        for column, value in (("username", username), ("hostname", hostname)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if start_date:
+            clauses.append("date >= ?")
+            params.append(start_date.strftime("%Y-%m-%d"))
+        if end_date:
+            clauses.append("date <= ?")
+            params.append(end_date.strftime("%Y-%m-%d"))
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT username, hostname, date, active_seconds, inactive_seconds, active_transitions,"
+                f" inactive_transitions, first_seen, last_seen FROM daily_user_stats{where}"
+                " ORDER BY date, username, hostname", params
+            ).fetchall()
+
+        return [
+            {
+                "username": user,
+                "hostname": host,
+                "date": day,
+                "active_seconds": active,
+                "inactive_seconds": inactive,
+                "transitions": {"Active": active_count, "Inactive": inactive_count},
+                "first_seen": _to_datetime(first_seen),
+                "last_seen": _to_datetime(last_seen),
+            }
+            for user, host, day, active, inactive, active_count, inactive_count, first_seen, last_seen in rows
+        ]
+
+    # ------------------------------------------------------------------------
+    # save_bitmaps / load_bitmaps
+    # ------------------------------------------------------------------------
+    def save_bitmaps(self, rows):
+        """Stores activity bitmaps as BLOBs, replacing the stored row of the same (username, date)."""
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO activity_bitmaps (username, date, bits, active_minutes) VALUES (?, ?, ?, ?)",
+                    [(row["username"], row["date"], row["bits"], row["active_minutes"]) for row in rows],
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def load_bitmaps(self, usernames=None, start_date=None, end_date=None):
+        """Activity bitmap rows shaped like the 'activity_bitmaps' documents, sorted by date."""
+        clauses, params = [], []
+        if usernames:
+            clauses.append(f"username IN ({', '.join('?' for _ in usernames)})")
+            params.extend(usernames)
+        if start_date:
+            clauses.append("date >= ?")
+            params.append(start_date.strftime("%Y-%m-%d"))
+        if end_date:
+            clauses.append("date <= ?")
+            params.append(end_date.strftime("%Y-%m-%d"))
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT username, date, bits, active_minutes FROM activity_bitmaps{where} ORDER BY date, username",
+                params,
+            ).fetchall()
+        return [
+            {"username": user, "date": day, "bits": bytes(bits), "active_minutes": minutes}
+            for user, day, bits, minutes in rows
+        ]
+
+    # ------------------------------------------------------------------------
+    # close
+    # ------------------------------------------------------------------------
+    def close(self):
+        """Writes buffered pulses and closes the database file."""
+        if self.conn is None:
+            return
+        self._closing = True
+        if self._flush_thread:
+            self._flush_wakeup.set()
+            self._flush_thread.join(timeout=5)
+            self._flush_thread = None
+        self.flush()
+        with self._lock:
+            self.conn.close()
+            self.conn = None
+        logging.info("SQLite storage closed.")
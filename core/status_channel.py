@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# status_channel.py - Local status events from IdleReporter to InactivityMonitor
+# Author: Sanja
+
+# Heart Beat Application - Status Channel
+# The reporter pushes every status change as a small UDP datagram to 127.0.0.1;
+# the monitor blocks on receive, so a transition reaches it within milliseconds
+# and an idle agent does not wake up at all. UDP on loopback works the same on
+# Windows and elsewhere and needs no connection handling: a reporter that sends
+# while no monitor runs simply loses nothing that status.txt does not still hold.
+#
+# The monitor binds an ephemeral port and publishes it, with a random token,
+# in <InactivityDetector>/status.port. Datagrams without that token are ignored.
+# status.txt stays as a snapshot for older monitors and for resyncs; when the
+# channel cannot be opened the monitor falls back to polling the file.
+# =============================================================================
+# Imports
+# =============================================================================
+import os
+import json
+import time
+import socket
+import secrets
+import logging
+
+PORT_FILE_NAME          = "status.port"
+CHANNEL_DEFAULTS        = {"enabled": True, "resync_interval": 300}
+MAX_DATAGRAM            = 1024
+
+
+def read_port_file(path):
+    """Returns (port, token) from a port file, or None if there is no usable one."""
+    try:
+        with open(path, "r") as file:
+            port, token = file.read().split()
+        return int(port), token
+    except (OSError, ValueError):
+        return None
+
+
+# =============================================================================
+# StatusListener Class
+# =============================================================================
+class StatusListener:
+    """Monitor side: receives status events pushed by the reporter."""
+
+    # -------------------------------------------------------------------------
+    # _init_
+    # -------------------------------------------------------------------------
+    def __init__(self, base_dir):
+        self.port_file  = os.path.join(base_dir, PORT_FILE_NAME)
+        self.token      = secrets.token_hex(16)
+        self.last_seq   = None
+        self.sock       = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.sock.bind(("127.0.0.1", 0))
+            self.port = self.sock.getsockname()[1]
+
+            temp_path = self.port_file + ".tmp"
+            with open(temp_path, "w") as file:
+                file.write(f"{self.port} {self.token}")
+            os.replace(temp_path, self.port_file)
+        except Exception:
+            self.sock.close()
+            raise
+
+    # -------------------------------------------------------------------------
+    # receive
+    # -------------------------------------------------------------------------
+    def receive(self, timeout=None):
+        """
+        Blocks until a status event arrives or `timeout` seconds pass.
+        Returns:
+            tuple | None: (status, unix timestamp of the change), or None on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            self.sock.settimeout(remaining)
+            try:
+                payload, _ = self.sock.recvfrom(MAX_DATAGRAM)
+            except socket.timeout:
+                return None
+            except ConnectionResetError:
+                # Windows reports an earlier ICMP "port unreachable" here; harmless
+                continue
+
+            event = self._parse(payload)
+            if event:
+                return event
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+    def _parse(self, payload):
+        try:
+            message = json.loads(payload.decode("utf-8"))
+            if message.get("token") != self.token:
+                return None
+            seq = (message.get("sender"), int(message.get("seq", 0)))
+            if self.last_seq and seq[0] == self.last_seq[0] and seq[1] <= self.last_seq[1]:
+                return None     # duplicate or reordered datagram
+            self.last_seq = seq
+            return str(message["status"]), float(message["timestamp"])
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logging.warning(f"Ignoring malformed status event: {e}")
+            return None
+
+    # -------------------------------------------------------------------------
+    # close
+    # -------------------------------------------------------------------------
+    def close(self):
+        """Closes the socket and removes the port file if it still points at this listener."""
+        self.sock.close()
+        if read_port_file(self.port_file) == (self.port, self.token):
+            try:
+                os.remove(self.port_file)
+            except OSError:
+                pass
+
+
+def open_listener(base_dir):
+    """Opens a StatusListener, or returns None (and logs why) so the caller can poll status.txt."""
+    try:
+        listener = StatusListener(base_dir)
+        logging.info(f"Receiving status events on 127.0.0.1:{listener.port}.")
+        return listener
+    except Exception as e:
+        logging.warning(f"Status channel unavailable, polling status.txt instead: {e}")
+        return None
+
+
+# =============================================================================
+# StatusPublisher Class
+# =============================================================================
+class StatusPublisher:
+    """Reporter side: pushes status changes to whichever monitor currently listens."""
+
+    def __init__(self, base_dir):
+        self.port_file  = os.path.join(base_dir, PORT_FILE_NAME)
+        self.sender     = secrets.token_hex(4)
+        self.seq        = 0
+        self.sock       = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def publish(self, status, timestamp=None):
+        """
+        Sends one status event. The port file is read on every call (changes are rare),
+        so a restarted monitor is picked up at once.
+        Returns:
+            bool: True if a listener was found and the datagram was sent.
+        """
+        target = read_port_file(self.port_file)
+        if target is None:
+            return False
+
+        port, token = target
+        self.seq += 1
+        payload = json.dumps({
+            "token": token,
+            "sender": self.sender,
+            "seq": self.seq,
+            "status": status,
+            "timestamp": time.time() if timestamp is None else timestamp,
+        }).encode("utf-8")
+        try:
+            self.sock.sendto(payload, ("127.0.0.1", port))
+            return True
+        except OSError as e:
+            logging.warning(f"Failed to send status event: {e}")
+            return False
+
+    def close(self):
+        self.sock.close()
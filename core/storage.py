@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# storage.py - Storage backend interface and factory
+# Author: Sanja
+
+# Heart Beat Application - Storage Backends
+# Agents, the service and the GUI talk to storage through this interface only.
+# `open_database()` picks the implementation from `storage.backend` in config.yml:
+#   - "mongodb": connect_to_db.MongoDatabase (default)
+#   - "sqlite":  sqlite_backend.SQLiteDatabase, an embedded file for small sites,
+#                offline laptops and benchmarks without a MongoDB server
+# =============================================================================
+# Imports
+# =============================================================================
+import os
+import sys
+from abc import ABC, abstractmethod
+
+script_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, script_path)
+
+from config_service import get_config
+
+BACKENDS            = ("mongodb", "sqlite")
+STORAGE_DEFAULTS    = {"backend": "mongodb"}
+
+
+def open_database(backend=None, **options):
+    """
+    Opens the configured storage backend.
+    Args:
+        backend (str, optional): Overrides `storage.backend` from config.yml.
+        **options: Passed to the backend, e.g. `buffered=False, lazy=True`.
+    Returns:
+        StorageBackend: A connected backend.
+    """
+    backend = backend or get_config().section("storage", STORAGE_DEFAULTS)["backend"]
+    if backend == "mongodb":
+        from connect_to_db import MongoDatabase
+        return MongoDatabase(**options)
+    if backend == "sqlite":
+        from sqlite_backend import SQLiteDatabase
+        return SQLiteDatabase(**options)
+    raise RuntimeError(f"Unknown storage backend '{backend}'. Expected one of: {', '.join(BACKENDS)}")
+
+
+# =============================================================================
+# StorageBackend Class
+# =============================================================================
+class StorageBackend(ABC):
+    """
+    Pulses are plain dicts with username, hostname, timestamp (datetime), status,
+    active_time and inactive_time; extra keys are stored as they are. Daily
+    rollups ('daily_user_stats') are kept in step with every inserted pulse.
+    """
+    fallback = None     # sink with append(doc) for pulses a remote backend cannot take right now
+
+    # -------------------------------------------------------------------------
+    # writes
+    # -------------------------------------------------------------------------
+    @abstractmethod
+    def insert_pulse(self, data):
+        """Stores one pulse and folds it into the daily rollups."""
+
+    @abstractmethod
+    def insert_pulses(self, docs):
+        """
+        Stores several pulses in one batch. Pulses whose `_id` is already stored are skipped.
+        Returns:
+            int: Number of pulses actually inserted.
+        """
+
+    @abstractmethod
+    def insert_summary(self, data):
+        """Stores a session summary."""
+
+    @abstractmethod
+    def save_bitmaps(self, rows):
+        """
+        Stores per-minute activity bitmaps (see activity_bitmap.py), replacing the
+        stored bitmap of the same username and date.
+        Args:
+            rows (list): Dicts with username, date ('YYYY-MM-DD'), bits (180 bytes), active_minutes.
+        """
+
+    def flush(self):
+        """Writes out any buffered pulses. Backends without a buffer have nothing to do."""
+        return 0
+
+    def set_fallback(self, sink):
+        """
+        Registers where pulses go while the backend is unreachable, usually a PulseSpool
+        whose drainer replays them later. Embedded backends never hand pulses off.
+        """
+        self.fallback = sink
+
+    # -------------------------------------------------------------------------
+    # reads
+    # -------------------------------------------------------------------------
+    @abstractmethod
+    def iter_logs(self, username=None, hostname=None, start=None, end=None, query=None,
+                  projection=None, sort=None, limit=0, batch_size=None, no_cursor_timeout=False):
+        """Streams pulses in the inclusive [start, end] range."""
+
+    def find_logs(self, username=None, hostname=None, start=None, end=None,
+                  projection=None, sort=None, limit=0):
+        """Pulses in the range as a list, oldest first unless `sort` says otherwise."""
+        return list(self.iter_logs(
+            username, hostname, start, end,
+            projection=projection, sort=sort or [("timestamp", 1)], limit=limit,
+        ))
+
+    @abstractmethod
+    def rollup_activity(self, start=None, end=None, username=None, hostname=None, granularity="day"):
+        """Active/inactive seconds per user and "day", "month" or "total" period."""
+
+    @abstractmethod
+    def day_summary(self, username, hostname, day):
+        """One user's totals from one host on one day, read from an index covering the range."""
+
+    @abstractmethod
+    def get_daily_stats(self, username=None, hostname=None, start_date=None, end_date=None):
+        """Per-day rollup documents sorted by date."""
+
+    @abstractmethod
+    def latest_pulse_marker(self, username=None, hostname=None):
+        """(timestamp, _id) of the newest pulse, or None."""
+
+    @abstractmethod
+    def load_bitmaps(self, usernames=None, start_date=None, end_date=None):
+        """Activity bitmap rows of the given users (all if None) in the inclusive date range."""
+
+    # -------------------------------------------------------------------------
+    # lifecycle
+    # -------------------------------------------------------------------------
+    def ensure_indexes(self):
+        """Creates whatever indexes the backend needs."""
+
+    def wait_until_ready(self, timeout=None):
+        """Blocks until the backend can serve requests. Embedded backends are ready at once."""
+        return True
+
+    @abstractmethod
+    def close(self):
+        """Flushes buffered writes and releases the connection."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,6 +1,8 @@
 # db_handler.py
 
+import csv
 import yaml
+import bisect
 from pymongo import MongoClient
 from datetime import datetime
 import os
@@ -17,14 +19,64 @@ script_path = os.path.abspath(__file__)
 _root       = os.path.abspath(os.path.join(script_path, "..", "..", "..")) # Adjusted to point to the root of the project
 sys.path.append(_root)
 
-from core import connect_to_db
+from core.storage import open_database
+from core.config_service import get_config
+from query_cache import QueryCache, DEFAULT_MAX_ENTRIES, DEFAULT_MAX_BYTES
+
+
+PULSE_FIELDS    = ["username", "hostname", "timestamp", "status", "active_time", "inactive_time"]
+CACHE_DEFAULTS  = {"max_entries": DEFAULT_MAX_ENTRIES, "max_bytes": DEFAULT_MAX_BYTES}
+
+
+class PulseHistory:
+    """
+    One user's pulses loaded so far, sorted by timestamp.
+    `loaded_from` is the earliest moment covered (None = from the beginning) and
+    everything after it up to the high-watermark (the newest pulse) is in memory.
+    """
+
+    def __init__(self):
+        self.docs           = []
+        self.timestamps     = []
+        self.loaded         = False
+        self.loaded_from    = None
+
+    @property
+    def watermark(self):
+        """Timestamp of the newest loaded pulse."""
+        return self.timestamps[-1] if self.timestamps else None
+
+    def covers(self, start_date):
+        return self.loaded and (self.loaded_from is None or (start_date is not None and start_date >= self.loaded_from))
+
+    def open_day(self):
+        """Start of the newest loaded day. Earlier days are closed and never change."""
+        moment = self.watermark or self.loaded_from
+        return datetime.combine(moment.date(), datetime.min.time()) if moment else None
+
+    def prepend(self, docs):
+        self.docs[:0] = docs
+        self.timestamps[:0] = [doc["timestamp"] for doc in docs]
+
+    def replace_from(self, moment, docs):
+        """Swaps everything at or after `moment` for `docs` (which are sorted)."""
+        cut = bisect.bisect_left(self.timestamps, moment) if moment else 0
+        del self.docs[cut:], self.timestamps[cut:]
+        self.docs.extend(docs)
+        self.timestamps.extend(doc["timestamp"] for doc in docs)
+
+    def between(self, start_date=None, end_date=None):
+        first = bisect.bisect_left(self.timestamps, start_date) if start_date else 0
+        last = bisect.bisect_right(self.timestamps, end_date) if end_date else len(self.docs)
+        return self.docs[first:last]
 
 
 class GetPulseData:
     def __init__(self):
-        self.client             = connect_to_db.MongoDatabase()
-        self.pulse_logs_data    = self.client.get_logs()
-        self.pulse_summary_data = self.client.get_summaries()
+        self.client             = open_database(buffered=False, lazy=True)
+        cache_settings          = get_config().section("query_cache", CACHE_DEFAULTS)
+        self.cache              = QueryCache(cache_settings["max_entries"], cache_settings["max_bytes"])
+        self.histories          = {}
 
     @staticmethod
     def parse_time_to_seconds(value):
@@ -38,9 +90,9 @@ class GetPulseData:
                 return 0
         return 0
 
-    def get_pulse_data(self, start_date: datetime = None, end_date: datetime = None):
+    def iter_pulse_data(self, start_date: datetime = None, end_date: datetime = None, no_cursor_timeout=False):
+        """Streams the current user's pulses as display rows, one cursor batch at a time."""
         current_user = getpass.getuser()
-        filtered_logs = []
 
         # Normalize dates to cover full days
         if start_date:
@@ -48,74 +100,128 @@ class GetPulseData:
         if end_date:
             end_date = datetime.combine(end_date.date(), datetime.max.time())
 
-        for log in self.pulse_logs_data:
-            if log.get("username") != current_user:
-                continue
+        # User and date filtering happen in the database
+        logs = self.client.iter_logs(
+            username=current_user, start=start_date, end=end_date, projection=PULSE_FIELDS,
+            sort=[("timestamp", 1)], no_cursor_timeout=no_cursor_timeout
+        )
+
+        for log in logs:
+            if log.get("timestamp"):
+                yield self.pulse_row(log)
+
+    def pulse_row(self, log):
+        """Converts one pulse document into a display row."""
+        active_seconds      = self.parse_time_to_seconds(log.get('active_time', 0))
+        inactive_seconds    = self.parse_time_to_seconds(log.get('inactive_time', 0))
+
+        return {
+            "username": log.get("username"),
+            "hostname": log.get("hostname"),
+            "timestamp": log["timestamp"].strftime("%Y-%m-%d %H:%M:%S"),
+            "status": log.get("status", ""),
+            "active_time": str(timedelta(seconds=active_seconds)),
+            "active_seconds": active_seconds,
+            "inactive_time": str(timedelta(seconds=inactive_seconds)),
+            "inactive_seconds": inactive_seconds
+        }
+
+    def _fetch_pulses(self, username, start_date=None, end_date=None):
+        return [
+            log for log in self.client.iter_logs(
+                username=username, start=start_date, end=end_date,
+                projection=PULSE_FIELDS, sort=[("timestamp", 1)],
+            )
+            if log.get("timestamp")
+        ]
+
+    def refresh_history(self, username, start_date: datetime = None):
+        """
+        Brings the user's in-memory history up to date and makes sure it reaches back to `start_date`.
+        The first call loads everything from `start_date` on. Later calls only fetch
+        what is missing: days older than anything loaded so far, and the still-open
+        newest day, which is re-read whole because spooled pulses can arrive late.
+        Closed days are immutable once their day-end summary is written, so a refresh
+        is one small indexed query.
+        Returns:
+            PulseHistory: The user's history.
+        """
+        history = self.histories.setdefault(username, PulseHistory())
+
+        if not history.loaded:
+            history.replace_from(None, self._fetch_pulses(username, start_date))
+            history.loaded, history.loaded_from = True, start_date
+            return history
+
+        if not history.covers(start_date):
+            older_end = history.loaded_from - timedelta(microseconds=1)
+            history.prepend(self._fetch_pulses(username, start_date, older_end))
+            history.loaded_from = start_date
+
+        open_day = history.open_day()
+        history.replace_from(open_day, self._fetch_pulses(username, open_day))
+        return history
 
-            timestamp = log.get("timestamp")
-            if not timestamp:
-                continue
+    def get_pulse_data(self, start_date: datetime = None, end_date: datetime = None):
+        return list(self.iter_pulse_data(start_date, end_date))
 
-            # Filter by date (ignore time)
-            if start_date and timestamp < start_date:
-                continue
-            if end_date and timestamp > end_date:
-                continue
+    def iter_summary_logs(self, start_date: datetime = None, end_date: datetime = None, no_cursor_timeout=False):
+        """Yields one row per day and host from the current user's daily_user_stats rollups."""
+        current_user = getpass.getuser()
 
-            active_seconds      = self.parse_time_to_seconds(log.get('active_time', 0))
-            inactive_seconds    = self.parse_time_to_seconds(log.get('inactive_time', 0))
+        for stats in self.client.get_daily_stats(username=current_user, start_date=start_date, end_date=end_date):
+            active_seconds      = int(stats.get("active_seconds", 0))
+            inactive_seconds    = int(stats.get("inactive_seconds", 0))
 
-            log_data = {
-                "username": log.get("username"),
-                "hostname": log.get("hostname"),
-                "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                "status": log.get("status", ""),
+            yield {
+                "username": stats.get("username"),
+                "hostname": stats.get("hostname"),
+                "timestamp": stats.get("date"),
+                "status": "Summary",
                 "active_time": str(timedelta(seconds=active_seconds)),
                 "active_seconds": active_seconds,
                 "inactive_time": str(timedelta(seconds=inactive_seconds)),
                 "inactive_seconds": inactive_seconds
             }
 
-            filtered_logs.append(log_data)
-
-        return filtered_logs
-
     def get_summary_logs(self, start_date: datetime = None, end_date: datetime = None):
+        return list(self.iter_summary_logs(start_date, end_date))
+
+    def get_rows(self, start_date: datetime = None, end_date: datetime = None, summaries=False):
+        """
+        Returns the display rows for a search. Pulses come from the incrementally
+        refreshed history; summaries from the LRU cache while the user's newest
+        pulse is unchanged (the rollups are updated with every pulse insert).
+        """
         current_user = getpass.getuser()
-        filtered_summaries = []
-
-        # Normalize dates
-        if start_date:
-            start_date = datetime.combine(start_date.date(), datetime.min.time())
-        if end_date:
-            end_date = datetime.combine(end_date.date(), datetime.max.time())
-
-        for summary in self.pulse_summary_data:
-            if summary.get("username") != current_user:
-                continue
-
-            timestamp = summary.get("timestamp")
-            if not timestamp:
-                continue
-
-            if start_date and timestamp < start_date:
-                continue
-            if end_date and timestamp > end_date:
-                continue
-
-            log_data = {
-                "username": summary.get("username"),
-                "hostname": summary.get("hostname"),
-                "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                "status": "Summary",
-                "active_time": summary.get("active_time", "00:00:00"),
-                "inactive_time": summary.get("inactive_time", "00:00:00")
-            }
-
-            filtered_summaries.append(log_data)
-
-        print(f"Filtered summaries: {filtered_summaries}")  # Debugging line
-        # Sort summaries by timestamp
-        return filtered_summaries
-
-
+        if not summaries:
+            history = self.refresh_history(current_user, start_date)
+            return [self.pulse_row(log) for log in history.between(start_date, end_date)]
+
+        key = (current_user, "summary", start_date, end_date)
+        marker = self.client.latest_pulse_marker(username=current_user)
+
+        rows = self.cache.get(key, marker)
+        if rows is None:
+            rows = list(self.iter_summary_logs(start_date, end_date))
+            self.cache.put(key, marker, rows)
+        return rows
+
+    def export_csv(self, path, start_date: datetime = None, end_date: datetime = None, summaries=False):
+        """
+        Streams the selected rows straight from the cursor into a CSV file,
+        so memory use stays flat for month or year ranges.
+        Returns:
+            int: Number of rows written.
+        """
+        rows = (self.iter_summary_logs if summaries else self.iter_pulse_data)(
+            start_date, end_date, no_cursor_timeout=True
+        )
+        count = 0
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(["TimeStamp", "ActiveTime", "InactiveTime", "Status"])
+            for row in rows:
+                writer.writerow([row["timestamp"], row.get("active_time", ""), row.get("inactive_time", ""), row.get("status", "")])
+                count += 1
+        return count
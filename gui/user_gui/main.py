@@ -11,17 +11,18 @@
 # ========================================================================================================
 import os
 import sys
-import csv
 import logging
 from datetime import datetime
 import socket
+import threading
+import time
 
 from PySide2.QtWidgets import (
     QApplication, QMainWindow, QLabel, QVBoxLayout, QSizePolicy,
     QWidget, QDateEdit, QPushButton, QHeaderView, QTableWidget, QTableWidgetItem,
     QComboBox, QMessageBox, QLineEdit, QRadioButton, QFileDialog
 )
-from PySide2.QtCore import Qt, QFile, QIODevice, QDate, QSize
+from PySide2.QtCore import Qt, QFile, QIODevice, QDate, QSize, QObject, Signal
 from PySide2.QtGui import QIcon, QPixmap, QFont, QPalette, QColor
 from PySide2.QtUiTools import QUiLoader
 
@@ -59,6 +60,64 @@ default_stylesheet = """
     QTableWidget::item { padding: 8px; font-weight: 500; }
 """
 
+# === Summary panel fields ===
+SUMMARY_FIELDS = [
+    "day_month_LD", "holidays_month_LD", "total_work_days_LD",
+    "active_hours_LD", "inactive_days_LD", "Active_LD", "Inactive_LD"
+]
+SUMMARY_RETRY_DELAYS = (2, 5, 15, 30, 60, 120)   # seconds; backoff while the database is unreachable
+
+# ========================================================================================================
+# Background loader for the summary panel
+# ========================================================================================================
+class SummaryLoader(QObject):
+    """
+    Computes the summary panel values on a worker thread. The signals are
+    delivered on the GUI thread, so the window never blocks on MongoDB.
+    The database is connected lazily, so the loader waits for it and retries
+    with backoff (SUMMARY_RETRY_DELAYS); `failed` is only emitted when every
+    attempt failed.
+    """
+    loaded = Signal(dict)
+    failed = Signal(str)
+
+    def start(self, summary_info):
+        threading.Thread(target=self.run, args=(summary_info,), daemon=True).start()
+
+    def run(self, summary_info):
+        error = "database not reachable"
+        for delay in SUMMARY_RETRY_DELAYS:
+            # Returns as soon as the server answers, so a quick connect fills the panel at once
+            if not summary_info.wait_until_ready(delay):
+                continue
+            try:
+                values = self.compute(summary_info)
+            except Exception as e:
+                error = str(e)
+                logging.warning("Summary panel load failed, retrying in %ss: %s", delay, e)
+                time.sleep(delay)
+                continue
+            self.loaded.emit(values)
+            return
+        self.failed.emit(error)
+
+    @staticmethod
+    def compute(summary_info):
+        summary_info.load()
+
+        month_work_days     = "22"
+        holidays_in_month   = summary_info.get_number_of_holidays()
+
+        return {
+            "day_month_LD"          : str(month_work_days),
+            "holidays_month_LD"     : str(holidays_in_month),
+            "total_work_days_LD"    : str(int(month_work_days) - int(holidays_in_month)),
+            "active_hours_LD"       : str(summary_info.get_total_active_time()),
+            "inactive_days_LD"      : str(summary_info.get_total_inactive_time()),
+            "Active_LD"             : str(summary_info.get_total_active_time_off_today()),
+            "Inactive_LD"           : str(summary_info.get_total_inactive_time_off_today())
+        }
+
 # ========================================================================================================
 # Main GUI Class
 # ========================================================================================================
@@ -85,6 +144,7 @@ class UserGUI(QMainWindow):
         self.ui = None
         self._summary_panel = {}
         self._summary_month_info = SummaryPanel()
+        self._pulse_data = None
         self.load_ui()
         self.setWindowTitle("Heart Beat")
         self.add_menu_bar()
@@ -202,8 +262,9 @@ class UserGUI(QMainWindow):
         Exports the data from the table widget to a CSV file.
 
         This method checks if the table widget contains data and prompts the user
-        to select a file path to save the CSV file. It writes the table's headers
-        and data rows to the file. If the export is successful, a confirmation
+        to select a file path to save the CSV file. The rows for the selected date
+        range and log type are streamed from the database cursor into the file, so
+        large ranges are written with constant memory. If the export is successful, a confirmation
         message is displayed. If an error occurs during the export process, an
         error message is shown.
 
@@ -227,17 +288,12 @@ class UserGUI(QMainWindow):
             return
         path, _ = QFileDialog.getSaveFileName(self, "Save File", "", "CSV Files (*.csv)")
         if path:
+            start = datetime.combine(self.start_date_edit.date().toPython(), datetime.min.time())
+            end = datetime.combine(self.end_date_edit.date().toPython(), datetime.max.time())
             try:
-                with open(path, 'w', newline='', encoding='utf-8') as file:
-                    writer = csv.writer(file)
-                    headers = [self.tableWidget.horizontalHeaderItem(col).text() for col in range(self.tableWidget.columnCount())]
-                    writer.writerow(headers)
-                    for row in range(self.tableWidget.rowCount()):
-                        writer.writerow([
-                            self.tableWidget.item(row, col).text()
-                            for col in range(self.tableWidget.columnCount())
-                        ])
-                QMessageBox.information(self, "Export Successful", f"Logs exported to:\n{path}")
+                # Rows are streamed from the database cursor straight into the file
+                count = self.get_pulse_data_source().export_csv(path, start, end, summaries=self.radio_log_summary.isChecked())
+                QMessageBox.information(self, "Export Successful", f"{count} logs exported to:\n{path}")
             except Exception as e:
                 QMessageBox.critical(self, "Export Error", f"Failed to export CSV:\n{e}")
 
@@ -364,55 +420,52 @@ class UserGUI(QMainWindow):
         """
         Loads and initializes the summary panel in the user interface.
         This method builds the path to the UI file for the collapsible tab, initializes
-        the tab with the summary information, and populates it with data retrieved from
-        the `_summary_month_info` object. The summary panel is added to the "InformationPanel"
-        layout in the main UI.
+        the tab with placeholder values and adds it to the "InformationPanel" layout in
+        the main UI. The database figures are fetched on a background thread and filled
+        in by `on_summary_loaded`, so the window paints without waiting for MongoDB.
         Raises:
             [ERROR]: Logs an error message if the "InformationPanel" layout is not found.
-        Summary Fields Populated:
-            - day_month_LD: Total number of workdays in the month.
-            - holidays_month_LD: Number of holidays in the month.
-            - total_work_days_LD: Total number of working days in the month (excluding holidays).
-            - active_hours_LD: Total active time for the current month.
-            - inactive_days_LD: Total inactive time for the current month.
-            - Active_LD: Total active time for the current day.
-            - Inactive_LD: Total inactive time for the current day.
         """
         # === Build full path to UI file ===
         collapse_ui_path = os.path.join(os.path.dirname(script_path), "ui/collapse.ui")
 
         # === Initialize CollapsibleTab, collapsed by default ===
-        summary = CollapsibleTab("Summary", collapse_ui_path, start_collapsed=False)
+        self._summary_tab = CollapsibleTab("Summary", collapse_ui_path, start_collapsed=False)
 
         # === Find container layout in main UI ===
         layout = self.ui.findChild(QVBoxLayout, "InformationPanel")
         
-        month_work_days                 = "22"
-        holidays_in_month               = self._summary_month_info.get_number_of_holidays()
-        _work_days_in_month             = int(month_work_days) - int(holidays_in_month)
-        total_active_time_this_month    = self._summary_month_info.get_total_active_time()
-        total_inactive_time_this_month  = self._summary_month_info.get_total_inactive_time()
-                
-        total_active_time_today         = self._summary_month_info.get_total_active_time_off_today()
-        total_inactive_time_today       = self._summary_month_info.get_total_inactive_time_off_today()
-        
         if layout:
-            layout.addWidget(summary)
-
-            # === Populate fields after loading ===
-            summary.set_values({
-                "day_month_LD"          : str(month_work_days),
-                "holidays_month_LD"     : str(holidays_in_month),
-                "total_work_days_LD"    : str(_work_days_in_month),
-                "active_hours_LD"       : str(total_active_time_this_month),
-                "inactive_days_LD"      : str(total_inactive_time_this_month),
-                "Active_LD"             : str(total_active_time_today),
-                "Inactive_LD"           : str(total_inactive_time_today)
-            })
+            layout.addWidget(self._summary_tab)
+
+            # === Placeholders until the data arrives ===
+            self._summary_tab.set_values({name: "..." for name in SUMMARY_FIELDS})
+
+            self._summary_loader = SummaryLoader()
+            self._summary_loader.loaded.connect(self.on_summary_loaded)
+            self._summary_loader.failed.connect(lambda error: logging.error("Summary panel load failed: %s", error))
+            self._summary_loader.start(self._summary_month_info)
 
         else:
             print("[ERROR] Could not find 'InformationPanel' layout in UI.")
 
+    # ----------------------------------------------------------------------------------------------------
+    # on_summary_loaded fills the summary panel once the background fetch finished
+    # ----------------------------------------------------------------------------------------------------
+    def on_summary_loaded(self, values):
+        """
+        Populates the summary panel with the values computed by `SummaryLoader`.
+        Summary Fields Populated:
+            - day_month_LD: Total number of workdays in the month.
+            - holidays_month_LD: Number of holidays in the month.
+            - total_work_days_LD: Total number of working days in the month (excluding holidays).
+            - active_hours_LD: Total active time for the current month.
+            - inactive_days_LD: Total inactive time for the current month.
+            - Active_LD: Total active time for the current day.
+            - Inactive_LD: Total inactive time for the current day.
+        """
+        self._summary_tab.set_values(values)
+
     # ----------------------------------------------------------------------------------------------------
     # add_date_selectors method to add date selectors and filter buttons
     # ----------------------------------------------------------------------------------------------------
@@ -620,6 +673,19 @@ class UserGUI(QMainWindow):
         for col in range(4):
             header.setSectionResizeMode(col, QHeaderView.Stretch)
 
+    # ----------------------------------------------------------------------------------------------------
+    # Reuse one GetPulseData (and its pooled MongoDB client) for every search
+    # ----------------------------------------------------------------------------------------------------
+    def get_pulse_data_source(self):
+        """
+        Returns the window's GetPulseData instance, creating it on first use.
+        The underlying MongoClient comes from the shared per-process registry, so
+        repeated searches and exports reuse pooled connections instead of reconnecting.
+        """
+        if self._pulse_data is None:
+            self._pulse_data = GetPulseData()
+        return self._pulse_data
+
     # ----------------------------------------------------------------------------------------------------
     # Search button clicked event handler
     # ----------------------------------------------------------------------------------------------------
@@ -648,12 +714,10 @@ class UserGUI(QMainWindow):
         logging.info(f"Searching logs from {start_datetime} to {end_datetime}")
 
         try:
-            ac = GetPulseData()
-
-            if self.radio_log_summary.isChecked():
-                results = ac.get_summary_logs(start_datetime, end_datetime)  #Add this method if needed
-            else:
-                results = ac.get_pulse_data(start_datetime, end_datetime)
+            # Repeated searches over an unchanged range come from the query cache
+            results = self.get_pulse_data_source().get_rows(
+                start_datetime, end_datetime, summaries=self.radio_log_summary.isChecked()
+            )
 
             table_data = [
                 (
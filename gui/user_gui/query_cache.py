@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# query_cache.py - LRU cache for the user GUI's search results
+# Author: Sanja
+
+# Heart Beat Application - Query Cache
+# Search results are kept per (user, log type, start, end) together with a
+# freshness marker: the newest pulse (timestamp, _id) of that user at fetch time.
+# A lookup compares the stored marker with the current one, which costs a single
+# indexed find_one, so unchanged ranges are served from memory and any new pulse
+# makes the entry stale. Eviction is least-recently-used, bounded both by entry
+# count and by the approximate memory the rows take.
+# =============================================================================
+# Imports
+# =============================================================================
+import sys
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 32
+DEFAULT_MAX_BYTES   = 16 * 1024 * 1024
+
+
+def estimate_size(rows):
+    """Approximate memory taken by a list of flat row dicts (or tuples)."""
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        values = row.values() if isinstance(row, dict) else row
+        size += sum(sys.getsizeof(value) for value in values)
+    return size
+
+
+# =============================================================================
+# QueryCache Class
+# =============================================================================
+class QueryCache:
+
+    # -------------------------------------------------------------------------
+    # _init_
+    # -------------------------------------------------------------------------
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries    = max_entries
+        self.max_bytes      = max_bytes
+        self.total_bytes    = 0
+        self.stats          = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+        self._entries       = OrderedDict()     # key -> (marker, rows, size)
+        self._lock          = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # -------------------------------------------------------------------------
+    # get
+    # -------------------------------------------------------------------------
+    def get(self, key, marker):
+        """
+        Returns the cached rows for `key` if they were fetched at `marker`, else None.
+        Stale entries are dropped on the spot.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if entry[0] != marker:
+                self._remove(key)
+                self.stats["stale"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return list(entry[1])
+
+    # -------------------------------------------------------------------------
+    # put
+    # -------------------------------------------------------------------------
+    def put(self, key, marker, rows):
+        """Stores rows fetched at `marker`, then evicts least recently used entries over the limits."""
+        rows = list(rows)
+        size = estimate_size(rows)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                # A single oversized result would flush everything else for nothing
+                return
+
+            self._entries[key] = (marker, rows, size)
+            self.total_bytes += size
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    # -------------------------------------------------------------------------
+    # invalidate / clear
+    # -------------------------------------------------------------------------
+    def invalidate(self, predicate=None):
+        """Drops every entry whose key matches `predicate`, or all entries."""
+        with self._lock:
+            for key in [key for key in self._entries if predicate is None or predicate(key)]:
+                self._remove(key)
+
+    def clear(self):
+        self.invalidate()
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.total_bytes -= size
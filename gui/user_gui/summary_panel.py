@@ -1,6 +1,5 @@
 # db_handler.py
 
-import yaml
 from pymongo import MongoClient
 from datetime import datetime
 import os
@@ -20,7 +19,8 @@ _holidays_path = os.path.join(_root, "config/holidaysList.yml")
 if not os.path.exists(_holidays_path):
     raise FileNotFoundError(f"Holidays file not found at {_holidays_path}")
 
-from core import connect_to_db
+from core.storage import open_database
+from core.config_service import get_config
 
 # === Logging === 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -30,13 +30,13 @@ logger = logging.getLogger(__name__)
 def load_config():
     try:
         if os.path.exists(_holidays_path):
-            with open(_holidays_path, 'r') as f:
-                cfg = yaml.safe_load(f) or {}
-                current_month = datetime.now().strftime("%B")
+            # Parsed once; re-read only when holidaysList.yml changes on disk
+            cfg = get_config(_holidays_path).get()
+            current_month = datetime.now().strftime("%B")
 
-                # Safely get holidays for the current month
-                holidays = cfg.get(current_month, [])
-                return holidays  # Return list of holidays this month
+            # Safely get holidays for the current month
+            holidays = cfg.get(current_month, [])
+            return holidays  # Return list of holidays this month
 
     except Exception as e:
         logging.error(f"[CONFIG] Failed to load holiday config: {e}")
@@ -50,9 +50,35 @@ class SummaryPanel:
     
     def __init__(self):
         
-        self.client             = connect_to_db.MongoDatabase()
-        self.pulse_logs_data    = self.client.get_logs()
-        self.pulse_summary_data = self.client.get_summaries()
+        # Lazy: building the panel never blocks on the server; call load() to fetch data
+        self.client             = open_database(buffered=False, lazy=True)
+        self.daily_stats        = []
+
+    # -------------------------------------------------------------------------
+    # wait for the lazily connected database
+    # -------------------------------------------------------------------------
+    def wait_until_ready(self, timeout=None) -> bool:
+        """
+        Waits until the database answered its first ping; embedded backends are always ready.
+        Returns:
+            bool: True when connected, False if `timeout` expired first.
+        """
+        wait = getattr(self.client, "wait_until_ready", None)
+        return wait(timeout) if wait else True
+
+    # -------------------------------------------------------------------------
+    # load this month's rollups
+    # -------------------------------------------------------------------------
+    def load(self):
+        """
+        Fetches this user's daily_user_stats for the current month.
+        Blocks until the database answers, so call it off the GUI thread.
+        """
+        current_user    = getpass.getuser()
+        month_start     = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        # One daily_user_stats document per day and host for this user and month
+        self.daily_stats        = self.client.get_daily_stats(username=current_user, start_date=month_start)
 
     # -------------------------------------------------------------------------
     # get number_of_holidays in the month
@@ -65,137 +91,51 @@ class SummaryPanel:
         self.holidays_in_month  = load_config()
         return len(self.holidays_in_month) 
 
+    # -------------------------------------------------------------------------
+    # sum the rolled up seconds for one field
+    # -------------------------------------------------------------------------
+    def _sum_seconds(self, field, day=None) -> timedelta:
+        """
+        Returns the total of `field` over the month, or for a single "YYYY-MM-DD" day.
+        """
+        rows = [row for row in self.daily_stats if not day or row.get("date") == day]
+        return timedelta(seconds=int(sum(row.get(field, 0) for row in rows)))
+
     # -------------------------------------------------------------------------
     # get total Active time in this month
     # -------------------------------------------------------------------------
     def get_total_active_time(self) -> timedelta:
         """
-        Returns the total active time in this month from pulse_summary_data.
-        Parses string durations into timedelta objects if needed.
+        Returns the total active time in this month from daily_user_stats.
         """
-        total_active_time = timedelta(0)
-
-        for summary in self.pulse_logs_data:
-            active_time = summary.get('active_time')
-            
-            if isinstance(active_time, timedelta):
-                total_active_time += active_time
-            elif isinstance(active_time, str):
-                try:
-                    # Example format: "2:30:00" => 2h 30m
-                    (h, m, s) = map(int, active_time.split(":"))
-                    total_active_time += timedelta(hours=h, minutes=m, seconds=s)
-                except Exception as e:
-                    logging.warning(f"Could not parse active_time '{active_time}': {e}")
-            else:
-                logging.warning(f"Ignored invalid active_time type: {type(active_time)}")
-
-        return total_active_time
+        return self._sum_seconds("active_seconds")
 
     # -------------------------------------------------------------------------
     # get total Inactive time in this month
     # -------------------------------------------------------------------------
     def get_total_inactive_time(self) -> timedelta:
         """
-        Returns the total inactive time in this month from pulse_summary_data.
-        Parses string durations into timedelta objects if needed.
-        """
-        total_inactive_time = timedelta(0)
-
-        for summary in self.pulse_logs_data:
-            inactive_time = summary.get('inactive_time')
-            
-            if isinstance(inactive_time, timedelta):
-                total_inactive_time += inactive_time
-            elif isinstance(inactive_time, str):
-                try:
-                    # Example format: "2:30:00" => 2h 30m
-                    (h, m, s) = map(int, inactive_time.split(":"))
-                    total_inactive_time += timedelta(hours=h, minutes=m, seconds=s)
-                except Exception as e:
-                    logging.warning(f"Could not parse inactive_time '{inactive_time}': {e}")
-            else:
-                logging.warning(f"Ignored invalid inactive_time type: {type(inactive_time)}")
-
-        return total_inactive_time
+        Returns the total inactive time in this month from daily_user_stats.
+        """
+        return self._sum_seconds("inactive_seconds")
     
     # -------------------------------------------------------------------------
     # get total active time off today in this month
     # -------------------------------------------------------------------------
     def get_total_active_time_off_today(self) -> timedelta:
         """
-        first check today day  and get data from pulse_summary_data today
-        and then return the total active time off today.
-        Parses string durations into timedelta objects if needed.
-        
+        Returns the total active time of today from daily_user_stats.
         """
-        today = datetime.now().strftime("%Y-%m-%d")
-        total_active_time_today = timedelta(0)
-        
-        for summary in self.pulse_logs_data:
-            
-            timeStamp = (summary.get('timestamp'))
-            if isinstance(timeStamp, datetime):
-                timeStamp = timeStamp.strftime("%Y-%m-%d")
-                
-                if timeStamp == today:
-                    active_time = summary.get('active_time')
-                    
-                    if isinstance(active_time, timedelta):
-                        total_active_time_today += active_time
-                    elif isinstance(active_time, str):
-                        try:
-                            # Example format: "2:30:00" => 2h 30m
-                            (h, m, s) = map(int, active_time.split(":"))
-                            total_active_time_today += timedelta(hours=h, minutes=m, seconds=s)
-                            
-                        except Exception as e:
-                            logging.warning(f"Could not parse active_time '{active_time}': {e}")
-                    else:
-                        logging.warning(f"Ignored invalid active_time type: {type(active_time)}")
-            else:
-                logging.warning(f"Ignored invalid timestamp type: {type(timeStamp)}")
-                        
-        return total_active_time_today
+        return self._sum_seconds("active_seconds", datetime.now().strftime("%Y-%m-%d"))
 
     # -------------------------------------------------------------------------
     # get total inactive time off today in this month
     # -------------------------------------------------------------------------
     def get_total_inactive_time_off_today(self) -> timedelta:
         """
-        first check today day  and get data from pulse_summary_data today
-        and then return the total inactive time off today.
-        Parses string durations into timedelta objects if needed.
-        
+        Returns the total inactive time of today from daily_user_stats.
         """
-        today = datetime.now().strftime("%Y-%m-%d")
-        total_inactive_time_today = timedelta(0)
-        
-        for summary in self.pulse_logs_data:
-            
-            timeStamp = (summary.get('timestamp'))
-            if isinstance(timeStamp, datetime):
-                timeStamp = timeStamp.strftime("%Y-%m-%d")
-                
-                if timeStamp == today:
-                    inactive_time = summary.get('inactive_time')
-                    
-                    if isinstance(inactive_time, timedelta):
-                        total_inactive_time_today += inactive_time
-                    elif isinstance(inactive_time, str):
-                        try:
-                            # Example format: "2:30:00" => 2h 30m
-                            (h, m, s) = map(int, inactive_time.split(":"))
-                            total_inactive_time_today += timedelta(hours=h, minutes=m, seconds=s)
-                            
-                        except Exception as e:
-                            logging.warning(f"Could not parse inactive_time '{inactive_time}': {e}")
-                    else:
-                        logging.warning(f"Ignored invalid inactive_time type: {type(inactive_time)}")
-            else:
-                logging.warning(f"Ignored invalid timestamp type: {type(timeStamp)}")
-                        
-        return total_inactive_time_today
+        return self._sum_seconds("inactive_seconds", datetime.now().strftime("%Y-%m-%d"))
     
     
 # SP = SummaryPanel()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# conftest.py - Shared fixtures for the core tests
+# Author: Sanja
+#
+# Usage:
+#   python -m pytest -q tests
+#
+# The core modules import their siblings top-level, so core/ goes on sys.path.
+# Tests that need MongoDB use mongomock; the few that need real query plans use
+# the server from config.yml and are skipped when it cannot be reached.
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "core"))
+
+# Agents keep their files below %USERPROFILE%; never touch the real profile from tests
+os.environ["USERPROFILE"] = tempfile.mkdtemp(prefix="heartbeat_tests_")
+
+
+@pytest.fixture
+def mongomock_db(request, monkeypatch):
+    """
+    A MongoDatabase backed by an in-memory mongomock server; unbuffered unless
+    parametrized indirectly with True for the write buffer.
+    """
+    mongomock = pytest.importorskip("mongomock")
+    import connect_to_db
+
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(connect_to_db, "MongoClient", lambda uri, event_listeners=(), **options: client)
+    db = connect_to_db.MongoDatabase(buffered=getattr(request, "param", False), lazy=False)
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    from sqlite_backend import SQLiteDatabase
+
+    db = SQLiteDatabase(str(tmp_path / "heartbeat.db"), buffered=False)
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def mongo_server():
+    """A MongoDatabase on a scratch database of the configured server; skips without one."""
+    from pymongo import MongoClient
+    from connect_to_db import MongoDatabase
+    from benchmarks import use_database
+
+    db = MongoDatabase(buffered=False, lazy=True)
+    probe = MongoClient(db.uri, serverSelectionTimeoutMS=1000)
+    try:
+        probe.admin.command("ping")
+    except Exception as e:
+        db.close()
+        pytest.skip(f"MongoDB server not reachable: {e}")
+    finally:
+        probe.close()
+
+    use_database(db, db.client["heartbeat_tests"])
+    yield db
+    db.client.drop_database("heartbeat_tests")
+    db.close()
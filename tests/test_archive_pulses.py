@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# test_archive_pulses.py - Index use of the archive job's day walk
+# Author: Sanja
+
+from datetime import datetime, timedelta
+
+from connect_to_db import MANAGED_INDEXES
+
+
+def test_a_pulse_index_leads_with_timestamp():
+    leading = [keys[0][0] for collection, keys, _ in MANAGED_INDEXES if collection == "activity_pulse"]
+    assert "timestamp" in leading
+
+
+def test_next_day_lookup_uses_the_timestamp_index(mongo_server):
+    from benchmarks import find_key
+
+    mongo_server.ensure_indexes()
+    mongo_server.insert_pulses([
+        {"username": f"user{index}", "hostname": "HOST-A", "timestamp": datetime(2025, 1, 1) + timedelta(hours=index),
+         "status": "Active", "active_time": 0, "inactive_time": 60}
+        for index in range(48)
+    ])
+    cursor = mongo_server.activity_collection.find(
+        mongo_server.codec.query({"timestamp": {"$gte": datetime(2025, 1, 2)}}), {"timestamp": 1}
+    ).sort(mongo_server.codec.sort([("timestamp", 1)])).limit(1)
+    plan = cursor.explain()
+
+    assert find_key(plan, "indexName") == "timestamp"
+    assert find_key(plan, "executionStats")["totalDocsExamined"] <= 1
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+# test_async_db.py - AsyncMongoDatabase against a small in-process fake client
+# Author: Sanja
+#
+# The fake implements just the async client surface async_db.py uses; filters
+# are evaluated with mongomock's matcher so queries behave like the server's.
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from pymongo import errors
+
+from async_db import AsyncMongoDatabase
+from connect_to_db import MongoDatabase
+from pulse_archive import PulseArchive
+from pulse_codec import PulseCodec, PulseNames
+from resilience import CircuitOpenError, RetryPolicy
+
+mongomock = pytest.importorskip("mongomock")
+from mongomock.filtering import filter_applies  # noqa: E402
+
+DAY = datetime(2025, 3, 10)
+
+
+# =============================================================================
+# Fake async client
+# =============================================================================
+class FakeCursor:
+
+    def __init__(self, docs, limit=0):
+        self.docs   = docs
+        self.limit  = limit
+        self.closed = False
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.docs.sort(key=lambda doc: doc.get(field), reverse=direction < 0)
+        return self
+
+    async def __aiter__(self):
+        for doc in self.docs[:self.limit or None]:
+            yield doc
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeCollection:
+
+    def __init__(self):
+        self.docs           = {}
+        self.bulk_writes    = []
+        self.in_flight      = 0
+        self.max_in_flight  = 0
+
+    async def insert_one(self, doc):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.005)
+            self.docs[doc["_id"]] = dict(doc)
+        finally:
+            self.in_flight -= 1
+
+    async def insert_many(self, docs, ordered=True):
+        write_errors = []
+        for index, doc in enumerate(docs):
+            if doc["_id"] in self.docs:
+                write_errors.append({"index": index, "code": 11000, "errmsg": "duplicate key"})
+            else:
+                self.docs[doc["_id"]] = dict(doc)
+        if write_errors:
+            raise errors.BulkWriteError({"writeErrors": write_errors, "nInserted": len(docs) - len(write_errors)})
+
+    def find(self, query=None, projection=None, limit=0, batch_size=None):
+        docs = [dict(doc) for doc in self.docs.values() if filter_applies(query or {}, doc)]
+        return FakeCursor(docs, limit)
+
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_writes.append(operations)
+
+    async def create_index(self, keys, **options):
+        return options.get("name")
+
+
+class FakeDatabase(dict):
+
+    def __missing__(self, name):
+        collection = self[name] = FakeCollection()
+        return collection
+
+
+class FakeAdmin:
+
+    def __init__(self, reachable):
+        self.reachable = reachable
+
+    async def command(self, name):
+        if not self.reachable:
+            raise errors.ServerSelectionTimeoutError("no servers")
+        return {"ok": 1}
+
+
+class FakeClient(dict):
+
+    def __init__(self, reachable=True):
+        super().__init__()
+        self.admin = FakeAdmin(reachable)
+
+    def __missing__(self, name):
+        db = self[name] = FakeDatabase()
+        return db
+
+    async def close(self):
+        pass
+
+
+def pulse(minute, username="sanja"):
+    return {
+        "_id": ObjectId(), "username": username, "hostname": "HOST-A",
+        "timestamp": DAY + timedelta(minutes=minute), "status": "Active",
+        "active_time": 60, "inactive_time": 0,
+    }
+
+
+def run(scenario):
+    return asyncio.run(scenario())
+
+
+# =============================================================================
+# Tests
+# =============================================================================
+def test_schedule_pulse_bounds_writes_in_flight():
+    client = FakeClient()
+
+    async def scenario():
+        db = AsyncMongoDatabase(client=client, max_in_flight=3)
+        await db.connect()
+        for minute in range(20):
+            db.schedule_pulse(pulse(minute))
+        assert len(db._pending_writes) == 20
+        await db.close()
+        return db.activity_collection
+
+    collection = run(scenario)
+    assert collection.max_in_flight == 3
+    assert len(collection.docs) == 20
+
+
+def test_insert_pulses_skips_replayed_duplicates():
+    client = FakeClient()
+    first = [pulse(minute) for minute in range(3)]
+    new = pulse(3)
+
+    async def scenario():
+        db = AsyncMongoDatabase(client=client)
+        await db.connect()
+        assert await db.insert_pulses([dict(doc) for doc in first]) == 3
+        assert await db.insert_pulses([dict(doc) for doc in first] + [dict(new)]) == 1
+        await db.close()
+        return db
+
+    db = run(scenario)
+    assert len(db.activity_collection.docs) == 4
+    # Only the new pulse reaches the daily rollups on the replay
+    replayed = db.daily_stats_collection.bulk_writes[-1]
+    assert len(replayed) == len(MongoDatabase.daily_stats_operations([new]))
+
+
+def test_insert_pulse_spools_until_the_server_answers():
+    client = FakeClient(reachable=False)
+    spooled = []
+
+    async def scenario():
+        db = AsyncMongoDatabase(client=client)
+        await db.connect(lazy=True)
+        db.set_fallback(spooled)
+        await db.insert_pulse(pulse(0))
+        await db.close()
+        return db
+
+    db = run(scenario)
+    assert not db.activity_collection.docs
+    assert len(spooled) == 1 and "_id" in spooled[0]
+
+
+def test_iter_logs_merges_archived_days(tmp_path):
+    client = FakeClient()
+    archive = PulseArchive(str(tmp_path), "gzip")
+    old = pulse(0)
+    old["timestamp"] = DAY - timedelta(days=100)
+    archive.write_partition(old["timestamp"].date(), "sanja", [old])
+    hot = pulse(0)
+
+    async def scenario(**options):
+        db = AsyncMongoDatabase(client=client)
+        db.archive = archive
+        await db.connect()
+        await db.insert_pulses([dict(hot)])
+        rows = [doc async for doc in db.iter_logs(username="sanja", start=DAY - timedelta(days=200), **options)]
+        await db.close()
+        return [doc["_id"] for doc in rows]
+
+    assert asyncio.run(scenario(sort=[("timestamp", 1)])) == [old["_id"], hot["_id"]]
+    assert asyncio.run(scenario(sort=[("timestamp", -1)])) == [hot["_id"], old["_id"]]
+    assert asyncio.run(scenario(sort=[("timestamp", 1)], limit=1)) == [old["_id"]]
+
+
+def test_iter_logs_decodes_the_compact_layout():
+    client = FakeClient()
+    names = PulseNames(mongomock.MongoClient().db.pulse_names)
+    docs = [pulse(0), pulse(1, username="alex")]
+
+    async def scenario():
+        db = AsyncMongoDatabase(client=client)
+        await db.connect()
+        db.codec = PulseCodec("compact", names=names)
+        await db.insert_pulses([dict(doc) for doc in docs])
+        rows = [doc async for doc in db.iter_logs(username="sanja", sort=[("timestamp", 1)])]
+        await db.close()
+        return db, rows
+
+    db, rows = run(scenario)
+    stored = db.activity_collection.docs[docs[0]["_id"]]
+    assert "username" not in stored
+    assert rows == [docs[0]]
+
+
+def test_insert_pulses_rolls_up_the_written_part_of_a_failed_batch():
+    client = FakeClient()
+    docs = [pulse(minute) for minute in range(3)]
+
+    async def scenario():
+        db = AsyncMongoDatabase(client=client)
+        await db.connect()
+        collection = db.activity_collection
+        real_insert_many = collection.insert_many
+
+        async def reject_second(encoded, ordered=True):
+            await real_insert_many([encoded[0], encoded[2]], ordered=ordered)
+            raise errors.BulkWriteError({"writeErrors": [{"index": 1, "code": 121, "errmsg": "validation"}]})
+
+        collection.insert_many = reject_second
+        with pytest.raises(errors.BulkWriteError):
+            await db.insert_pulses([dict(doc) for doc in docs])
+        await db.close()
+        return db
+
+    db = run(scenario)
+    rolled_up = db.daily_stats_collection.bulk_writes[-1]
+    assert len(rolled_up) == len(MongoDatabase.daily_stats_operations([docs[0], docs[2]]))
+
+
+def test_insert_pulses_retries_transient_errors_and_counts_each_pulse_once():
+    client = FakeClient()
+    docs = [pulse(minute) for minute in range(4)]
+    rolled_up = []
+
+    async def scenario():
+        db = AsyncMongoDatabase(client=client)
+        await db.connect()
+        db.retry_policy = RetryPolicy(attempts=3, base_delay=0, max_delay=0)
+        collection = db.activity_collection
+        real_insert_many = collection.insert_many
+        calls = []
+
+        async def drop_first_attempt(encoded, ordered=True):
+            calls.append(len(encoded))
+            if len(calls) == 1:
+                # Half of the batch is stored before the connection drops
+                await real_insert_many(encoded[:2], ordered=ordered)
+                raise errors.AutoReconnect("connection reset")
+            await real_insert_many(encoded, ordered=ordered)
+
+        async def capture(inserted):
+            rolled_up.extend(inserted)
+
+        collection.insert_many = drop_first_attempt
+        db.update_daily_stats = capture
+        count = await db.insert_pulses([dict(doc) for doc in docs])
+        await db.close()
+        return count, calls
+
+    count, calls = run(scenario)
+    assert count == 4 and calls == [4, 4]
+    assert sorted(doc["_id"] for doc in rolled_up) == sorted(doc["_id"] for doc in docs)
+
+
+def test_insert_pulses_fails_fast_while_the_circuit_is_open():
+    async def scenario():
+        db = AsyncMongoDatabase(client=FakeClient())
+        await db.connect()
+        for _ in range(db.breaker.failure_threshold):
+            db.breaker.record_failure()
+        with pytest.raises(CircuitOpenError):
+            await db.insert_pulses([pulse(0)])
+        await db.close()
+
+    run(scenario)
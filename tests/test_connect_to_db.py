@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# test_connect_to_db.py - Write path of MongoDatabase on mongomock
+# Author: Sanja
+
+from datetime import datetime, timedelta
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import connect_to_db  # noqa: E402
+
+
+def pulse(minute):
+    return {"username": "sanja", "hostname": "HOST-A", "timestamp": datetime(2025, 3, 1, 9) + timedelta(minutes=minute),
+            "status": "Active", "active_time": 0, "inactive_time": 60}
+
+
+@pytest.mark.parametrize("mongomock_db", [True], indirect=True)
+def test_buffer_hands_overflow_to_the_fallback(mongomock_db):
+    spooled = []
+    mongomock_db.set_fallback(spooled)
+    mongomock_db.buffer_max_size = 100
+    mongomock_db.buffer_max_pending = 3
+
+    pulses = [pulse(minute) for minute in range(5)]
+    for doc in pulses:
+        mongomock_db.insert_pulse(doc)
+
+    assert spooled == pulses[:2]
+    assert mongomock_db._buffer == pulses[2:]
+
+
+def test_spooled_pulse_keeps_the_id_of_the_failed_write(mongomock_db):
+    from pymongo.errors import AutoReconnect
+
+    spooled = []
+    mongomock_db.set_fallback(spooled)
+    collection = mongomock_db.activity_collection
+
+    def insert_then_drop(doc, *args, **kwargs):
+        # The write lands, but the connection drops before the acknowledgement
+        collection.__class__.insert_one(collection, doc)
+        raise AutoReconnect("connection reset")
+
+    collection.insert_one = insert_then_drop
+    mongomock_db.insert_pulse(pulse(0))
+
+    assert len(spooled) == 1
+    assert collection.find_one()["_id"] == spooled[0]["_id"]
+    assert mongomock_db.insert_pulses(spooled) == 0
+
+
+def test_retried_batch_rolls_up_every_pulse_once(mongomock_db, monkeypatch):
+    from pymongo.errors import AutoReconnect
+    from resilience import RetryPolicy
+
+    collection = mongomock_db.activity_collection
+    calls = []
+
+    def partial_then_ok(docs, ordered=True):
+        calls.append(len(docs))
+        if len(calls) == 1:
+            # Half of the first attempt is stored before the connection drops
+            collection.__class__.insert_many(collection, docs[:2])
+            raise AutoReconnect("connection reset")
+        return collection.__class__.insert_many(collection, docs, ordered=ordered)
+
+    rolled_up = []
+    collection.insert_many = partial_then_ok
+    monkeypatch.setattr(mongomock_db, "update_daily_stats", rolled_up.extend)
+    mongomock_db.retry_policy = RetryPolicy(attempts=3, base_delay=0, max_delay=0)
+
+    pulses = [pulse(minute) for minute in range(4)]
+    assert mongomock_db.insert_pulses(pulses) == 4
+    assert calls == [4, 4]
+    assert sorted(doc["_id"] for doc in rolled_up) == sorted(doc["_id"] for doc in pulses)
+    assert collection.count_documents({}) == 4
+
+
+def test_shared_client_is_closed_when_the_ping_fails(monkeypatch):
+    from pymongo.errors import ServerSelectionTimeoutError
+
+    class UnreachableClient:
+        closed = False
+
+        def __init__(self, uri, **options):
+            self.admin = self
+            UnreachableClient.last = self
+
+        def command(self, name):
+            raise ServerSelectionTimeoutError("no servers")
+
+        def close(self):
+            self.closed = True
+
+    monkeypatch.setattr(connect_to_db, "MongoClient", UnreachableClient)
+    with pytest.raises(ServerSelectionTimeoutError):
+        connect_to_db.get_shared_client("mongodb://unreachable:1/")
+
+    assert UnreachableClient.last.closed
+    assert "mongodb://unreachable:1/" not in connect_to_db._clients
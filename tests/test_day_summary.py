@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# test_day_summary.py - Day-end summary totals and index coverage
+# Author: Sanja
+
+from datetime import date, datetime
+
+import pytest
+
+from connect_to_db import MongoDatabase, MANAGED_INDEXES
+from sqlite_backend import DAY_SUMMARY_SQL, _to_text
+
+DAY = date(2025, 3, 1)
+
+# (username, hostname, timestamp, status, active_time, inactive_time)
+PULSES = [
+    ("sanja", "HOST-A", datetime(2025, 3, 1, 0, 0, 5), "Active", 0, 300),
+    ("sanja", "HOST-A", datetime(2025, 3, 1, 9, 0, 0), "Inactive", 1800.5, 0),
+    ("sanja", "HOST-A", datetime(2025, 3, 1, 12, 30, 0), "Active", 0, 120),
+    ("sanja", "HOST-A", datetime(2025, 3, 1, 23, 59, 59), "Inactive", 41399, 0),
+    # Other host, other user, and the neighbouring days must not count
+    ("sanja", "HOST-B", datetime(2025, 3, 1, 10, 0, 0), "Inactive", 999, 0),
+    ("alex", "HOST-A", datetime(2025, 3, 1, 10, 0, 0), "Inactive", 777, 0),
+    ("sanja", "HOST-A", datetime(2025, 2, 28, 23, 59, 59), "Inactive", 55, 0),
+    ("sanja", "HOST-A", datetime(2025, 3, 2, 0, 0, 0), "Active", 0, 66),
+]
+
+EXPECTED = {
+    "username": "sanja",
+    "hostname": "HOST-A",
+    "date": "2025-03-01",
+    "active_seconds": 1800.5 + 41399,
+    "inactive_seconds": 300 + 120,
+    "pulses": 4,
+    "first_seen": datetime(2025, 3, 1, 0, 0, 5),
+    "last_seen": datetime(2025, 3, 1, 23, 59, 59),
+}
+
+
+def pulse_docs():
+    return [
+        {"username": user, "hostname": host, "timestamp": timestamp, "status": status,
+         "active_time": active, "inactive_time": inactive}
+        for user, host, timestamp, status, active, inactive in PULSES
+    ]
+
+
+@pytest.mark.parametrize("backend", ["sqlite_db", "mongomock_db"])
+def test_day_summary_totals(backend, request):
+    db = request.getfixturevalue(backend)
+    assert db.insert_pulses(pulse_docs()) == len(PULSES)
+
+    assert db.day_summary("sanja", "HOST-A", DAY) == EXPECTED
+
+
+def test_day_summary_without_pulses_is_zero(sqlite_db):
+    summary = sqlite_db.day_summary("nobody", "HOST-A", DAY)
+    assert (summary["active_seconds"], summary["inactive_seconds"], summary["pulses"]) == (0, 0, 0)
+
+
+def test_sqlite_day_summary_reads_covering_index(sqlite_db):
+    params = ("sanja", "HOST-A", _to_text(datetime(2025, 3, 1)), _to_text(datetime(2025, 3, 2)))
+    plan = " ".join(row[-1] for row in sqlite_db.conn.execute("EXPLAIN QUERY PLAN " + DAY_SUMMARY_SQL, params))
+    assert "USING COVERING INDEX pulses_day_summary" in plan
+
+
+def test_mongo_day_summary_pipeline_fits_index():
+    """Every field the pipeline reads is in the 'day_summary' index, so no document has to be fetched."""
+    index = next(keys for collection, keys, options in MANAGED_INDEXES if options.get("name") == "day_summary")
+    indexed = {field for field, _ in index}
+    match, group = MongoDatabase.day_summary_pipeline("sanja", "HOST-A", DAY)
+
+    assert set(match["$match"]) <= indexed
+    read = {value[1:] for accumulator in group["$group"].values() if isinstance(accumulator, dict)
+            for value in accumulator.values() if isinstance(value, str)}
+    assert read <= indexed
+    assert group["$group"]["_id"] is None
+
+
+def test_mongo_day_summary_examines_no_documents(mongo_server):
+    from benchmarks import find_key
+
+    mongo_server.insert_pulses(pulse_docs())
+    pipeline = MongoDatabase.day_summary_pipeline("sanja", "HOST-A", DAY, codec=mongo_server.codec)
+    plan = mongo_server.db.command(
+        "explain", {"aggregate": mongo_server.activity_collection.name, "pipeline": pipeline, "cursor": {}},
+        verbosity="executionStats",
+    )
+
+    assert find_key(plan, "executionStats")["totalDocsExamined"] == 0
+    assert find_key(plan, "indexName") == "day_summary"
+    assert mongo_server.day_summary("sanja", "HOST-A", DAY) == EXPECTED
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# test_idle_reporter.py - Adaptive polling of the idle reporter on a fake clock
+# Author: Sanja
+
+import pytest
+
+from idle_reporter import IdleReporter, ADAPTIVE_MARGIN
+
+THRESHOLD = 300
+
+
+class StopMonitor(Exception):
+    pass
+
+
+class FakeUser:
+    """Clock, idle source and sleep of one simulated session; input happens at `inputs` (seconds)."""
+
+    def __init__(self, inputs, until):
+        self.now    = 0.0
+        self.inputs = sorted(inputs)
+        self.until  = until
+        self.wakeups = []   # (time the sleep started, status it was taken in, delay)
+        self.reporter = None
+
+    def clock(self):
+        return self.now
+
+    def idle(self):
+        return self.now - max(moment for moment in self.inputs if moment <= self.now)
+
+    def sleep(self, delay):
+        status = "Inactive" if self.reporter.idle_time > THRESHOLD else "Active"
+        self.wakeups.append((self.now, status, delay))
+        self.now += delay
+        if self.now > self.until:
+            raise StopMonitor
+
+
+@pytest.fixture
+def session(tmp_path):
+    # Idle from the start, input again at 1000 s, then idle until past the next threshold
+    user = FakeUser(inputs=[0.0, 1000.0], until=1400)
+    reporter = IdleReporter(idle_source=user.idle, clock=user.clock, sleep=user.sleep, base_dir=str(tmp_path))
+    reporter.settings = {**reporter.settings, "timeout": THRESHOLD, "polling": "adaptive",
+                         "inactive_check_interval": 1}
+    user.reporter = reporter
+    with pytest.raises(StopMonitor):
+        reporter.monitor()
+    return user
+
+
+def test_active_sleeps_until_the_threshold(session):
+    active = [(started, delay) for started, status, delay in session.wakeups if status == "Active"]
+
+    # One wake-up per threshold: right after each input, then straight past the threshold
+    assert active == [(0.0, pytest.approx(THRESHOLD + ADAPTIVE_MARGIN)),
+                      (pytest.approx(1000.2), pytest.approx(THRESHOLD + ADAPTIVE_MARGIN - 0.2))]
+
+
+def test_inactive_polls_every_second(session):
+    inactive = [(started, delay) for started, status, delay in session.wakeups if status == "Inactive"]
+
+    assert {delay for _, delay in inactive} == {1}
+    # From the threshold crossing at 300.2 s to the first reading after the input at 1000 s
+    assert len([started for started, _ in inactive if started < 1000]) == 700
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# test_idle_samples.py - Ring buffer of idle readings
+# Author: Sanja
+
+from datetime import datetime
+
+from idle_samples import IdleSamples
+
+START = datetime(2025, 3, 1, 9).timestamp()
+
+
+def test_out_of_order_readings_are_dropped():
+    samples = IdleSamples(capacity=8, threshold=60, clock=lambda: START + 20)
+    samples.add(START, 0)
+    samples.add(START + 10, 0)
+    samples.add(START + 5, 0)     # clock stepped back
+    samples.add(START + 10, 0)    # same instant again
+
+    assert len(samples) == 2
+    assert samples.samples() == [(START, 0), (START + 10, 0)]
+    assert samples.totals("session", now=START + 10)["active"] == 10
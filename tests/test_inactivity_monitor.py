@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# test_inactivity_monitor.py - Day rollover pulses of the monitor
+# Author: Sanja
+
+from datetime import date, datetime
+
+import inactivity_monitor
+from inactivity_monitor import InactivityMonitor
+
+
+class ListSpool:
+    def __init__(self):
+        self.entries = []
+
+    def append(self, entry):
+        self.entries.append(entry)
+
+
+def make_monitor():
+    monitor = InactivityMonitor.__new__(InactivityMonitor)
+    monitor.username = "sanja"
+    monitor.hostname = "HOST-A"
+    monitor.spool = ListSpool()
+    monitor.db = None
+    return monitor
+
+
+def test_day_end_pulse_is_stamped_on_the_closing_day(monkeypatch):
+    monitor = make_monitor()
+    summaries = []
+    monkeypatch.setattr(InactivityMonitor, "write_daily_summary", lambda self, day: summaries.append(day))
+
+    day_end = datetime(2025, 3, 1, 23, 59, 59)
+    monitor.log_day_end_status("Inactive", datetime(2025, 3, 1, 23, 0, 0).timestamp(), day_end.timestamp())
+    monitor.log_day_start_status("Inactive", datetime(2025, 3, 2).timestamp())
+
+    end_pulse, start_pulse = monitor.spool.entries
+    assert end_pulse["timestamp"] == day_end
+    assert end_pulse["active_time"] == 3599
+    assert start_pulse["timestamp"] == datetime(2025, 3, 2)
+    # log_day_end_status starts the summary on its own thread
+    for thread in inactivity_monitor.threading.enumerate():
+        if thread.name == "daily-summary":
+            thread.join(timeout=5)
+    assert summaries == [date(2025, 3, 1)]
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# test_log_importer.py - Replaying reporter logs into pulses
+# Author: Sanja
+
+import gzip
+from datetime import datetime, timedelta
+
+import log_importer
+from log_importer import import_group, pulse_id, read_events, reconstruct_pulses
+
+START = datetime(2025, 3, 10, 9)
+MAX_GAP = 12 * 3600
+
+
+def at(seconds):
+    return START + timedelta(seconds=seconds)
+
+
+def replay(events, max_gap=MAX_GAP):
+    return [(pulse["timestamp"], pulse["status"], pulse["active_time"], pulse["inactive_time"])
+            for pulse in reconstruct_pulses(events, "sanja", "HOST-A", max_gap)]
+
+
+def log_line(timestamp, message):
+    return f"{timestamp:%Y-%m-%d %H:%M:%S},{timestamp.microsecond // 1000:03d} - INFO - Status updated: {message}\n"
+
+
+def test_transitions_carry_the_period_they_end():
+    events = [(at(0), "Active"), (at(600), "Inactive"), (at(900), "Active")]
+
+    assert replay(events) == [
+        (at(0), "Active", 0, 0),
+        (at(600), "Inactive", 600, 0),
+        (at(900), "Active", 0, 300),
+    ]
+
+
+def test_repeated_statuses_do_not_start_a_new_period():
+    events = [(at(0), "Active"), (at(100), "Active"), (at(300), "Inactive"), (at(400), "Inactive")]
+
+    assert replay(events) == [(at(0), "Active", 0, 0), (at(300), "Inactive", 300, 0)]
+
+
+def test_session_end_closes_an_active_period():
+    events = [(at(0), "Active"), (at(120), "Logoff"), (at(200), "Logon"), (at(260), "Inactive")]
+
+    # The period after the logon has no known start, so the next transition carries nothing
+    assert replay(events) == [
+        (at(0), "Active", 0, 0),
+        (at(120), "Inactive", 120, 0),
+        (at(260), "Inactive", 0, 0),
+    ]
+
+
+def test_session_end_while_inactive_adds_no_pulse():
+    events = [(at(0), "Inactive"), (at(50), "Logoff (session end)")]
+
+    assert replay(events) == [(at(0), "Inactive", 0, 0)]
+
+
+def test_periods_longer_than_max_gap_are_not_counted():
+    events = [(at(0), "Active"), (at(100), "Inactive"), (at(100 + 3600), "Active"), (at(3800), "Logoff")]
+
+    assert replay(events, max_gap=600) == [
+        (at(0), "Active", 0, 0),
+        (at(100), "Inactive", 100, 0),
+        (at(3700), "Active", 0, 0),
+        (at(3800), "Inactive", 100, 0),
+    ]
+
+
+def test_pulse_id_is_deterministic():
+    first = pulse_id(at(0), "sanja", "HOST-A", "Active")
+
+    assert pulse_id(at(0), "sanja", "HOST-A", "Active") == first
+    assert pulse_id(at(0), "sanja", "HOST-A", "Inactive") != first
+    assert pulse_id(at(0), "alex", "HOST-A", "Active") != first
+    assert first.generation_time.replace(tzinfo=None) == at(0)
+
+
+def test_read_events_reads_rotated_gzip_files(tmp_path):
+    path = tmp_path / "idle_reporter.log.1.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as log:
+        log.write(log_line(at(0.25), "Active"))
+        log.write("2025-03-10 09:00:01,000 - INFO - Settings reloaded\n")
+        log.write(log_line(at(30), "Inactive"))
+    consumed = []
+
+    assert list(read_events(str(path), progress=consumed.append)) == [(at(0.25), "Active"), (at(30), "Inactive")]
+    assert sum(consumed) == path.stat().st_size
+
+
+def test_importing_the_same_logs_twice_stores_each_pulse_once(tmp_path, monkeypatch):
+    from sqlite_backend import SQLiteDatabase
+
+    log = tmp_path / "idle_reporter.log"
+    log.write_text("".join(log_line(at(seconds), status) for seconds, status in
+                           [(0, "Active"), (600, "Inactive"), (900, "Active")]), encoding="utf-8")
+    database = str(tmp_path / "heartbeat.db")
+    monkeypatch.setattr(log_importer, "open_database",
+                        lambda backend=None, buffered=None: SQLiteDatabase(database, buffered=False))
+    group = (str(tmp_path), "sanja", "HOST-A", [str(log)])
+    options = {"backend": "sqlite", "batch_size": 2, "max_gap": MAX_GAP, "dry_run": False}
+
+    assert import_group(group, options)["inserted"] == 3
+    assert import_group(group, options) == {"folder": str(tmp_path), "pulses": 3, "inserted": 0}
+
+    db = SQLiteDatabase(database, buffered=False)
+    try:
+        assert db.conn.execute("SELECT COUNT(*) FROM pulses").fetchone()[0] == 3
+    finally:
+        db.close()
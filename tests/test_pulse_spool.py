@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# test_pulse_spool.py - Replaying the local pulse spool
+# Author: Sanja
+
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo import errors
+
+from pulse_spool import PulseSpool
+
+
+class FakeDatabase:
+    """Stores pulses by _id; pulses marked 'bad' are refused the way `mode` says."""
+
+    def __init__(self, mode="bulk"):
+        self.mode   = mode
+        self.stored = {}
+
+    def insert_pulses(self, docs):
+        bad = [index for index, doc in enumerate(docs) if doc.get("bad")]
+        for index, doc in enumerate(docs):
+            if index not in bad and (self.mode == "bulk" or not bad):
+                self.stored[doc["_id"]] = doc
+        if bad and self.mode == "bulk":
+            raise errors.BulkWriteError({"writeErrors": [
+                {"index": index, "code": 121, "errmsg": "Document failed validation"} for index in bad
+            ]})
+        if bad:
+            raise errors.DocumentTooLarge("BSON document too large")
+        return len(docs)
+
+
+def pulse(minute, **extra):
+    return {"username": "sanja", "hostname": "HOST-A", "timestamp": datetime(2025, 3, 1, 9) + timedelta(minutes=minute),
+            "status": "Active", "active_time": 0, "inactive_time": 60, **extra}
+
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = PulseSpool(str(tmp_path / "spool.db"), batch_size=2)
+    yield spool
+    spool.close()
+
+
+@pytest.mark.parametrize("mode", ["bulk", "single"])
+def test_rejected_pulse_does_not_block_the_spool(spool, mode):
+    db = FakeDatabase(mode)
+    pulses = [pulse(0), pulse(1, bad=True), pulse(2), pulse(3), pulse(4)]
+    for doc in pulses:
+        spool.append(doc)
+
+    assert spool.drain(db) == 4
+    assert spool.pending() == 0
+    assert sorted(db.stored) == sorted(doc["_id"] for doc in pulses if not doc.get("bad"))
+
+    dead = spool.conn.execute("SELECT doc, error FROM dead_letters").fetchall()
+    assert len(dead) == 1 and str(pulses[1]["_id"]) in dead[0][0]
+    assert spool.drain_stats["rejected"] == 1
+
+
+def test_transient_failure_keeps_the_batch(spool):
+    class DownDatabase:
+        def insert_pulses(self, docs):
+            raise errors.AutoReconnect("connection refused")
+
+    spool.append(pulse(0))
+    assert spool.drain(DownDatabase()) == 0
+    assert spool.pending() == 1
+    assert not spool.conn.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+
+
+def test_concurrent_drains_replay_each_pulse_once(spool):
+    import threading
+    import time
+
+    class SlowDatabase(FakeDatabase):
+        # No duplicate check, like a time-series collection
+        def __init__(self):
+            super().__init__()
+            self.writes = []
+
+        def insert_pulses(self, docs):
+            time.sleep(0.05)
+            self.writes.extend(doc["_id"] for doc in docs)
+            return len(docs)
+
+    db = SlowDatabase()
+    for minute in range(6):
+        spool.append(pulse(minute))
+
+    threads = [threading.Thread(target=spool.drain, args=(db,)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(db.writes) == len(set(db.writes)) == 6
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# test_query_cache.py - LRU cache of the user GUI's search results
+# Author: Sanja
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "gui", "user_gui"))
+
+from query_cache import QueryCache, estimate_size  # noqa: E402
+
+MARKER = ("2025-03-10 09:00:00", "65f0a1b2c3d4e5f601234567")
+
+
+def rows(count, text="x"):
+    return [{"status": "Active", "note": text * 100} for _ in range(count)]
+
+
+def test_least_recently_used_entry_goes_first():
+    cache = QueryCache(max_entries=2)
+    cache.put("a", MARKER, rows(1))
+    cache.put("b", MARKER, rows(1))
+    assert cache.get("a", MARKER)     # "b" is now the oldest
+    cache.put("c", MARKER, rows(1))
+
+    assert cache.get("b", MARKER) is None
+    assert cache.get("a", MARKER) and cache.get("c", MARKER)
+    assert cache.stats["evictions"] == 1
+
+
+def test_eviction_keeps_the_bytes_under_the_limit():
+    entry = estimate_size(rows(5))
+    cache = QueryCache(max_entries=10, max_bytes=entry * 2 + entry // 2)
+    for key in "abc":
+        cache.put(key, MARKER, rows(5))
+
+    assert len(cache) == 2 and cache.total_bytes <= cache.max_bytes
+    assert cache.get("a", MARKER) is None
+    assert cache.get("b", MARKER) and cache.get("c", MARKER)
+
+
+def test_oversized_result_is_not_cached():
+    cache = QueryCache(max_bytes=estimate_size(rows(5)) * 2)
+    cache.put("small", MARKER, rows(5))
+    cache.put("huge", MARKER, rows(50))
+
+    assert cache.get("huge", MARKER) is None
+    assert cache.get("small", MARKER) == rows(5)
+
+
+def test_a_new_marker_makes_the_entry_stale():
+    cache = QueryCache()
+    cache.put("a", MARKER, rows(2))
+    newer = ("2025-03-10 09:05:00", "65f0a2deadbeef0123456789")
+
+    assert cache.get("a", newer) is None
+    assert cache.stats["stale"] == 1
+    # Dropped on the spot: the old marker no longer finds it either
+    assert cache.get("a", MARKER) is None
+    assert len(cache) == 0 and cache.total_bytes == 0
+
+
+def test_replacing_a_key_does_not_count_it_twice():
+    cache = QueryCache()
+    cache.put("a", MARKER, rows(2))
+    cache.put("a", MARKER, rows(3))
+
+    assert len(cache) == 1 and cache.get("a", MARKER) == rows(3)
+    cache.clear()
+    assert cache.total_bytes == 0
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# test_sqlite_backend.py - Buffered writes of the SQLite backend
+# Author: Sanja
+
+import sqlite3
+import time
+from datetime import datetime
+
+from sqlite_backend import SQLiteDatabase
+
+
+def stored_pulses(path):
+    # A second connection, since reading through the backend would flush first
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM pulses").fetchone()[0]
+
+
+def test_partial_batch_is_written_after_the_flush_interval(tmp_path):
+    path = str(tmp_path / "heartbeat.db")
+    db = SQLiteDatabase(path, buffered=True, batch_size=100, flush_interval=0.5)
+    try:
+        db.insert_pulse({"username": "sanja", "hostname": "HOST-A", "timestamp": datetime(2025, 3, 1, 9),
+                         "status": "Active", "active_time": 0, "inactive_time": 60})
+        assert stored_pulses(path) == 0
+
+        deadline = time.monotonic() + 5
+        while stored_pulses(path) == 0 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert stored_pulses(path) == 1
+    finally:
+        db.close()
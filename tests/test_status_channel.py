@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# test_status_channel.py - Reporter-to-monitor status events over loopback UDP
+# Author: Sanja
+
+import json
+import socket
+
+import pytest
+
+from status_channel import PORT_FILE_NAME, StatusListener, StatusPublisher, read_port_file
+
+
+@pytest.fixture
+def channel(tmp_path):
+    listener = StatusListener(str(tmp_path))
+    publisher = StatusPublisher(str(tmp_path))
+    yield listener, publisher
+    publisher.close()
+    listener.close()
+
+
+def send(listener, message):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.sendto(json.dumps(message).encode("utf-8"), ("127.0.0.1", listener.port))
+
+
+def test_publisher_finds_the_listener_through_the_port_file(tmp_path, channel):
+    listener, publisher = channel
+
+    assert read_port_file(str(tmp_path / PORT_FILE_NAME)) == (listener.port, listener.token)
+    assert publisher.publish("Inactive", timestamp=1741597200.5)
+    assert listener.receive(timeout=1) == ("Inactive", 1741597200.5)
+
+
+def test_publish_without_a_listener_reports_failure(tmp_path):
+    publisher = StatusPublisher(str(tmp_path))
+    try:
+        assert not publisher.publish("Active")
+    finally:
+        publisher.close()
+
+
+def test_datagrams_with_a_wrong_token_are_ignored(channel):
+    listener, _ = channel
+    send(listener, {"token": "not-the-token", "sender": "x", "seq": 1, "status": "Active", "timestamp": 1})
+    send(listener, {"token": listener.token, "sender": "x", "seq": 2, "status": "Inactive", "timestamp": 2})
+
+    assert listener.receive(timeout=1) == ("Inactive", 2.0)
+
+
+def test_duplicate_and_reordered_datagrams_are_dropped(channel):
+    listener, _ = channel
+    for seq, status in [(2, "Inactive"), (2, "Inactive"), (1, "Active"), (3, "Active")]:
+        send(listener, {"token": listener.token, "sender": "a", "seq": seq, "status": status, "timestamp": seq})
+
+    assert listener.receive(timeout=1) == ("Inactive", 2.0)
+    assert listener.receive(timeout=1) == ("Active", 3.0)
+    # A restarted reporter is a new sender and starts counting again
+    send(listener, {"token": listener.token, "sender": "b", "seq": 1, "status": "Inactive", "timestamp": 4})
+    assert listener.receive(timeout=1) == ("Inactive", 4.0)
+    assert listener.receive(timeout=0.05) is None
+
+
+def test_close_removes_only_its_own_port_file(tmp_path):
+    first = StatusListener(str(tmp_path))
+    second = StatusListener(str(tmp_path))    # a newer monitor took over the port file
+    first.close()
+    assert read_port_file(str(tmp_path / PORT_FILE_NAME)) == (second.port, second.token)
+
+    second.close()
+    assert not (tmp_path / PORT_FILE_NAME).exists()